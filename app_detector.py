@@ -3,9 +3,11 @@ Application detector module for SSDsaver.
 Detects installed browsers and applications that can benefit from RAM caching.
 """
 
+import hashlib
+import json
 import os
-import subprocess
-from pathlib import Path
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 
@@ -19,17 +21,25 @@ class AppInfo:
     default_size: str
     is_installed: bool
     icon_name: str = "application-x-executable"
+    is_custom: bool = False  # user-added folder (see write_discovery.py)
+
+# Write-back ignore rules (see sync_engine.Filter), relative to each cache path.
+# Chromium rebuilds its simple-cache index (index-dir/) from the entry files,
+# and LOCK and *.tmp files are recreated on start.
+CHROMIUM_EXCLUDE = ["index-dir/", "LOCK", "*.tmp", "*~"]
 
 class AppDetector:
     """Detects installed applications and their cache locations"""
     
-    # Application definitions
+    # Application definitions; "exclude"/"include" are the default ignore
+    # rules, which folders.conf can override per app
     APPS = {
         "chrome": {
             "display_name": "Google Chrome",
             "executables": ["google-chrome", "google-chrome-stable", "chrome"],
             "cache_paths": ["~/.cache/google-chrome/Default/Cache"],
             "default_size": "200M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "google-chrome"
         },
         "chromium": {
@@ -37,6 +47,7 @@ class AppDetector:
             "executables": ["chromium", "chromium-browser"],
             "cache_paths": ["~/.cache/chromium/Default/Cache"],
             "default_size": "200M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "chromium-browser"
         },
         "firefox": {
@@ -45,6 +56,7 @@ class AppDetector:
             # Broader pattern to catch .default, .default-release, .default-esr, etc.
             "cache_paths": ["~/.cache/mozilla/firefox/*.default*/cache2"],
             "default_size": "150M",
+            "exclude": ["doomed/", "index.log", "*.tmp", "*~"],
             "icon": "firefox"
         },
         "brave": {
@@ -56,13 +68,16 @@ class AppDetector:
                 "~/.cache/BraveSoftware/Brave-Browser/Default/Cache"
             ],
             "default_size": "200M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "brave-browser"
         },
         "edge": {
             "display_name": "Microsoft Edge",
             "executables": ["microsoft-edge", "microsoft-edge-stable"],
+            "processes": ["msedge"],  # binary name when it differs from the launcher
             "cache_paths": ["~/.config/microsoft-edge/Default/Cache"],
             "default_size": "200M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "microsoft-edge"
         },
         "opera": {
@@ -70,6 +85,7 @@ class AppDetector:
             "executables": ["opera"],
             "cache_paths": ["~/.cache/opera/Cache"],
             "default_size": "150M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "opera"
         },
         "vivaldi": {
@@ -77,6 +93,7 @@ class AppDetector:
             "executables": ["vivaldi"],
             "cache_paths": ["~/.cache/vivaldi/Default/Cache"],
             "default_size": "150M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "vivaldi"
         },
         "discord": {
@@ -84,6 +101,7 @@ class AppDetector:
             "executables": ["discord"],
             "cache_paths": ["~/.config/discord/Cache", "~/.config/discord/Code Cache"],
             "default_size": "100M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "discord"
         },
         "slack": {
@@ -91,6 +109,7 @@ class AppDetector:
             "executables": ["slack"],
             "cache_paths": ["~/.config/Slack/Cache", "~/.config/Slack/Code Cache"],
             "default_size": "100M",
+            "exclude": CHROMIUM_EXCLUDE,
             "icon": "slack"
         },
         "steam": {
@@ -98,6 +117,7 @@ class AppDetector:
             "executables": ["steam"],
             "cache_paths": ["~/.local/share/Steam/appcache"],
             "default_size": "300M",
+            "exclude": ["*.tmp", "*~"],
             "icon": "steam"
         },
         "apt": {
@@ -105,6 +125,7 @@ class AppDetector:
             "executables": ["apt", "apt-get"],
             "cache_paths": ["/var/cache/apt/archives"],
             "default_size": "500M",
+            "exclude": ["lock", "partial/"],
             "icon": "system-software-install"
         },
         "thumbnails": {
@@ -112,23 +133,105 @@ class AppDetector:
             "executables": ["true"],  # Always available
             "cache_paths": ["~/.cache/thumbnails"],
             "default_size": "100M",
+            "exclude": ["*.tmp", "fail/"],
             "icon": "image-x-generic"
         }
     }
     
+    CACHE_VERSION = 1
+    
+    _path_index: Optional[Dict[str, str]] = None  # executable name -> full path
+    _path_index_key: Optional[Dict] = None
+    _index_lock = threading.Lock()
+    
     @staticmethod
-    def is_executable_available(executable: str) -> bool:
+    def _path_dirs() -> List[str]:
+        """Directories of $PATH in order, without duplicates"""
+        path = os.environ.get("PATH") or os.defpath
+        return list(dict.fromkeys(d for d in path.split(os.pathsep) if d))
+    
+    @staticmethod
+    def _scan_path_dir(directory: str) -> List[str]:
+        try:
+            with os.scandir(directory) as it:
+                return [e.name for e in it]
+        except OSError:
+            return []
+    
+    @classmethod
+    def _index_key(cls) -> Dict:
+        """Identifies the PATH contents: directories and their mtimes.
+        Installing or removing a program changes its directory's mtime."""
+        mtimes = {}
+        for directory in cls._path_dirs():
+            try:
+                mtimes[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtimes[directory] = 0
+        return mtimes
+    
+    @classmethod
+    def get_path_index(cls) -> Dict[str, str]:
+        """Build (once per process) a name -> path index of every $PATH entry.
+        Directories are listed in parallel; earlier PATH entries win, as in which."""
+        with cls._index_lock:
+            key = cls._index_key()
+            if cls._path_index is None or cls._path_index_key != key:
+                dirs = list(key)
+                with ThreadPoolExecutor(max_workers=min(8, max(1, len(dirs)))) as pool:
+                    listings = list(pool.map(cls._scan_path_dir, dirs))
+                index = {}
+                for directory, names in zip(dirs, listings):
+                    for name in names:
+                        index.setdefault(name, os.path.join(directory, name))
+                cls._path_index = index
+                cls._path_index_key = key
+            return cls._path_index
+    
+    @classmethod
+    def is_executable_available(cls, executable: str) -> bool:
         """Check if an executable is available in PATH"""
+        path = cls.get_path_index().get(executable)
+        return path is not None and os.path.isfile(path) and os.access(path, os.X_OK)
+    
+    @staticmethod
+    def cache_file() -> str:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        return os.path.join(cache_home, "ssdsaver", "detected-apps.json")
+    
+    @classmethod
+    def _cache_key(cls) -> Dict:
+        """Detection results stay valid while PATH and the app list are unchanged"""
+        apps_hash = hashlib.sha1(json.dumps(cls.APPS, sort_keys=True).encode()).hexdigest()
+        return {"version": cls.CACHE_VERSION, "apps": apps_hash, "path": cls._index_key()}
+    
+    @classmethod
+    def _load_cached(cls, key: Dict) -> Optional[List[AppInfo]]:
+        try:
+            with open(cls.cache_file()) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("key") != key:
+            return None
+        
+        detected = []
+        for app_id, executable in data.get("apps", {}).items():
+            if app_id in cls.APPS:
+                detected.append(cls._make_app_info(app_id, cls.APPS[app_id], executable))
+        return detected
+    
+    @classmethod
+    def _save_cached(cls, key: Dict, detected: List[AppInfo]):
+        path = cls.cache_file()
         try:
-            result = subprocess.run(
-                ["which", executable],
-                capture_output=True,
-                text=True,
-                timeout=2
-            )
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            return False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"key": key, "apps": {a.name: a.executable for a in detected}}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not cache detected apps: {e}")
     
     @staticmethod
     def expand_cache_path(path: str) -> List[str]:
@@ -142,38 +245,46 @@ class AppDetector:
         
         return [expanded_path] if os.path.exists(expanded_path) else []
     
-    @classmethod
-    def detect_app(cls, app_id: str, app_def: Dict) -> Optional[AppInfo]:
-        """Detect if a specific application is installed"""
-        # Check if any of the executables are available
-        is_installed = any(
-            cls.is_executable_available(exe) 
-            for exe in app_def["executables"]
-        )
-        
-        if not is_installed:
-            return None
-        
-        # Find the first available executable
-        executable = next(
-            (exe for exe in app_def["executables"] 
-             if cls.is_executable_available(exe)),
-            app_def["executables"][0]
-        )
-        
+    @staticmethod
+    def _make_app_info(app_id: str, app_def: Dict, executable: str) -> AppInfo:
         return AppInfo(
             name=app_id,
             display_name=app_def["display_name"],
             executable=executable,
             cache_paths=app_def["cache_paths"],
             default_size=app_def["default_size"],
-            is_installed=is_installed,
+            is_installed=True,
             icon_name=app_def.get("icon", "application-x-executable")
         )
     
     @classmethod
-    def detect_all_apps(cls) -> List[AppInfo]:
-        """Detect all installed applications"""
+    def detect_app(cls, app_id: str, app_def: Dict) -> Optional[AppInfo]:
+        """Detect if a specific application is installed"""
+        # The first available executable, looked up once in the PATH index
+        executable = next(
+            (exe for exe in app_def["executables"]
+             if cls.is_executable_available(exe)),
+            None
+        )
+        
+        if executable is None:
+            return None
+        
+        return cls._make_app_info(app_id, app_def, executable)
+    
+    @classmethod
+    def detect_all_apps(cls, use_cache: bool = True) -> List[AppInfo]:
+        """Detect all installed applications.
+        
+        Results are cached in ~/.cache/ssdsaver and reused until a $PATH
+        directory changes, so repeat launches skip detection.
+        """
+        key = cls._cache_key()
+        if use_cache:
+            cached = cls._load_cached(key)
+            if cached is not None:
+                return cached
+        
         detected = []
         
         for app_id, app_def in cls.APPS.items():
@@ -181,8 +292,28 @@ class AppDetector:
             if app_info:
                 detected.append(app_info)
         
+        cls._save_cached(key, detected)
         return detected
     
+    @staticmethod
+    def get_custom_apps(configs: Dict[str, Dict]) -> List[AppInfo]:
+        """Build entries for custom folders saved in folders.conf"""
+        custom = []
+        for name, config in configs.items():
+            if config.get("custom", "false").lower() != "true":
+                continue
+            custom.append(AppInfo(
+                name=name,
+                display_name=config.get("display_name", name),
+                executable="",
+                cache_paths=[p for p in config.get("paths", "").split(";") if p],
+                default_size=config.get("size", "64M"),
+                is_installed=True,
+                icon_name="folder-symbolic",
+                is_custom=True
+            ))
+        return custom
+    
     @classmethod
     def get_app_info(cls, app_id: str) -> Optional[AppInfo]:
         """Get information about a specific application"""
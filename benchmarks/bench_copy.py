@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Copy backend benchmark for write-back and hydration.
+
+Builds two data sets in RAM, a few large, partly preallocated journal
+files and a browser-cache-like tree of small files, and copies each into
+an empty directory on the disk with rsync, cp, sync_engine limited to
+read/write through user space, and sync_engine with its in-kernel copy
+(fastcopy: reflink, copy_file_range or sendfile, holes skipped). Reports
+wall time including the final sync, throughput of file data, CPU time of
+this process and its children, and the space the copy allocates.
+
+Usage: python3 benchmarks/bench_copy.py --disk-dir /var/tmp [--journals 4] [--journal-mb 64] [--files 20000]
+"""
+
+import argparse
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+from bench_snapshot import build_tree, fs_type
+from fastcopy import FastCopy
+from sync_engine import Filter, SyncEngine
+
+MB = 1024 * 1024
+RSYNC = ["rsync", "-aAX", "--sparse", "--inplace", "--no-whole-file", "--delete-after"]
+
+
+def build_journals(root: str, count: int, size_mb: int, rng: random.Random):
+    """journald-like files: preallocated to full size, three quarters
+    written with compressible entries, the rest still a hole"""
+    os.makedirs(os.path.join(root, "journal"), exist_ok=True)
+    line = b"".join(rng.choice([b"systemd[1]: Started session. ", b"kernel: usb 1-1: new device ",
+                                b"sshd[812]: Accepted publickey ", b"NetworkManager: state change "])
+                    for _ in range(2048))
+    for i in range(count):
+        path = os.path.join(root, "journal", f"system@{i:04x}.journal")
+        with open(path, "wb") as f:
+            for _ in range(size_mb * 3 // 4 * MB // len(line)):
+                f.write(line)
+            f.truncate(size_mb * MB)
+
+
+def tree_bytes(root: str) -> Tuple[int, int]:
+    """Apparent size and allocated size of the files below root"""
+    size = allocated = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            st = os.lstat(os.path.join(directory, name))
+            size += st.st_size
+            allocated += st.st_blocks * 512
+    return size, allocated
+
+
+def cpu_seconds() -> float:
+    return sum(r.ru_utime + r.ru_stime for r in
+               (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+def engine_copy(methods: Tuple[str, ...]) -> Callable[[str, str], None]:
+    def copy(src: str, dst: str):
+        engine = SyncEngine(src, dst, Filter())
+        engine.copier = FastCopy(methods)
+        engine.sync(None)
+    return copy
+
+
+def backends() -> List[Tuple[str, Callable[[str, str], None]]]:
+    result = []
+    if shutil.which("rsync"):
+        result.append(("rsync", lambda src, dst: subprocess.run(RSYNC + [src + "/", dst + "/"], check=True)))
+    result.append(("cp --sparse=always", lambda src, dst: subprocess.run(
+        ["cp", "-rfup", "--sparse=always", src + "/", "-T", dst + "/"], check=True)))
+    result.append(("sync_engine, read/write", engine_copy(("read/write",))))
+    result.append(("sync_engine, fastcopy", engine_copy(("clone", "copy_file_range", "sendfile", "read/write"))))
+    return result
+
+
+def run(label: str, src: str, disk: str):
+    size, _ = tree_bytes(src)
+    print(f"{label}: {size / MB:.0f} MB")
+    print(f"{'':<28}{'time':>10}{'MB/s':>9}{'CPU s':>9}{'alloc MB':>10}")
+    for name, copy in backends():
+        dst = tempfile.mkdtemp(prefix="copy-", dir=disk)
+        try:
+            os.sync()
+            cpu = cpu_seconds()
+            started = time.perf_counter()
+            copy(src, dst)
+            os.sync()
+            seconds = time.perf_counter() - started
+            cpu = cpu_seconds() - cpu
+            _, allocated = tree_bytes(dst)
+            print(f"{name:<28}{seconds:>8.2f} s{size / MB / seconds:>9.0f}{cpu:>9.2f}{allocated / MB:>10.1f}")
+        finally:
+            shutil.rmtree(dst, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--disk-dir", default="/var/tmp", help="directory on the disk to measure")
+    parser.add_argument("--ram-dir", default="/dev/shm", help="tmpfs directory for the RAM side")
+    parser.add_argument("--journals", type=int, default=4)
+    parser.add_argument("--journal-mb", type=int, default=64)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if fs_type(args.disk_dir) in ("tmpfs", "ramfs", "zram"):
+        print(f"Warning: {args.disk_dir} is in RAM; pick a directory on the SSD with --disk-dir")
+    rng = random.Random(args.seed)
+    ram = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.ram_dir)
+    disk = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.disk_dir)
+    try:
+        print(f"RAM side {(fs_type(args.ram_dir).split() or ['?'])[-1]}, "
+              f"disk side {(fs_type(args.disk_dir).split() or ['?'])[-1]}")
+        journals = os.path.join(ram, "journals")
+        build_journals(journals, args.journals, args.journal_mb, rng)
+        run(f"{args.journals} journal files", journals, disk)
+        shutil.rmtree(journals)
+
+        cache = os.path.join(ram, "cache")
+        build_tree(cache, args.files, rng)
+        run(f"{args.files} cache files", cache, disk)
+    finally:
+        shutil.rmtree(ram, ignore_errors=True)
+        shutil.rmtree(disk, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Durability benchmark for write-back.
+
+Writes a browser-cache-like tree of small files and a few large journal
+files from RAM to an empty disk directory with each durability mode of
+sync_engine (none, syncfs, fsync), then rewrites a share of the files and
+writes back again. Reports the total time, the part spent flushing and
+the number of flush calls, i.e. what each mode adds to a write-back (and
+so to shutdown).
+
+Usage: python3 benchmarks/bench_durability.py --disk-dir /var/tmp [--files 5000] [--change 10]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+from bench_copy import build_journals
+from bench_snapshot import build_tree, change_tree, fs_type
+from sync_engine import DURABILITY_MODES, Filter, SyncEngine
+
+
+def write_back(ram: str, disk: str, durability: str) -> str:
+    stats = SyncEngine(ram, disk, Filter(), durability=durability).sync(None)
+    flushed = (f"{stats.flush_seconds:>8.2f} s{stats.flushes:>8}" if durability != "none"
+               else f"{'-':>10}{'-':>8}")
+    return f"{stats.seconds:>8.2f} s{flushed}{stats.copied:>9}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--disk-dir", default="/var/tmp", help="directory on the disk to measure")
+    parser.add_argument("--ram-dir", default="/dev/shm", help="tmpfs directory for the RAM side")
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--journals", type=int, default=2)
+    parser.add_argument("--journal-mb", type=int, default=32)
+    parser.add_argument("--change", type=float, default=10, help="percent of files rewritten")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if fs_type(args.disk_dir) in ("tmpfs", "ramfs", "zram"):
+        print(f"Warning: {args.disk_dir} is in RAM; pick a directory on the SSD with --disk-dir")
+    rng = random.Random(args.seed)
+    ram = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.ram_dir)
+    disk = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.disk_dir)
+    try:
+        build_tree(ram, args.files, rng)
+        build_journals(ram, args.journals, args.journal_mb, rng)
+        print(f"{args.files} cache files and {args.journals} x {args.journal_mb} MB journals")
+        print(f"{'':<24}{'total':>10}{'flushing':>10}{'calls':>8}{'copied':>9}")
+        for durability in DURABILITY_MODES:
+            target = os.path.join(disk, durability)
+            os.mkdir(target)
+            os.sync()
+            print(f"{durability + ', first write':<24}{write_back(ram, target, durability)}")
+        change_tree(ram, args.files, args.change, rng)
+        for durability in DURABILITY_MODES:
+            target = os.path.join(disk, durability)
+            os.sync()
+            label = f"{durability}, {args.change:g}% changed"
+            print(f"{label:<24}{write_back(ram, target, durability)}")
+    finally:
+        shutil.rmtree(ram, ignore_errors=True)
+        shutil.rmtree(disk, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
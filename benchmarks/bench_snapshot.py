@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Snapshot benchmark for archive mode.
+
+Builds a browser-cache-like tree of small files in RAM and persists it to
+a disk directory twice, as the rsync mirror log2ram uses by default and as
+a single compressed snapshot: once initially and once after rewriting a
+share of the files. Reports bytes written (this process and its children,
+and the disk's own sector counter) and then times hydration of each copy
+back into RAM. Run it as root so the page cache can be dropped before
+hydrating; otherwise hydration reads are warm.
+
+Usage: python3 benchmarks/bench_snapshot.py --disk-dir /var/tmp [--files 20000] [--change 10]
+"""
+
+import argparse
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Tuple
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+from disk_stats import DiskStats
+from snapshot import Snapshot
+from sync_engine import Filter, SyncEngine
+
+MB = 1024 * 1024
+RSYNC = ["rsync", "-aAX", "--sparse", "--inplace", "--no-whole-file", "--delete-after"]
+
+
+def fill_file(path: str, rng: random.Random):
+    """2-64 KB, half of the files compressible text, half random (images)"""
+    size = rng.randint(2, 64) * 1024
+    if rng.random() < 0.5:
+        words = [b"cache", b"entry", b"https://example.org/", b"max-age=3600", b"etag"]
+        data = b" ".join(rng.choice(words) for _ in range(size // 6))[:size]
+    else:
+        data = rng.randbytes(size)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build_tree(root: str, files: int, rng: random.Random):
+    for i in range(files):
+        directory = os.path.join(root, "Cache", f"{i % 256:02x}")
+        os.makedirs(directory, exist_ok=True)
+        fill_file(os.path.join(directory, f"f_{i:06x}"), rng)
+
+
+def change_tree(root: str, files: int, percent: float, rng: random.Random):
+    for i in rng.sample(range(files), int(files * percent / 100)):
+        fill_file(os.path.join(root, "Cache", f"{i % 256:02x}", f"f_{i:06x}"), rng)
+
+
+def device_of(path: str) -> Optional[str]:
+    """Physical disk holding path, for its sectors-written counter"""
+    dev = os.stat(path).st_dev
+    sys_path = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    if not os.path.exists(sys_path):
+        return None
+    return DiskStats.find_disk(os.path.basename(os.path.realpath(sys_path)))
+
+
+def fs_type(path: str) -> str:
+    try:
+        return subprocess.run(["findmnt", "-n", "-o", "FSTYPE", "--target", path],
+                              capture_output=True, text=True).stdout.strip()
+    except FileNotFoundError:
+        return ""
+
+
+def written(fn, disk: Optional[str]) -> Tuple[float, int, Optional[int]]:
+    """Seconds, bytes written by this process and its children, and the
+    disk's sector delta (after syncing everything out)"""
+    def oublock() -> int:
+        return sum(resource.getrusage(who).ru_oublock
+                   for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+    os.sync()
+    sectors = DiskStats.read_sectors_written(disk) if disk else None
+    blocks = oublock()
+    started = time.perf_counter()
+    fn()
+    os.sync()
+    seconds = time.perf_counter() - started
+    io_bytes = (oublock() - blocks) * 512
+    if sectors is not None:
+        after = DiskStats.read_sectors_written(disk)
+        sectors = (after - sectors) * 512 if after is not None else None
+    return seconds, io_bytes, sectors
+
+
+def mirror(src: str, dst: str):
+    if shutil.which("rsync"):
+        subprocess.run(RSYNC + [src + "/", dst + "/"], check=True)
+    else:
+        SyncEngine(src, dst, Filter()).sync(None)
+
+
+def drop_caches() -> bool:
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3")
+        return True
+    except OSError:
+        return False
+
+
+def hydrate(fn, target: str) -> float:
+    shutil.rmtree(target, ignore_errors=True)
+    os.mkdir(target)
+    os.sync()
+    drop_caches()
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def report(label: str, result: Tuple[float, int, Optional[int]]):
+    seconds, io_bytes, sectors = result
+    disk = f"{sectors / MB:>10.1f}" if sectors is not None else f"{'n/a':>10}"
+    print(f"{label:<34}{seconds:>8.2f} s{io_bytes / MB:>12.1f}{disk}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--disk-dir", default="/var/tmp", help="directory on the disk to measure")
+    parser.add_argument("--ram-dir", default="/dev/shm", help="tmpfs directory for the RAM side")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--change", type=float, default=10, help="percent of files rewritten")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if fs_type(args.disk_dir) in ("tmpfs", "ramfs", "zram"):
+        print(f"Warning: {args.disk_dir} is in RAM; pick a directory on the SSD with --disk-dir")
+    rng = random.Random(args.seed)
+    ram = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.ram_dir)
+    disk = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.disk_dir)
+    device = device_of(disk)
+    mirror_dir = os.path.join(disk, "mirror")
+    archive_dir = os.path.join(disk, "archive")
+    os.mkdir(mirror_dir)
+    os.mkdir(archive_dir)
+    try:
+        build_tree(ram, args.files, rng)
+        snapshot = Snapshot(archive_dir)
+        print(f"{args.files} files, disk {device or 'unknown'}, "
+              f"mirror via {'rsync' if shutil.which('rsync') else 'sync_engine'}")
+        print(f"{'':<34}{'time':>10}{'I/O MB':>12}{'disk MB':>10}")
+        report("mirror, first write", written(lambda: mirror(ram, mirror_dir), device))
+        report("snapshot, first write", written(lambda: snapshot.write(ram), device))
+        change_tree(ram, args.files, args.change, rng)
+        report(f"mirror, {args.change:g}% changed", written(lambda: mirror(ram, mirror_dir), device))
+        report(f"snapshot, {args.change:g}% changed", written(lambda: snapshot.write(ram), device))
+        print(f"snapshot size {os.path.getsize(snapshot.path) / MB:.1f} MB, "
+              f"mirror {sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(mirror_dir) for f in fs) / MB:.1f} MB")
+
+        target = os.path.join(ram, "..", os.path.basename(ram) + ".hydrate")
+        cold = "cold" if drop_caches() else "warm cache (not root)"
+        print(f"hydration ({cold}):")
+        print(f"{'  mirror':<34}{hydrate(lambda: mirror(mirror_dir, target), target):>8.2f} s")
+        print(f"{'  snapshot':<34}{hydrate(lambda: snapshot.restore(target), target):>8.2f} s")
+        shutil.rmtree(target, ignore_errors=True)
+    finally:
+        shutil.rmtree(ram, ignore_errors=True)
+        shutil.rmtree(disk, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
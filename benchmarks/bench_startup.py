@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for application detection.
+
+Compares the old detection (one `which` subprocess per executable, twice
+for the executable that is found) against the PATH index with a cold and a
+warm detection cache. When a display is available it also launches the
+GUI with SSDSAVER_STARTUP_TIMING=exit and reports time-to-first-frame;
+run it from an older checkout to compare releases.
+
+Usage: python3 benchmarks/bench_startup.py [--runs 5] [--no-gui]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+from app_detector import AppDetector
+
+
+def which(executable: str) -> bool:
+    try:
+        return subprocess.run(["which", executable], capture_output=True, timeout=2).returncode == 0
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+
+
+def detect_with_which():
+    """The previous implementation: any() then next() over `which` calls"""
+    detected = []
+    for app_id, app_def in AppDetector.APPS.items():
+        if not any(which(exe) for exe in app_def["executables"]):
+            continue
+        executable = next((exe for exe in app_def["executables"] if which(exe)),
+                          app_def["executables"][0])
+        detected.append((app_id, executable))
+    return detected
+
+
+def detect_cold():
+    AppDetector._path_index = None  # new process: no index yet
+    return AppDetector.detect_all_apps(use_cache=False)
+
+
+def detect_warm():
+    AppDetector._path_index = None
+    return AppDetector.detect_all_apps()
+
+
+def measure(fn, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def first_frame_ms(runs: int):
+    """Median time-to-first-frame of main.py, or None without a display"""
+    if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return None
+    env = dict(os.environ, SSDSAVER_STARTUP_TIMING="exit")
+    times = []
+    for _ in range(runs):
+        try:
+            out = subprocess.run([sys.executable, os.path.join(REPO, "main.py")], env=env,
+                                 capture_output=True, text=True, timeout=60).stdout
+        except subprocess.TimeoutExpired:
+            return None
+        match = re.search(r"first frame after ([\d.]+) ms", out)
+        if not match:
+            return None
+        times.append(float(match.group(1)))
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-gui", action="store_true", help="skip the time-to-first-frame runs")
+    args = parser.parse_args()
+
+    # Keep the real detection cache untouched
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="ssdsaver-bench-")
+    forks = sum(len(d["executables"]) for d in AppDetector.APPS.values())
+
+    print(f"{len(AppDetector.APPS)} apps, {forks}+ `which` calls in the old detection")
+    print(f"{'which subprocesses':<28}{measure(detect_with_which, args.runs):>10.1f} ms")
+    print(f"{'PATH index, cold cache':<28}{measure(detect_cold, args.runs):>10.1f} ms")
+    detect_cold()  # populate the cache
+    print(f"{'PATH index, warm cache':<28}{measure(detect_warm, args.runs):>10.1f} ms")
+
+    if not args.no_gui:
+        frame = first_frame_ms(args.runs)
+        if frame is None:
+            print("time-to-first-frame: skipped (no display or GTK)")
+        else:
+            print(f"{'time-to-first-frame':<28}{frame:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tail sync benchmark for log folders.
+
+Builds a few large log files in RAM, writes them to an empty disk
+directory, appends a little to each and then measures bringing the disk
+copy up to date with rsync, cp -u, sync_engine comparing blocks and
+sync_engine with its tail index (copying only the appended bytes).
+Reports wall time including the final sync, CPU time of this process and
+its children, and for sync_engine the bytes it wrote.
+
+Usage: python3 benchmarks/bench_tail.py --disk-dir /var/tmp [--logs 4] [--log-mb 128] [--append-kb 256]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List, Optional, Tuple
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+from bench_copy import cpu_seconds
+from bench_snapshot import fs_type
+from sync_engine import Filter, SyncEngine, TailIndex
+
+MB = 1024 * 1024
+RSYNC = ["rsync", "-aAX", "--sparse", "--inplace", "--no-whole-file", "--delete-after"]
+LINES = [b"systemd[1]: Started session %d of user alice.\n", b"kernel: usb 1-1: new device number %d\n",
+         b"sshd[812]: Accepted publickey for alice port %d\n", b"CRON[%d]: (root) CMD (run-parts)\n"]
+
+
+def append_lines(path: str, nbytes: int, rng: random.Random):
+    chunk = []
+    size = 0
+    while size < nbytes:
+        line = rng.choice(LINES) % rng.randint(1, 99999)
+        chunk.append(line)
+        size += len(line)
+    with open(path, "ab") as f:
+        f.write(b"".join(chunk))
+
+
+def engine(index_dir: Optional[str]) -> Callable[[str, str], Optional[int]]:
+    def sync(src: str, dst: str) -> Optional[int]:
+        tails = TailIndex(src, index_dir) if index_dir else None
+        return SyncEngine(src, dst, Filter(), tails=tails).sync(None).bytes_written
+    return sync
+
+
+def command(argv: List[str]) -> Callable[[str, str], Optional[int]]:
+    def sync(src: str, dst: str) -> Optional[int]:
+        subprocess.run(argv + [src + "/", dst + "/"], check=True)
+        return None  # not measured
+    return sync
+
+
+def backends(index_dir: str) -> List[Tuple[str, Callable[[str, str], Optional[int]]]]:
+    result = []
+    if shutil.which("rsync"):
+        result.append(("rsync --no-whole-file", command(RSYNC)))
+    result.append(("cp -u", command(["cp", "-rfupT"])))
+    result.append(("sync_engine, block compare", engine(None)))
+    result.append(("sync_engine, tail index", engine(index_dir)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--disk-dir", default="/var/tmp", help="directory on the disk to measure")
+    parser.add_argument("--ram-dir", default="/dev/shm", help="tmpfs directory for the RAM side")
+    parser.add_argument("--logs", type=int, default=4)
+    parser.add_argument("--log-mb", type=int, default=128)
+    parser.add_argument("--append-kb", type=int, default=256, help="appended to each log between syncs")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if fs_type(args.disk_dir) in ("tmpfs", "ramfs", "zram"):
+        print(f"Warning: {args.disk_dir} is in RAM; pick a directory on the SSD with --disk-dir")
+    rng = random.Random(args.seed)
+    ram = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.ram_dir)
+    disk = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.disk_dir)
+    index_dir = tempfile.mkdtemp(prefix="ssdsaver-bench-", dir=args.ram_dir)
+    try:
+        logs = os.path.join(ram, "log")
+        os.mkdir(logs)
+        for i in range(args.logs):
+            append_lines(os.path.join(logs, f"syslog{i}"), args.log_mb * MB, rng)
+        print(f"{args.logs} x {args.log_mb} MB logs, {args.append_kb} KB appended to each")
+        print(f"{'':<30}{'time':>10}{'CPU s':>9}{'written MB':>12}")
+        for name, sync in backends(index_dir):
+            dst = tempfile.mkdtemp(prefix="tail-", dir=disk)
+            try:
+                sync(logs, dst)  # the previous write-back; builds the tail index
+                for i in range(args.logs):
+                    append_lines(os.path.join(logs, f"syslog{i}"), args.append_kb * 1024, rng)
+                os.sync()
+                cpu = cpu_seconds()
+                started = time.perf_counter()
+                written = sync(logs, dst)
+                os.sync()
+                seconds = time.perf_counter() - started
+                cpu = cpu_seconds() - cpu
+                written = f"{written / MB:>12.2f}" if written is not None else f"{'-':>12}"
+                print(f"{name:<30}{seconds:>8.3f} s{cpu:>9.3f}{written}")
+            finally:
+                shutil.rmtree(dst, ignore_errors=True)
+    finally:
+        shutil.rmtree(ram, ignore_errors=True)
+        shutil.rmtree(disk, ignore_errors=True)
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
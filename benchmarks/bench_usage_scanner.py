@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the in-process usage scanner.
+
+Builds synthetic cache trees (Chromium-like: many small files spread over a
+few levels of directories) and compares `du -sk` against UsageScanner for a
+cold scan, a warm scan with no changes, and a warm scan after 1% of the
+directories have gained a file.
+
+Usage: python3 benchmarks/bench_usage_scanner.py [--sizes 10000,100000,1000000]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from usage_scanner import UsageScanner
+
+FILES_PER_DIR = 100
+DIRS_PER_LEVEL = 32
+
+
+def build_tree(root: str, n_files: int):
+    """Create n_files small files under root, returning the leaf directories"""
+    leaves = []
+    n_dirs = max(1, n_files // FILES_PER_DIR)
+    for d in range(n_dirs):
+        leaf = os.path.join(root, f"{d // DIRS_PER_LEVEL:04x}", f"{d % DIRS_PER_LEVEL:02x}")
+        os.makedirs(leaf, exist_ok=True)
+        leaves.append(leaf)
+        for f in range(FILES_PER_DIR):
+            fd = os.open(os.path.join(leaf, f"f_{f:03d}"), os.O_WRONLY | os.O_CREAT, 0o644)
+            os.write(fd, b"x" * 64)
+            os.close(fd)
+    return leaves
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def du_kb(path: str) -> int:
+    return int(subprocess.check_output(["du", "-sk", path]).split()[0])
+
+
+def run(n_files: int, base_dir: str):
+    root = tempfile.mkdtemp(prefix=f"ssdsaver-bench-{n_files}-", dir=base_dir)
+    try:
+        leaves = build_tree(root, n_files)
+        # Warm the dentry/inode caches so both tools see the same state
+        du_kb(root)
+
+        du_ms, kb = timed(lambda: du_kb(root))
+        scanner = UsageScanner()
+        cold_ms, usage = timed(lambda: scanner.scan(root))
+        warm_ms, _ = timed(lambda: scanner.scan(root))
+
+        for leaf in leaves[::100]:
+            open(os.path.join(leaf, "new_entry"), "w").close()
+        changed_ms, _ = timed(lambda: scanner.scan(root))
+
+        print(f"{n_files:>9} files | du -sk {du_ms:9.1f} ms | cold {cold_ms:9.1f} ms | "
+              f"warm {warm_ms:8.1f} ms | 1% changed {changed_ms:8.1f} ms | "
+              f"du {kb} KiB vs scanner {usage.bytes // 1024} KiB")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma-separated file counts (default: %(default)s)")
+    parser.add_argument("--dir", default=None, help="directory to build the trees in")
+    args = parser.parse_args()
+
+    for size in args.sizes.split(","):
+        run(int(size), args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Checkpoint module for SSDsaver.
+Commits a manifest of each folder's disk copy after log2ram writes it back,
+and after an unclean shutdown checks the disk copies against their last
+manifest and reports what was lost.
+"""
+
+import argparse
+import json
+import os
+import stat
+import sys
+import time
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastcopy import syncfs
+from snapshot import SNAPSHOT_NAME
+from sync_engine import hdd_path, read_path_modes
+
+STATE_DIR = "/var/lib/ssdsaver"
+CHECKPOINT_DIR = os.path.join(STATE_DIR, "checkpoints")
+RUNNING_MARKER = os.path.join(STATE_DIR, "running")
+RECOVERY_REPORT = os.path.join(STATE_DIR, "recovery.json")
+READ_SIZE = 1024 * 1024
+
+
+def write_atomic(path: str, data: bytes, keep_previous: bool = False):
+    """Replace path with data through a fsynced temporary file. With
+    keep_previous the old version is kept as path.prev."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    if keep_previous and os.path.exists(path):
+        os.replace(path, path + ".prev")
+    os.replace(tmp, path)
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def file_crc(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                return crc
+            crc = zlib.crc32(block, crc)
+
+
+def walk_files(root: str):
+    """(relative path, stat) of every regular file below root"""
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel) if rel else root) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            child = f"{rel}/{entry.name}" if rel else entry.name
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                stack.append(child)
+            elif stat.S_ISREG(st.st_mode) and child != SNAPSHOT_NAME + ".tmp":
+                yield child, st
+
+
+@dataclass
+class Manifest:
+    """Size, mtime and CRC32 of every file in a folder's disk copy at the
+    last checkpoint"""
+    ram: str
+    created: float = 0.0
+    files: Dict[str, Tuple[int, int, int]] = field(default_factory=dict)
+
+    @staticmethod
+    def path_for(ram: str, checkpoint_dir: str = CHECKPOINT_DIR) -> str:
+        return os.path.join(checkpoint_dir, quote(ram.rstrip("/") or "/", safe="") + ".json")
+
+    @staticmethod
+    def _checksum(created: float, files: Dict) -> int:
+        return zlib.crc32(json.dumps([created, files], sort_keys=True).encode())
+
+    @classmethod
+    def load(cls, ram: str, checkpoint_dir: str = CHECKPOINT_DIR) -> Optional["Manifest"]:
+        """The newest valid manifest: the current one, or the previous one
+        if a crash hit between the two renames or it fails its checksum"""
+        path = cls.path_for(ram, checkpoint_dir)
+        for candidate in (path, path + ".prev"):
+            try:
+                with open(candidate) as f:
+                    data = json.load(f)
+                created, files = data["created"], data["files"]
+                if data["checksum"] != cls._checksum(created, files):
+                    continue
+                return cls(ram, created, {k: tuple(v) for k, v in files.items()})
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+        return None
+
+    def save(self, checkpoint_dir: str = CHECKPOINT_DIR):
+        files = {k: list(v) for k, v in self.files.items()}
+        data = {"ram": self.ram, "created": self.created, "files": files,
+                "checksum": self._checksum(self.created, files)}
+        write_atomic(self.path_for(self.ram, checkpoint_dir), json.dumps(data).encode(),
+                     keep_previous=True)
+
+
+@dataclass
+class CheckpointStats:
+    """What committing a checkpoint did"""
+    files: int = 0
+    hashed: int = 0            # files whose CRC had to be computed
+    bytes_hashed: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (f"checkpoint: {self.files} files, {self.hashed} hashed "
+                f"({self.bytes_hashed / (1024 * 1024):.1f} MB), {self.seconds:.2f} s")
+
+
+def commit(ram: str, hdd: str, checkpoint_dir: str = CHECKPOINT_DIR,
+           flush: bool = True) -> CheckpointStats:
+    """Flush hdd (just written back from ram) and record it as the folder's
+    newest checkpoint. Only files whose size or mtime changed since the
+    previous checkpoint are read again. Without flush (durability none)
+    the checkpoint may describe data that is not on the disk yet."""
+    started = time.monotonic()
+    stats = CheckpointStats()
+    if flush:
+        syncfs(hdd)
+    previous = Manifest.load(ram, checkpoint_dir)
+    old_files = previous.files if previous else {}
+    manifest = Manifest(ram, time.time())
+    for rel, st in walk_files(hdd):
+        old = old_files.get(rel)
+        if old is not None and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+            crc = old[2]
+        else:
+            try:
+                crc = file_crc(os.path.join(hdd, rel))
+            except OSError:
+                continue
+            stats.hashed += 1
+            stats.bytes_hashed += st.st_size
+        manifest.files[rel] = (st.st_size, st.st_mtime_ns, crc)
+    stats.files = len(manifest.files)
+    manifest.save(checkpoint_dir)
+    stats.seconds = time.monotonic() - started
+    return stats
+
+
+@dataclass
+class RecoveryResult:
+    """State of one folder's disk copy compared with its last checkpoint"""
+    ram: str
+    checkpoint: Optional[float] = None   # time of the checkpoint, None if there is none
+    verified: int = 0
+    changed: List[str] = field(default_factory=list)   # written after the checkpoint, maybe partially
+    corrupt: List[str] = field(default_factory=list)   # same size and mtime, other content
+    missing: List[str] = field(default_factory=list)
+    added: List[str] = field(default_factory=list)     # not in the checkpoint
+    removed: List[str] = field(default_factory=list)   # unfinished archive writes
+
+    def summary(self) -> str:
+        if self.checkpoint is None:
+            return f"{self.ram}: no checkpoint, changes since the last write-back are lost"
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.checkpoint))
+        result = (f"{self.ram}: changes after the checkpoint of {when} are lost; "
+                  f"{self.verified} files verified")
+        for label, names in (("written after it (may be partial)", self.changed),
+                             ("corrupt", self.corrupt), ("missing", self.missing),
+                             ("not in it", self.added)):
+            if names:
+                shown = ", ".join(names[:5]) + (", ..." if len(names) > 5 else "")
+                result += f"; {len(names)} {label}: {shown}"
+        return result
+
+
+def recover(ram: str, disk: str, checkpoint_dir: str = CHECKPOINT_DIR) -> RecoveryResult:
+    """Check a folder's disk copy (at `disk`) against its last checkpoint
+    and drop unfinished archive writes, so the last complete archive is
+    restored"""
+    result = RecoveryResult(ram)
+    tmp = os.path.join(disk, SNAPSHOT_NAME + ".tmp")
+    if os.path.exists(tmp):
+        os.unlink(tmp)
+        result.removed.append(SNAPSHOT_NAME + ".tmp")
+
+    manifest = Manifest.load(ram, checkpoint_dir)
+    if manifest is None:
+        return result
+    result.checkpoint = manifest.created
+    seen = set()
+    for rel, st in walk_files(disk):
+        seen.add(rel)
+        expected = manifest.files.get(rel)
+        if expected is None:
+            result.added.append(rel)
+        elif expected[0] != st.st_size or expected[1] != st.st_mtime_ns:
+            result.changed.append(rel)
+        else:
+            try:
+                crc = file_crc(os.path.join(disk, rel))
+            except OSError:
+                crc = None
+            if crc == expected[2]:
+                result.verified += 1
+            else:
+                result.corrupt.append(rel)
+    result.missing = sorted(set(manifest.files) - seen)
+    for names in (result.changed, result.corrupt, result.added):
+        names.sort()
+    return result
+
+
+def recover_all(paths: List[str], checkpoint_dir: str = CHECKPOINT_DIR,
+                report_path: str = RECOVERY_REPORT) -> List[RecoveryResult]:
+    """Recover every folder and save the report as JSON. A folder that is
+    not mounted yet (log2ram runs this before start) is its own disk copy."""
+    results = []
+    for ram in paths:
+        disk = hdd_path(ram) if os.path.ismount(ram) else ram
+        if os.path.isdir(disk):
+            results.append(recover(ram, disk, checkpoint_dir))
+    report = {"time": time.time(), "paths": [asdict(r) for r in results]}
+    try:
+        write_atomic(report_path, json.dumps(report, indent=1).encode())
+    except OSError as e:
+        print(f"checkpoint: cannot save {report_path}: {e}", file=sys.stderr)
+    return results
+
+
+def main():
+    """checkpoint.py {commit RAM [HDD] | recover [RAM...] | status}"""
+    parser = argparse.ArgumentParser(description="Checkpoints and crash recovery for log2ram folders")
+    sub = parser.add_subparsers(dest="command", required=True)
+    commit_parser = sub.add_parser("commit", help="record a folder's disk copy after a write-back")
+    commit_parser.add_argument("ram")
+    commit_parser.add_argument("hdd", nargs="?")
+    commit_parser.add_argument("--no-flush", action="store_true", help="don't syncfs the disk copy first")
+    recover_parser = sub.add_parser("recover", help="check disk copies after an unclean shutdown")
+    recover_parser.add_argument("paths", nargs="*", help="default: all PATH_DISK folders except lossy ones")
+    sub.add_parser("status", help="show the last checkpoint of every folder")
+    args = parser.parse_args()
+
+    if args.command == "commit":
+        hdd = args.hdd or hdd_path(args.ram)
+        try:
+            stats = commit(args.ram, hdd, flush=not args.no_flush)
+        except OSError as e:
+            print(f"ERROR: checkpoint {args.ram}: {e}", file=sys.stderr)
+            return 1
+        print(f"checkpoint {args.ram}: {stats.summary()}")
+        return 0
+
+    paths = [p for p, mode in read_path_modes().items() if mode != "lossy"]
+    if args.command == "recover":
+        for result in recover_all(args.paths or paths):
+            print(result.summary())
+        return 0
+
+    for ram in paths:
+        manifest = Manifest.load(ram)
+        if manifest is None:
+            print(f"{ram}: no checkpoint")
+        else:
+            age = (time.time() - manifest.created) / 60
+            print(f"{ram}: {len(manifest.files)} files, checkpoint {age:.0f} min ago")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
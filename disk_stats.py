@@ -0,0 +1,354 @@
+"""
+Disk statistics module for SSDsaver.
+Measures how much is written to the SSD holding the root filesystem, keeps
+hourly and daily totals in a small persisted store, and compares write
+rates before and after an app was moved to RAM.
+"""
+
+import ctypes
+import fcntl
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from mount_table import MountTable
+
+SECTOR_BYTES = 512  # /proc/diskstats always counts 512-byte sectors
+
+
+@dataclass
+class WriteRate:
+    """Average bytes written per hour over the hours that have samples"""
+    hours: int = 0
+    bytes_per_hour: float = 0.0
+
+    @property
+    def mb_per_hour(self) -> float:
+        return self.bytes_per_hour / (1024 * 1024)
+
+
+class DiskStats:
+    """Write accounting for the root SSD.
+
+    The store is a fixed-size memory-mapped file with direct-mapped hourly
+    (60 days) and daily (400 days) slots of sectors written. `sample()` is
+    run hourly by ssdsaver-diskstats.timer as root; the GUI opens the store
+    read-only.
+    """
+
+    STORE_PATH = "/var/lib/ssdsaver/diskstats.bin"
+    MAGIC = b"SSDDISK1"
+    HOURS = 60 * 24
+    DAYS = 400
+
+    _HEADER = struct.Struct("=8sI32s36sQd")  # magic, version, device, boot id, last sectors, last time
+    _HEADER_SIZE = 128
+    _RECORD = struct.Struct("=QQ")           # slot number (hour/day since epoch), sectors
+
+    # NVMe admin "Get Log Page" for the SMART / health log
+    NVME_IOCTL_ADMIN_CMD = 0xC0484E41
+    _NVME_CMD = struct.Struct("=BBHIIIQQII6III")
+
+    def __init__(self, store_path: str = None, readonly: bool = True):
+        self.store_path = store_path or self.STORE_PATH
+        self.readonly = readonly
+        self._mmap = None
+
+    # --- Device discovery -------------------------------------------------
+
+    @staticmethod
+    def find_root_partition() -> Optional[str]:
+        """Block device name (e.g. nvme0n1p2) holding the root filesystem"""
+        table = MountTable()
+        try:
+            entry = table.get_mount("/")
+        finally:
+            table.close()
+        if entry is not None and entry.source.startswith("/dev/"):
+            name = os.path.basename(os.path.realpath(entry.source))
+            if os.path.exists(f"/sys/class/block/{name}"):
+                return name
+
+        dev = os.stat("/").st_dev
+        sys_path = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        if os.path.exists(sys_path):
+            return os.path.basename(os.path.realpath(sys_path))
+        return None
+
+    @staticmethod
+    def find_disk(partition: str) -> str:
+        """Resolve a partition or device-mapper volume to its physical disk"""
+        sys_path = os.path.realpath(f"/sys/class/block/{partition}")
+
+        slaves = os.path.join(sys_path, "slaves")
+        if os.path.isdir(slaves) and os.listdir(slaves):
+            # LVM / LUKS: follow the first underlying device
+            return DiskStats.find_disk(sorted(os.listdir(slaves))[0])
+
+        if os.path.exists(os.path.join(sys_path, "partition")):
+            return os.path.basename(os.path.dirname(sys_path))
+        return os.path.basename(sys_path)
+
+    @staticmethod
+    def read_sectors_written(disk: str) -> Optional[int]:
+        """Sectors written since boot, from sysfs or /proc/diskstats"""
+        try:
+            with open(f"/sys/block/{disk}/stat") as f:
+                return int(f.read().split()[6])
+        except (OSError, IndexError, ValueError):
+            pass
+
+        try:
+            with open("/proc/diskstats") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) > 9 and fields[2] == disk:
+                        return int(fields[9])
+        except (OSError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def is_rotational(disk: str) -> bool:
+        try:
+            with open(f"/sys/block/{disk}/queue/rotational") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            return False
+
+    @classmethod
+    def read_lifetime_written(cls, partition: str, disk: str) -> Dict[str, int]:
+        """Lifetime bytes written, from whichever counters the system exposes"""
+        result = {}
+
+        try:
+            with open(f"/sys/fs/ext4/{partition}/lifetime_write_kbytes") as f:
+                result["ext4"] = int(f.read()) * 1024
+        except (OSError, ValueError):
+            pass
+
+        controller = cls._nvme_controller(disk)
+        if controller:
+            units = cls._nvme_data_units_written(controller)
+            if units is not None:
+                # One data unit is 1000 512-byte blocks
+                result["nvme"] = units * 1000 * 512
+        return result
+
+    @staticmethod
+    def _nvme_controller(disk: str) -> Optional[str]:
+        """Controller character device for a namespace (nvme0n1 -> nvme0)"""
+        match = re.match(r"(nvme\d+)(c\d+)?n\d+$", disk)
+        return match.group(1) if match else None
+
+    @classmethod
+    def _nvme_data_units_written(cls, controller: str) -> Optional[int]:
+        """Read "Data Units Written" from the NVMe SMART log (needs root)"""
+        log = ctypes.create_string_buffer(512)
+        cmd = bytearray(cls._NVME_CMD.pack(
+            0x02, 0, 0, 0xFFFFFFFF, 0, 0, 0, ctypes.addressof(log), 0, 512,
+            (127 << 16) | 0x02, 0, 0, 0, 0, 0, 0, 0
+        ))
+        try:
+            fd = os.open(f"/dev/{controller}", os.O_RDONLY | os.O_CLOEXEC)
+        except OSError:
+            return None
+        try:
+            fcntl.ioctl(fd, cls.NVME_IOCTL_ADMIN_CMD, cmd)
+        except OSError:
+            return None
+        finally:
+            os.close(fd)
+        return int.from_bytes(log.raw[48:64], "little")
+
+    @staticmethod
+    def read_boot_id() -> str:
+        try:
+            with open("/proc/sys/kernel/random/boot_id") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    # --- Store ------------------------------------------------------------
+
+    @classmethod
+    def store_size(cls) -> int:
+        return cls._HEADER_SIZE + (cls.HOURS + cls.DAYS) * cls._RECORD.size
+
+    def _open(self) -> bool:
+        if self._mmap is not None:
+            return True
+        size = self.store_size()
+        try:
+            if self.readonly:
+                fd = os.open(self.store_path, os.O_RDONLY | os.O_CLOEXEC)
+            else:
+                os.makedirs(os.path.dirname(self.store_path), exist_ok=True)
+                fd = os.open(self.store_path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        except OSError:
+            return False
+
+        try:
+            if os.fstat(fd).st_size != size:
+                if self.readonly:
+                    return False
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                self._mmap = mmap.mmap(fd, size)
+                self._HEADER.pack_into(self._mmap, 0, self.MAGIC, 1, b"", b"", 0, 0.0)
+            else:
+                access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+                self._mmap = mmap.mmap(fd, size, access=access)
+        finally:
+            os.close(fd)
+
+        if self._HEADER.unpack_from(self._mmap, 0)[0] != self.MAGIC:
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _slot_offset(self, number: int, daily: bool) -> int:
+        if daily:
+            return self._HEADER_SIZE + (self.HOURS + number % self.DAYS) * self._RECORD.size
+        return self._HEADER_SIZE + (number % self.HOURS) * self._RECORD.size
+
+    def _add(self, number: int, daily: bool, sectors: int):
+        offset = self._slot_offset(number, daily)
+        stored, value = self._RECORD.unpack_from(self._mmap, offset)
+        if stored != number:
+            value = 0  # slot still holds an older hour/day: recycle it
+        self._RECORD.pack_into(self._mmap, offset, number, value + sectors)
+
+    def _get(self, number: int, daily: bool) -> Optional[int]:
+        stored, value = self._RECORD.unpack_from(self._mmap, self._slot_offset(number, daily))
+        return value if stored == number else None
+
+    def get_device(self) -> str:
+        if not self._open():
+            return ""
+        return self._HEADER.unpack_from(self._mmap, 0)[2].rstrip(b"\0").decode()
+
+    def sample(self, now: float = None) -> Optional[int]:
+        """Add sectors written since the previous sample. Returns the delta."""
+        partition = self.find_root_partition()
+        if partition is None:
+            return None
+        disk = self.find_disk(partition)
+        sectors = self.read_sectors_written(disk)
+        if sectors is None or not self._open():
+            return None
+
+        now = now if now is not None else time.time()
+        boot_id = self.read_boot_id()
+        _, _, device, last_boot, last_sectors, last_time = self._HEADER.unpack_from(self._mmap, 0)
+        same_boot = last_boot.rstrip(b"\0").decode() == boot_id and device.rstrip(b"\0").decode() == disk
+
+        if same_boot and sectors >= last_sectors:
+            delta = sectors - last_sectors
+            first_hour = int(last_time // 3600)
+        else:
+            # Counters restart at boot: everything since boot is new
+            delta = sectors
+            first_hour = int((now - self._uptime()) // 3600)
+
+        # Spread the delta evenly over the hours it covers (at most two days)
+        last_hour = int(now // 3600)
+        first_hour = max(first_hour, last_hour - 47)
+        hours = list(range(first_hour, last_hour + 1))
+        share, remainder = divmod(delta, len(hours))
+        for i, hour in enumerate(hours):
+            part = share + (1 if i < remainder else 0)
+            self._add(hour, False, part)
+            self._add(hour // 24, True, part)
+
+        self._HEADER.pack_into(self._mmap, 0, self.MAGIC, 1, disk.encode()[:32],
+                               boot_id.encode()[:36], sectors, now)
+        self._mmap.flush()
+        return delta
+
+    @staticmethod
+    def _uptime() -> float:
+        try:
+            with open("/proc/uptime") as f:
+                return float(f.read().split()[0])
+        except (OSError, ValueError):
+            return 0.0
+
+    def daily_totals(self, days: int = 7, now: float = None) -> List[Tuple[int, int]]:
+        """(day number, bytes written) for the most recent days with data"""
+        if not self._open():
+            return []
+        today = int((now if now is not None else time.time()) // 86400)
+        result = []
+        for day in range(today - days + 1, today + 1):
+            value = self._get(day, True)
+            if value is not None:
+                result.append((day, value * SECTOR_BYTES))
+        return result
+
+    def write_rate(self, start: float, end: float) -> WriteRate:
+        """Average bytes per hour over sampled hours in [start, end)"""
+        if not self._open():
+            return WriteRate()
+        total = 0
+        hours = 0
+        for hour in range(int(start // 3600), int(end // 3600)):
+            value = self._get(hour, False)
+            if value is not None:
+                total += value
+                hours += 1
+        if hours == 0:
+            return WriteRate()
+        return WriteRate(hours, total * SECTOR_BYTES / hours)
+
+    def compare_rates(self, enabled_at: float, window: float = 7 * 86400,
+                      now: float = None) -> Tuple[WriteRate, WriteRate]:
+        """Write rate in the window before vs after an app was enabled"""
+        now = now if now is not None else time.time()
+        before = self.write_rate(enabled_at - window, enabled_at)
+        after = self.write_rate(enabled_at, min(now, enabled_at + window))
+        return before, after
+
+
+def main():
+    """ssdsaver-diskstats: `sample` (run hourly as root) or `report`"""
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+
+    if command == "sample":
+        stats = DiskStats(readonly=False)
+        delta = stats.sample()
+        stats.close()
+        if delta is None:
+            print("Could not sample root disk statistics")
+            return 1
+        print(f"Recorded {delta * SECTOR_BYTES // 1024} KiB written")
+        return 0
+
+    stats = DiskStats()
+    partition = DiskStats.find_root_partition()
+    disk = DiskStats.find_disk(partition) if partition else None
+    print(f"Root disk: {disk or 'unknown'}")
+    if disk:
+        sectors = DiskStats.read_sectors_written(disk)
+        if sectors is not None:
+            print(f"Written since boot: {sectors * SECTOR_BYTES / 1024 ** 3:.2f} GiB")
+        for source, value in DiskStats.read_lifetime_written(partition, disk).items():
+            print(f"Lifetime written ({source}): {value / 1024 ** 4:.2f} TiB")
+    for day, value in stats.daily_totals():
+        print(f"{time.strftime('%Y-%m-%d', time.gmtime(day * 86400))}: {value / 1024 ** 2:.1f} MiB")
+    stats.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+Fast copy module for SSDsaver.
+Copies file data inside the kernel instead of through user space: a
+reflink (FICLONE) where both sides share a btrfs or XFS filesystem,
+otherwise copy_file_range or sendfile, skipping holes found with
+SEEK_DATA/SEEK_HOLE so sparse files stay sparse.
+"""
+
+import ctypes
+import errno
+import fcntl
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Tuple
+
+FICLONE = 0x40049409                  # _IOW(0x94, 9, int)
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+CHUNK = 64 * 1024 * 1024              # bytes per copy_file_range/sendfile call
+BUFFER = 1024 * 1024                  # bytes per read in the user-space fallback
+SMALL_FILE = 64 * 1024                # copied with one read and write: the extra calls cost more
+
+METHODS = ("clone", "copy_file_range", "sendfile", "read/write")
+
+# The call failed because the files or filesystems don't support it, not
+# because of an I/O error: try the next method
+UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP,
+               errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+
+@dataclass
+class CopyStats:
+    """Bytes copied by each method"""
+    files: int = 0
+    bytes: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(METHODS, 0))
+    holes: int = 0             # bytes skipped as holes
+
+    def summary(self) -> str:
+        used = ", ".join(f"{name} {n / (1024 * 1024):.1f} MB"
+                         for name, n in self.bytes.items() if n)
+        return (f"{self.files} files ({used or 'no data'}), "
+                f"{self.holes / (1024 * 1024):.1f} MB of holes skipped")
+
+
+def data_segments(fd: int, size: int, offset: int = 0) -> Iterator[Tuple[int, int]]:
+    """(offset, length) of each range of fd holding data from offset on,
+    in order. A filesystem without SEEK_DATA reports it all as data."""
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # only a hole up to the end
+            if e.errno in UNSUPPORTED:
+                yield offset, size - offset
+                return
+            raise
+        if start >= size:
+            return
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        yield start, end - start
+        offset = end
+
+
+def has_data(fd: int, offset: int, length: int) -> bool:
+    """Whether fd holds data anywhere in [offset, offset + length)"""
+    try:
+        return os.lseek(fd, offset, os.SEEK_DATA) < offset + length
+    except OSError as e:
+        if e.errno == errno.ENXIO:
+            return False
+        if e.errno in UNSUPPORTED:
+            return True
+        raise
+
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    return _libc
+
+
+def syncfs(path: str):
+    """Flush the filesystem holding path (everything, like sync, where
+    syncfs() is unavailable)"""
+    try:
+        libc_syncfs = _get_libc().syncfs
+    except AttributeError:
+        os.sync()
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        if libc_syncfs(fd) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+    finally:
+        os.close(fd)
+
+
+def clone_file(src: str, dst: str) -> bool:
+    """Create dst as a reflink of src. False where the filesystem can't
+    share extents (or they are on different filesystems)."""
+    with open(src, "rb") as fin:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o600)
+        try:
+            fcntl.ioctl(fd, FICLONE, fin.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                raise
+            return False
+        finally:
+            os.close(fd)
+
+
+def punch_hole(fd: int, offset: int, length: int) -> bool:
+    """Deallocate a range of fd, keeping its size. False where the
+    filesystem can't (the caller then writes zeros)."""
+    if _get_libc().fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, offset, length) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in UNSUPPORTED:
+        return False
+    raise OSError(err, os.strerror(err))
+
+
+class FastCopy:
+    """Copies whole files between two descriptors with the cheapest
+    method the pair of filesystems supports.
+
+    Methods are tried from the cheapest down; one that fails as
+    unsupported is not tried again for the same pair of devices, so a
+    tmpfs-to-ext4 write-back settles on sendfile after its first file.
+    `methods` limits the ones tried (read/write is always available).
+    `throttle` (see throttle.Throttle) paces the data copied, if set.
+    """
+
+    def __init__(self, methods: Tuple[str, ...] = METHODS):
+        self.stats = CopyStats()
+        self._disabled = set(METHODS) - set(methods)
+        self._skip: Dict[Tuple[int, int], set] = {}
+        self.throttle = None
+
+    def copy(self, fd_in: int, fd_out: int, size: int, offset: int = 0) -> int:
+        """Copy fd_in from offset up to size into fd_out, which holds
+        nothing past offset (new, truncated, or an older and shorter copy
+        of an appended file). Returns the bytes of data written; a clone
+        writes none."""
+        pair = (os.fstat(fd_in).st_dev, os.fstat(fd_out).st_dev)
+        skip = self._skip.setdefault(pair, set(self._disabled))
+        self.stats.files += 1
+        if "clone" not in skip and pair[0] == pair[1] and offset == 0:
+            try:
+                fcntl.ioctl(fd_out, FICLONE, fd_in)
+                self.stats.bytes["clone"] += size
+                return 0
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+                skip.add("clone")
+
+        if size - offset <= SMALL_FILE:
+            return self.copy_range(fd_in, fd_out, offset, size - offset, {"copy_file_range", "sendfile"})
+        written = 0
+        end = offset
+        for start, length in data_segments(fd_in, size, offset):
+            written += self.copy_range(fd_in, fd_out, start, length, skip)
+            end = start + length
+        self.stats.holes += size - offset - written
+        if end < size:
+            os.ftruncate(fd_out, size)  # a trailing hole
+        return written
+
+    def copy_range(self, fd_in: int, fd_out: int, offset: int, length: int, skip: set = None) -> int:
+        """Copy [offset, offset + length) of fd_in to the same offset of
+        fd_out"""
+        skip = skip if skip is not None else set(self._disabled)
+        end = offset + length
+        pos = offset
+        chunk = min(CHUNK, self.throttle.chunk) if self.throttle else CHUNK
+        if "copy_file_range" not in skip:
+            try:
+                while pos < end:
+                    n = os.copy_file_range(fd_in, fd_out, min(chunk, end - pos), pos, pos)
+                    if n == 0:
+                        break
+                    pos += n
+                    self.stats.bytes["copy_file_range"] += n
+                    self._paced(n, fd_out)
+            except OSError as e:
+                if e.errno not in UNSUPPORTED or pos != offset:
+                    raise
+                skip.add("copy_file_range")
+        if pos < end and "sendfile" not in skip:
+            try:
+                os.lseek(fd_out, pos, os.SEEK_SET)
+                while pos < end:
+                    n = os.sendfile(fd_out, fd_in, pos, min(chunk, end - pos))
+                    if n == 0:
+                        break
+                    pos += n
+                    self.stats.bytes["sendfile"] += n
+                    self._paced(n, fd_out)
+            except OSError as e:
+                if e.errno not in UNSUPPORTED or pos != offset:
+                    raise
+                skip.add("sendfile")
+        while pos < end:
+            block = os.pread(fd_in, min(BUFFER, chunk, end - pos), pos)
+            if not block:
+                break
+            view = memoryview(block)
+            while view:
+                n = os.pwrite(fd_out, view, pos)
+                view = view[n:]
+                pos += n
+                self.stats.bytes["read/write"] += n
+            self._paced(len(block), fd_out)
+        return pos - offset
+
+    def _paced(self, nbytes: int, fd: int):
+        if self.throttle is not None:
+            self.throttle.wait(nbytes, fd)
+
+
+def copy_file(src: str, dst: str) -> CopyStats:
+    """Copy src's data to dst (created or truncated)"""
+    copier = FastCopy()
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        copier.copy(fin.fileno(), fout.fileno(), os.fstat(fin.fileno()).st_size)
+    return copier.stats
+
+
+def main():
+    """fastcopy.py SRC DST: copy one file and show which methods were used"""
+    if len(sys.argv) != 3:
+        print("Usage: fastcopy.py SRC DST", file=sys.stderr)
+        return 2
+    try:
+        stats = copy_file(sys.argv[1], sys.argv[2])
+    except OSError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    print(stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
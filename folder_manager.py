@@ -5,18 +5,31 @@ Manages RAM disk bindings for multiple folders using log2ram-style mechanism.
 
 import os
 import subprocess
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 import configparser
 
+from app_detector import AppDetector
+from usage_scanner import UsageScanner, PathUsage
+from mount_table import MountTable
+
 class FolderManager:
     """Manages folder-to-RAM bindings"""
     
     CONFIG_DIR = "/etc/ssdsaver"
     CONFIG_FILE = "/etc/ssdsaver/folders.conf"
+    # Folder modes, in the order the UI lists them:
+    # safe     copied into RAM at start, written back
+    # lossy    starts empty, never written back
+    # overlay  disk copy as lower layer, only the RAM upper layer written back
+    # archive  like safe, but stored on disk as one compressed archive
+    MODES = ("safe", "lossy", "overlay", "archive")
+    DURABILITY = ("none", "syncfs", "fsync")  # weakest first
     
     def __init__(self):
         self.config = configparser.ConfigParser()
+        self.usage_scanner = UsageScanner()
+        self.mount_table = MountTable()
         self.load_config()
     
     def load_config(self) -> Dict[str, Dict]:
@@ -98,6 +111,90 @@ class FolderManager:
         
         return True
     
+    def add_custom_target(self, path: str, size: str) -> str:
+        """Add a discovered folder as a (disabled) custom target.
+        Returns its section name; saved on the next save_all_configs()."""
+        import re
+        
+        path = os.path.realpath(os.path.expanduser(path))
+        name = "custom-" + re.sub(r"[^a-z0-9]+", "-", path.lower()).strip("-")
+        home = os.path.expanduser("~")
+        display_name = "~" + path[len(home):] if path.startswith(home + "/") else path
+        
+        self.config[name] = {
+            "custom": "true",
+            "display_name": display_name,
+            "enabled": "false",
+            "size": size,
+            "mode": "safe",
+            "paths": path
+        }
+        return name
+    
+    def get_custom_targets(self) -> Dict[str, Dict]:
+        """Custom folders (added from write discovery) by section name"""
+        return {
+            name: config for name, config in self._config_to_dict().items()
+            if config.get("custom", "false").lower() == "true"
+        }
+    
+    def get_app_rules(self, app_name: str) -> List[Tuple[bool, str]]:
+        """Ignore rules for an app's folders as (include, pattern), from the
+        include/exclude keys of its folders.conf section (patterns separated
+        by ";"), or else the app's defaults in AppDetector.APPS.
+        Patterns that cannot be written into log2ram.conf (containing ",",
+        '"', "$", "`" or "\\") are dropped."""
+        config = self.get_app_config(app_name) or {}
+        defaults = AppDetector.APPS.get(app_name, {})
+        rules = []
+        for include, key in ((True, "include"), (False, "exclude")):
+            patterns = config[key].split(";") if key in config else defaults.get(key, [])
+            rules += [(include, p.strip()) for p in patterns
+                      if p.strip() and not set(p) & set(',"$`\\')]
+        return rules
+    
+    def get_app_durability(self, app_name: str) -> str:
+        """How an app's folders are flushed on write-back: the durability
+        key of its folders.conf section (none, syncfs or fsync), else
+        syncfs"""
+        config = self.get_app_config(app_name) or {}
+        durability = config.get("durability", "syncfs").strip().lower()
+        return durability if durability in self.DURABILITY else "syncfs"
+    
+    def get_app_checkpoint(self, app_name: str) -> bool:
+        """Whether the 15-minute checkpoints write an app's folders back:
+        the checkpoint key of its folders.conf section (yes/no), else no.
+        Only safe folders are ever checkpointed; the others (and folders
+        without the key) are written back daily and at shutdown."""
+        config = self.get_app_config(app_name) or {}
+        return config.get("checkpoint", "no").strip().lower() in ("yes", "true", "1", "on")
+    
+    def get_rule_savings(self, app_name: str) -> Dict[str, int]:
+        """Exclude pattern -> bytes it kept off the disk in the last sync,
+        summed over the app's folders"""
+        return self.read_rule_savings(*self.get_rule_savings_args(app_name))
+    
+    def get_rule_savings_args(self, app_name: str) -> Tuple[List[str], List[str]]:
+        """An app's exclude patterns and configured paths, as taken by
+        read_rule_savings (split out so the UI can read the config on the
+        main loop and the state files on a worker)"""
+        patterns = [pattern for include, pattern in self.get_app_rules(app_name) if not include]
+        config = self.get_app_config(app_name) or {}
+        return patterns, [p for p in config.get("paths", "").split(";") if p]
+    
+    @staticmethod
+    def read_rule_savings(patterns: List[str], paths: List[str]) -> Dict[str, int]:
+        """Sum the last sync's filter stats of the given folders for each
+        exclude pattern. Touches no config state, so safe on a worker"""
+        from sync_engine import read_filter_stats
+        
+        savings = {pattern: 0 for pattern in patterns}
+        for path in FolderManager._expand_usage_paths(paths):
+            for pattern, nbytes in read_filter_stats(path).items():
+                if pattern in savings:
+                    savings[pattern] += nbytes
+        return savings
+    
     def disable_app(self, app_name: str) -> bool:
         """Disable RAM caching for an application"""
         if app_name in self.config:
@@ -172,6 +269,35 @@ class FolderManager:
         self.config['GLOBAL']['budget'] = f"{size_mb}M"
         return True
     
+    def is_pool_mode(self) -> bool:
+        """Whether app folders share one RAM pool instead of a mount each"""
+        if 'GLOBAL' in self.config:
+            return self.config['GLOBAL'].get('pool', 'false').lower() == 'true'
+        return False
+    
+    def set_pool_mode(self, enabled: bool) -> bool:
+        """Set the shared RAM pool mode"""
+        if 'GLOBAL' not in self.config:
+            self.config['GLOBAL'] = {}
+        self.config['GLOBAL']['pool'] = "true" if enabled else "false"
+        return True
+    
+    def get_writeback_rate(self) -> int:
+        """Write-back limit in MB/s (0 for no limit)"""
+        if 'GLOBAL' in self.config:
+            try:
+                return max(0, int(self.config['GLOBAL'].get('writeback_rate', '0')))
+            except ValueError:
+                return 0
+        return 0
+    
+    def set_writeback_rate(self, rate_mb: int) -> bool:
+        """Set the write-back limit in MB/s (0 for no limit)"""
+        if 'GLOBAL' not in self.config:
+            self.config['GLOBAL'] = {}
+        self.config['GLOBAL']['writeback_rate'] = str(max(0, rate_mb))
+        return True
+    
     def get_available_ram(self) -> int:
         """Calculate remaining RAM budget (budget - used)"""
         budget = self.get_global_budget()
@@ -193,6 +319,80 @@ class FolderManager:
         budget = self.get_global_budget()
         return (current_usage + size_mb) > budget
     
+    def _build_path_entries(self) -> List[Tuple[str, str, str, str, str, str]]:
+        """(path, mode, size, rules, durability, checkpoint) for log2ram's
+        PATH_DISK, PATH_MODE, PATH_SIZE, PATH_FILTER, PATH_DURABILITY and
+        PATH_CHECKPOINT.
+        
+        /var/log always comes first, is always safe and keeps log2ram's
+        own SIZE (empty size). App paths are expanded here (~ and
+        wildcards), because log2ram runs as root and takes every entry
+        literally. Each app's size is split evenly over its paths, so its
+        mounts add up to at most the size shown in the UI. A path listed
+        by several apps is kept once, with the larger size, the first of
+        safe, archive, overlay and lossy that any of them wants, and all of
+        their ignore rules (includes first) and the strongest durability;
+        it is checkpointed if any of them asks for it and it stays safe.
+        /var/log is always checkpointed.
+        Rules are written as "+pattern" or "-pattern", separated by ",".
+        """
+        from glob import glob
+        
+        entries = {"/var/log": ("safe", 0, [], "syncfs", True)}
+        for app_name in self.get_enabled_apps():
+            app_config = self.get_app_config(app_name) or {}
+            mode = app_config.get("mode", "safe")
+            if mode not in self.MODES:
+                mode = "safe"
+            
+            app_paths = []
+            for path in app_config.get("paths", "").split(";"):
+                if not path:
+                    continue
+                path = os.path.expanduser(path)
+                for expanded in sorted(glob(path)) if '*' in path else [path]:
+                    expanded = expanded.rstrip("/")
+                    if expanded != "/var/log" and expanded not in app_paths:
+                        app_paths.append(expanded)
+            if not app_paths:
+                continue
+            
+            size_mb = max(1, self._parse_size_to_mb(app_config.get("size", "200M")) // len(app_paths))
+            rules = self.get_app_rules(app_name)
+            durability = self.get_app_durability(app_name)
+            checkpoint = self.get_app_checkpoint(app_name)
+            for path in app_paths:
+                old_mode, old_size, old_rules, old_durability, old_checkpoint = entries.get(
+                    path, (mode, 0, [], durability, checkpoint))
+                entries[path] = (
+                    min(mode, old_mode, key=("safe", "archive", "overlay", "lossy").index),
+                    max(size_mb, old_size),
+                    sorted(dict.fromkeys(old_rules + rules), key=lambda rule: not rule[0]),
+                    max(durability, old_durability, key=self.DURABILITY.index),
+                    checkpoint or old_checkpoint
+                )
+        return [(path, mode, f"{size_mb}M" if size_mb else "",
+                 ",".join(("+" if include else "-") + pattern for include, pattern in rules),
+                 durability, "true" if checkpoint and mode == "safe" else "false")
+                for path, (mode, size_mb, rules, durability, checkpoint) in entries.items()]
+    
+    def _log2ram_path_settings(self) -> Dict[str, str]:
+        """log2ram.conf keys for the enabled folders, quoted as written"""
+        path_entries = self._build_path_entries()
+        return {
+            "PATH_DISK": '"' + ";".join(entry[0] for entry in path_entries) + '"',
+            "PATH_MODE": '"' + ";".join(entry[1] for entry in path_entries) + '"',
+            "PATH_SIZE": '"' + ";".join(entry[2] for entry in path_entries) + '"',
+            "PATH_FILTER": '"' + ";".join(entry[3] for entry in path_entries) + '"',
+            "PATH_DURABILITY": '"' + ";".join(entry[4] for entry in path_entries) + '"',
+            "PATH_CHECKPOINT": '"' + ";".join(entry[5] for entry in path_entries) + '"',
+            # Enforced by log2ram on the sum of PATH_SIZE mounts, or as the
+            # size of the shared pool
+            "RAM_BUDGET": f"{self.get_global_budget()}M",
+            "POOL": "true" if self.is_pool_mode() else "false",
+            "WRITEBACK_RATE": str(self.get_writeback_rate())
+        }
+    
     def save_all_configs(self, app_configs: Dict[str, Dict]) -> bool:
         """Save both folders.conf and log2ram.conf in a single pkexec call"""
         # 1. Prepare folders.conf content
@@ -204,19 +404,8 @@ class FolderManager:
         folders_content = self._generate_config_content()
         
         # 2. Prepare log2ram.conf content
-        # Build PATH_DISK list
-        enabled_apps = self.get_enabled_apps()
-        path_disk_entries = ["/var/log"]
-        
-        for app_name in enabled_apps:
-            app_config = self.get_app_config(app_name)
-            if app_config and "paths" in app_config:
-                paths = app_config["paths"].split(";")
-                path_disk_entries.extend(paths)
-        
-        path_disk_value = ";".join(path_disk_entries)
-        budget_mb = self.get_global_budget()
-        size_value = f"{budget_mb}M"
+        # Build PATH_DISK list (SIZE is left alone: it is /var/log's size)
+        path_settings = self._log2ram_path_settings()
         
         # Read current log2ram config to preserve other settings
         log2ram_lines = []
@@ -238,8 +427,7 @@ class FolderManager:
             key, val = line.split("=", 1)
             new_log2ram_config[key.strip()] = val.strip()
             
-        new_log2ram_config["PATH_DISK"] = f'"{path_disk_value}"'
-        new_log2ram_config["SIZE"] = size_value
+        new_log2ram_config.update(path_settings)
         
         log2ram_content = "\n".join([f"{k}={v}" for k, v in new_log2ram_config.items()]) + "\n"
         
@@ -274,23 +462,8 @@ class FolderManager:
         """Update log2ram configuration with all enabled folders"""
         # This method is kept for backward compatibility or isolated updates
         # But we should try to use save_all_configs where possible
-        enabled_apps = self.get_enabled_apps()
-        
         # Build PATH_DISK list for log2ram
-        path_disk_entries = ["/var/log"]  # Always include system logs
-        
-        for app_name in enabled_apps:
-            app_config = self.get_app_config(app_name)
-            if app_config and "paths" in app_config:
-                paths = app_config["paths"].split(";")
-                path_disk_entries.extend(paths)
-        
-        # Update log2ram.conf
-        path_disk_value = ";".join(path_disk_entries)
-        
-        # Get global budget for SIZE
-        budget_mb = self.get_global_budget()
-        size_value = f"{budget_mb}M"
+        path_settings = self._log2ram_path_settings()
         
         try:
             # Read current log2ram config
@@ -303,9 +476,8 @@ class FolderManager:
                             key, value = line.split("=", 1)
                             log2ram_config[key.strip()] = value.strip()
             
-            # Update PATH_DISK and SIZE
-            log2ram_config["PATH_DISK"] = f'"{path_disk_value}"'
-            log2ram_config["SIZE"] = size_value
+            # Update PATH_DISK, PATH_MODE, PATH_SIZE, RAM_BUDGET and WRITEBACK_RATE
+            log2ram_config.update(path_settings)
             
             # Write back
             config_lines = []
@@ -326,47 +498,97 @@ class FolderManager:
         except Exception as e:
             print(f"Error updating log2ram config: {e}")
             return False
-    def get_path_usage_mb(self, path: str) -> float:
-        """Get actual usage of a path in MB using du"""
-        try:
-            # Expand user path if needed
+    @staticmethod
+    def _expand_usage_paths(paths: List[str]) -> List[str]:
+        """Expand ~ and wildcards in cache paths, keeping only existing ones"""
+        from glob import glob
+        
+        expanded = []
+        for path in paths:
             if path.startswith('~'):
                 path = os.path.expanduser(path)
-            
-            # Handle wildcards
             if '*' in path:
-                from glob import glob
-                expanded = glob(path)
-                total = 0.0
-                for p in expanded:
-                    total += self.get_path_usage_mb(p)
-                return total
+                expanded.extend(glob(path))
+            elif os.path.exists(path):
+                expanded.append(path)
+        return expanded
 
-            if not os.path.exists(path):
-                return 0.0
-                
-            output = subprocess.check_output(['du', '-sk', path], stderr=subprocess.DEVNULL)
-            kb = int(output.split()[0])
-            return kb / 1024
-        except Exception:
-            return 0.0
+    def _measure_paths(self, paths: List[str]) -> Dict[str, PathUsage]:
+        """Measure expanded paths.
 
-    def get_app_actual_usage(self, app_name: str, detected_paths: List[str] = None) -> float:
-        """Get actual usage for an app in MB"""
+        Paths that are their own tmpfs/zram mount are read from statvfs in
+        constant time; only paths not yet mounted in RAM, or bound from the
+        shared pool, are walked.
+        """
+        result = {}
+        to_scan = []
+        for path in paths:
+            usage = None
+            entry = self.mount_table.get_mount(path)
+            if entry is not None and entry.is_ram and not entry.is_bind:
+                usage = self.mount_table.statvfs_usage(path)
+            if usage is None:
+                to_scan.append(path)
+            else:
+                result[path] = usage
+        
+        result.update(self.usage_scanner.scan_many(to_scan))
+        return result
+
+    def get_path_usage(self, path: str) -> PathUsage:
+        """Get actual usage (bytes and file count) of a path"""
+        total = PathUsage()
+        for usage in self._measure_paths(self._expand_usage_paths([path])).values():
+            total += usage
+        return total
+
+    def get_path_usage_mb(self, path: str) -> float:
+        """Get actual usage of a path in MB"""
+        return self.get_path_usage(path).mb
+
+    def get_app_usage(self, app_name: str, detected_paths: List[str] = None) -> PathUsage:
+        """Get actual usage (bytes and file count) for an app"""
         # Prefer passed paths (fresh from detector) over config paths (stale)
         if detected_paths:
             paths = detected_paths
         else:
             config = self.get_app_config(app_name)
             if not config or "paths" not in config:
-                return 0.0
+                return PathUsage()
             paths = config["paths"].split(";")
-            
-        total = 0.0
-        for p in paths:
-            total += self.get_path_usage_mb(p)
+        
+        # Scan all of the app's paths in parallel
+        total = PathUsage()
+        for usage in self._measure_paths(self._expand_usage_paths(paths)).values():
+            total += usage
         return total
 
+    def get_app_actual_usage(self, app_name: str, detected_paths: List[str] = None) -> float:
+        """Get actual usage for an app in MB"""
+        return self.get_app_usage(app_name, detected_paths).mb
+
+    def get_apps_usage(self, app_paths: Dict[str, Optional[List[str]]]) -> Dict[str, PathUsage]:
+        """Get actual usage for several apps, scanning all their paths in one parallel pass"""
+        expanded = {}
+        for app_name, detected_paths in app_paths.items():
+            paths = detected_paths
+            if not paths:
+                config = self.get_app_config(app_name) or {}
+                paths = config["paths"].split(";") if "paths" in config else []
+            expanded[app_name] = self._expand_usage_paths(paths)
+        
+        scanned = self._measure_paths(
+            list(dict.fromkeys(p for paths in expanded.values() for p in paths))
+        )
+        
+        result = {}
+        for app_name, paths in expanded.items():
+            total = PathUsage()
+            for p in paths:
+                total += scanned[p]
+            result[app_name] = total
+        return result
+
     def clear_app_cache(self, app_name: str, detected_paths: List[str] = None) -> bool:
         """Clear the cache for an application"""
         import shutil
@@ -0,0 +1,316 @@
+"""
+Filesystem notification module for SSDsaver.
+Thin ctypes bindings for inotify and fanotify that report changed and
+removed paths under a set of watched trees.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+# Normalised event kinds
+EVENT_CHANGED = 1   # path was created, written or moved in
+EVENT_REMOVED = 2   # path was deleted or moved out
+EVENT_OVERFLOW = 3  # events were lost; callers must rescan
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# fanotify(7)
+FAN_CLOEXEC = 0x00000001
+FAN_NONBLOCK = 0x00000002
+FAN_CLASS_NOTIF = 0x00000000
+FAN_REPORT_DIR_FID = 0x00000400
+FAN_REPORT_NAME = 0x00000800
+FAN_REPORT_DFID_NAME = FAN_REPORT_DIR_FID | FAN_REPORT_NAME
+FAN_MARK_ADD = 0x00000001
+FAN_MARK_FILESYSTEM = 0x00000100
+FAN_MODIFY = 0x00000002
+FAN_CLOSE_WRITE = 0x00000008
+FAN_MOVED_FROM = 0x00000040
+FAN_MOVED_TO = 0x00000080
+FAN_CREATE = 0x00000100
+FAN_DELETE = 0x00000200
+FAN_Q_OVERFLOW = 0x00004000
+FAN_ONDIR = 0x40000000
+FAN_EVENT_INFO_TYPE_DFID_NAME = 2
+AT_FDCWD = -100
+
+_INOTIFY_EVENT = struct.Struct("=iIII")
+_FAN_METADATA = struct.Struct("=IBBHQii")
+_FAN_INFO_HEADER = struct.Struct("=BBH")
+_FAN_FSID = struct.Struct("=ii")
+_FILE_HANDLE = struct.Struct("=Ii")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.fanotify_mark.argtypes = [
+            ctypes.c_int, ctypes.c_uint, ctypes.c_uint64, ctypes.c_int, ctypes.c_char_p
+        ]
+        _libc.open_by_handle_at.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+    return _libc
+
+
+def _check(result: int) -> int:
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+def _dedupe(events: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Collapse repeated events for the same path, keeping the last kind"""
+    latest = {}
+    for kind, path in events:
+        latest.pop(path, None)
+        latest[path] = kind
+    return [(kind, path) for path, kind in latest.items()]
+
+
+class InotifyBackend:
+    """Recursive inotify watches; one watch per directory"""
+
+    MASK = (IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM
+            | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+            | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+    def __init__(self):
+        libc = _get_libc()
+        self.fd = _check(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        self._wd_paths: Dict[int, str] = {}
+        self._path_wds: Dict[str, int] = {}
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def add_tree(self, root: str):
+        """Watch every directory under root. Raises OSError (e.g. ENOSPC
+        when fs.inotify.max_user_watches is exhausted)."""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            self._add_watch(directory)
+            try:
+                with os.scandir(directory) as it:
+                    stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def _add_watch(self, directory: str):
+        wd = _get_libc().inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, os.strerror(err), directory)
+        self._wd_paths[wd] = directory
+        self._path_wds[directory] = wd
+
+    def read_events(self) -> List[Tuple[int, str]]:
+        """Drain pending events as (kind, path) pairs"""
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(buf, offset)
+                name = buf[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length]
+                offset += _INOTIFY_EVENT.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    events.append((EVENT_OVERFLOW, ""))
+                    continue
+
+                directory = self._wd_paths.get(wd)
+                if directory is None:
+                    continue
+
+                if mask & IN_IGNORED:
+                    del self._wd_paths[wd]
+                    if self._path_wds.get(directory) == wd:
+                        del self._path_wds[directory]
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    continue
+
+                path = os.path.join(directory, os.fsdecode(name.rstrip(b"\0")))
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    events.append((EVENT_REMOVED, path))
+                else:
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self.add_tree(path)
+                        except OSError:
+                            events.append((EVENT_OVERFLOW, ""))
+                    events.append((EVENT_CHANGED, path))
+        return _dedupe(events)
+
+
+class FanotifyBackend:
+    """Filesystem-wide fanotify marks reporting directory handle + name.
+
+    Needs CAP_SYS_ADMIN (root). A single mark covers a whole filesystem, so
+    it is not bounded by inotify watch limits; events outside the requested
+    roots are filtered out.
+    """
+
+    MASK = (FAN_CREATE | FAN_MODIFY | FAN_CLOSE_WRITE | FAN_DELETE
+            | FAN_MOVED_FROM | FAN_MOVED_TO | FAN_ONDIR)
+    HANDLE_CACHE_SIZE = 4096
+
+    def __init__(self):
+        libc = _get_libc()
+        self.fd = _check(libc.fanotify_init(
+            FAN_CLASS_NOTIF | FAN_CLOEXEC | FAN_NONBLOCK | FAN_REPORT_DFID_NAME,
+            os.O_RDONLY
+        ))
+        self._mount_fds: Dict[int, int] = {}  # low 32 bits of fsid -> fd for open_by_handle_at
+        self._roots: List[str] = []
+        self._handle_paths: Dict[bytes, str] = {}
+
+    @staticmethod
+    def is_supported() -> bool:
+        """fanotify filesystem marks require root"""
+        return hasattr(os, "geteuid") and os.geteuid() == 0
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self):
+        for fd in self._mount_fds.values():
+            os.close(fd)
+        self._mount_fds.clear()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def add_tree(self, root: str):
+        """Mark the filesystem holding root. Raises OSError if the
+        filesystem cannot report file handles (e.g. older tmpfs)."""
+        # glibc may sign-extend the low word into the high one, so only the
+        # low 32 bits of statvfs' f_fsid are reliable
+        fsid = os.statvfs(root).f_fsid & 0xffffffff
+        if fsid not in self._mount_fds:
+            _check(_get_libc().fanotify_mark(
+                self.fd, FAN_MARK_ADD | FAN_MARK_FILESYSTEM, self.MASK,
+                AT_FDCWD, os.fsencode(root)
+            ))
+            self._mount_fds[fsid] = os.open(root, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+        self._roots.append(root.rstrip("/") + "/")
+
+    def _in_roots(self, path: str) -> bool:
+        return any(path.startswith(r) or path + "/" == r for r in self._roots)
+
+    def _resolve_dir(self, fsid: int, handle: bytes) -> Optional[str]:
+        path = self._handle_paths.get(handle)
+        if path is not None:
+            return path
+        mount_fd = self._mount_fds.get(fsid)
+        if mount_fd is None:
+            return None
+
+        fd = _get_libc().open_by_handle_at(mount_fd, handle, os.O_PATH | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        try:
+            path = os.readlink(f"/proc/self/fd/{fd}")
+        finally:
+            os.close(fd)
+
+        if len(self._handle_paths) >= self.HANDLE_CACHE_SIZE:
+            self._handle_paths.clear()
+        self._handle_paths[handle] = path
+        return path
+
+    def read_events(self) -> List[Tuple[int, str]]:
+        """Drain pending events as (kind, path) pairs"""
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+
+            offset = 0
+            while offset + _FAN_METADATA.size <= len(buf):
+                event_len, _vers, _res, meta_len, mask, fd, _pid = _FAN_METADATA.unpack_from(buf, offset)
+                if fd >= 0:
+                    os.close(fd)
+                if mask & FAN_Q_OVERFLOW:
+                    events.append((EVENT_OVERFLOW, ""))
+                    offset += event_len
+                    continue
+
+                path = self._parse_info(buf, offset + meta_len, offset + event_len)
+                offset += event_len
+                if path is None or not self._in_roots(path):
+                    continue
+
+                if mask & FAN_ONDIR and mask & (FAN_DELETE | FAN_MOVED_FROM | FAN_MOVED_TO):
+                    # Cached directory paths may now be stale
+                    self._handle_paths.clear()
+                if mask & (FAN_DELETE | FAN_MOVED_FROM):
+                    events.append((EVENT_REMOVED, path))
+                else:
+                    events.append((EVENT_CHANGED, path))
+        return _dedupe(events)
+
+    def _parse_info(self, buf: bytes, offset: int, end: int) -> Optional[str]:
+        """Extract directory handle + name from the event's info records"""
+        while offset + _FAN_INFO_HEADER.size <= end:
+            info_type, _pad, length = _FAN_INFO_HEADER.unpack_from(buf, offset)
+            if length == 0:
+                return None
+            if info_type == FAN_EVENT_INFO_TYPE_DFID_NAME:
+                pos = offset + _FAN_INFO_HEADER.size
+                fsid = _FAN_FSID.unpack_from(buf, pos)[0] & 0xffffffff
+                pos += _FAN_FSID.size
+                handle_bytes, _handle_type = _FILE_HANDLE.unpack_from(buf, pos)
+                handle_end = pos + _FILE_HANDLE.size + handle_bytes
+                handle = bytes(buf[pos:handle_end])
+                name = bytes(buf[handle_end:offset + length]).split(b"\0", 1)[0]
+
+                directory = self._resolve_dir(fsid, handle)
+                if directory is None:
+                    return None
+                if not name or name == b".":
+                    return directory
+                return os.path.join(directory, os.fsdecode(name))
+            offset += length
+        return None
@@ -1,4 +1,9 @@
+import os
 import sys
+import time
+
+STARTED = time.perf_counter()  # for SSDSAVER_STARTUP_TIMING
+
 import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
@@ -19,8 +24,23 @@ class Log2RamApp(Adw.Application):
 
     def on_activate(self, app):
         self.win = MainWindow(application=app)
+        if os.environ.get("SSDSAVER_STARTUP_TIMING"):
+            self.win.connect("realize", self._time_first_frame)
         self.win.present()
     
+    def _time_first_frame(self, win):
+        """Print time-to-first-frame; SSDSAVER_STARTUP_TIMING=exit also quits"""
+        clock = win.get_frame_clock()
+        
+        def after_paint(clock):
+            clock.disconnect(handler_id)
+            print(f"startup: first frame after {(time.perf_counter() - STARTED) * 1000:.1f} ms",
+                  flush=True)
+            if os.environ.get("SSDSAVER_STARTUP_TIMING") == "exit":
+                self.quit()
+        
+        handler_id = clock.connect("after-paint", after_paint)
+    
     def on_about_action(self, action, param):
         """Show About dialog"""
         self.win.show_about_dialog()
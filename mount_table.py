@@ -0,0 +1,164 @@
+"""
+Mount table module for SSDsaver.
+Parses /proc/self/mountinfo and keeps it current, so callers can tell in
+constant time whether a path is its own RAM-backed (tmpfs/zram) mount.
+"""
+
+import os
+import re
+import select
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from usage_scanner import PathUsage
+
+
+@dataclass
+class MountEntry:
+    """One line of /proc/self/mountinfo"""
+    mount_id: int
+    parent_id: int
+    device: str  # major:minor
+    root: str
+    mount_point: str
+    options: str
+    fs_type: str
+    source: str
+    super_options: str
+
+    @property
+    def is_zram(self) -> bool:
+        return self.source.startswith("/dev/zram")
+
+    @property
+    def is_bind(self) -> bool:
+        """True for a bind mount of a subdirectory (e.g. a folder in
+        log2ram's pool); statvfs then reports the whole filesystem"""
+        return self.root != "/"
+
+    @property
+    def is_ram(self) -> bool:
+        """True for filesystems whose contents live in RAM"""
+        return self.fs_type in MountTable.RAM_FS_TYPES or self.is_zram
+
+
+class MountTable:
+    """Cached view of the mount table, re-parsed only when it changes"""
+
+    MOUNTINFO = "/proc/self/mountinfo"
+    RAM_FS_TYPES = {"tmpfs", "ramfs"}
+
+    _OCTAL_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+    def __init__(self, mountinfo_path: str = None):
+        self.mountinfo_path = mountinfo_path or self.MOUNTINFO
+        self._mounts: Dict[str, MountEntry] = {}
+        self._lock = threading.Lock()
+        self._fd = None
+        self._poller = None
+        self._stale = True
+
+        try:
+            self._fd = os.open(self.mountinfo_path, os.O_RDONLY | os.O_CLOEXEC)
+            # The kernel flags mountinfo with POLLPRI|POLLERR whenever a
+            # mount is added or removed, until the file is read again.
+            self._poller = select.poll()
+            self._poller.register(self._fd, select.POLLPRI | select.POLLERR)
+        except OSError as e:
+            print(f"Error opening {self.mountinfo_path}: {e}")
+
+    def close(self):
+        """Release the mountinfo file descriptor"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-parse the mount table if it changed. Returns True if re-parsed."""
+        with self._lock:
+            if self._fd is None:
+                return False
+            if not (force or self._stale or self._poller.poll(0)):
+                return False
+
+            self._mounts = self._parse(self._read())
+            self._stale = False
+            return True
+
+    def get_mount(self, path: str) -> Optional[MountEntry]:
+        """Return the mount whose mount point is exactly `path`, if any"""
+        self.refresh()
+        return self._mounts.get(os.path.realpath(path))
+
+    def is_ram_mount(self, path: str) -> bool:
+        """Check if `path` is itself the mount point of a RAM filesystem"""
+        entry = self.get_mount(path)
+        return entry is not None and entry.is_ram
+
+    def get_ram_mounts(self) -> List[MountEntry]:
+        """Return all RAM-backed mounts"""
+        self.refresh()
+        return [m for m in self._mounts.values() if m.is_ram]
+
+    @staticmethod
+    def statvfs_usage(path: str) -> Optional[PathUsage]:
+        """Usage of a whole filesystem from statvfs (bytes used, inodes used).
+
+        Returns None when the filesystem does not report block counts
+        (e.g. ramfs), in which case the caller must walk the tree instead.
+        """
+        try:
+            st = os.statvfs(path)
+        except OSError:
+            return None
+        if st.f_blocks == 0:
+            return None
+        return PathUsage(
+            (st.f_blocks - st.f_bfree) * st.f_frsize,
+            max(0, st.f_files - st.f_ffree)
+        )
+
+    def _read(self) -> str:
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self._fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks).decode("utf-8", "surrogateescape")
+
+    @classmethod
+    def _unescape(cls, field: str) -> str:
+        return cls._OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+    @classmethod
+    def _parse(cls, content: str) -> Dict[str, MountEntry]:
+        """Parse mountinfo content into {mount_point: entry}.
+
+        Later lines win, so for stacked mounts the topmost one is kept.
+        """
+        mounts = {}
+        for line in content.splitlines():
+            fields = line.split()
+            try:
+                sep = fields.index("-", 6)
+            except ValueError:
+                continue
+            if len(fields) < sep + 3:
+                continue
+
+            entry = MountEntry(
+                mount_id=int(fields[0]),
+                parent_id=int(fields[1]),
+                device=fields[2],
+                root=cls._unescape(fields[3]),
+                mount_point=cls._unescape(fields[4]),
+                options=fields[5],
+                fs_type=fields[sep + 1],
+                source=cls._unescape(fields[sep + 2]),
+                super_options=fields[sep + 3] if len(fields) > sep + 3 else ""
+            )
+            mounts[entry.mount_point] = entry
+        return mounts
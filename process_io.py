@@ -0,0 +1,246 @@
+"""
+Process I/O module for SSDsaver.
+Samples write counters from /proc/[pid]/io and ranks applications by how
+much they write to disk, including apps SSDsaver does not manage yet.
+"""
+
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app_detector import AppDetector
+
+
+@dataclass
+class WriterInfo:
+    """Disk writes attributed to one application or process name"""
+    key: str                      # AppDetector.APPS id, or process name
+    display_name: str
+    app_id: Optional[str] = None  # None for processes that are not a known app
+    bytes_written: int = 0        # since the sampler started
+    bytes_per_second: float = 0.0
+    processes: int = 0            # live processes seen writing
+
+    @property
+    def mb_per_hour(self) -> float:
+        return self.bytes_per_second * 3600 / (1024 * 1024)
+
+
+class ProcessIOSampler:
+    """Incremental per-process write accounting.
+
+    Each sample reads only /proc/[pid]/io for every process; the owning
+    group (app id or process name) is looked up only for processes that
+    wrote since the previous sample. Per pid we keep a single tuple
+    (group, write_bytes, cancelled_write_bytes, parent pid), so memory and
+    work stay linear in the number of processes.
+
+    When a parent reaps a child the kernel adds the child's counters to
+    the parent's, which would count the child's writes a second time. The
+    parent pid is read (once) when a process first has non-zero counters,
+    and the counters last seen for a child that has since gone are taken
+    off its parent's delta.
+
+    Counted bytes are write_bytes - cancelled_write_bytes, i.e. data that
+    actually reached (or is queued for) the block layer. Without root only
+    the current user's processes are readable.
+    """
+
+    def __init__(self, proc: str = "/proc"):
+        self.proc = proc
+        self._pids: Dict[int, Tuple[str, int, int, Optional[int]]] = {}
+        self._totals: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._started: Optional[float] = None
+        self._last: Optional[float] = None
+        self._last_deltas: Dict[str, int] = {}
+        self._interval = 0.0
+        self._exe_groups = self._build_exe_groups()
+
+    @staticmethod
+    def _build_exe_groups() -> Dict[str, str]:
+        """Executable/path component name -> app id"""
+        groups = {}
+        for app_id, app_def in AppDetector.APPS.items():
+            for name in app_def["executables"] + app_def.get("processes", []):
+                if name != "true":  # placeholder for always-available apps
+                    groups[name.lower()] = app_id
+        return groups
+
+    def _read_counters(self, pid: int) -> Optional[Tuple[int, int]]:
+        try:
+            with open(f"{self.proc}/{pid}/io", "rb") as f:
+                fields = f.read().split()
+            # rchar wchar syscr syscw read_bytes write_bytes cancelled_write_bytes
+            return int(fields[11]), int(fields[13])
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _read_ppid(self, pid: int) -> Optional[int]:
+        try:
+            with open(f"{self.proc}/{pid}/status", "rb") as f:
+                for line in f:
+                    if line.startswith(b"PPid:"):
+                        return int(line.split()[1])
+        except (OSError, IndexError, ValueError):
+            pass
+        return None
+
+    def _resolve_group(self, pid: int) -> str:
+        """App id matched by executable path, otherwise the process name"""
+        try:
+            exe = os.readlink(f"{self.proc}/{pid}/exe")
+        except OSError:
+            exe = ""
+        if exe:
+            # Match the binary and its install directory
+            # (e.g. /opt/google/chrome/chrome, /opt/vivaldi/vivaldi-bin)
+            for part in reversed(exe.lower().split("/")):
+                app_id = self._exe_groups.get(part)
+                if app_id:
+                    return app_id
+
+        try:
+            with open(f"{self.proc}/{pid}/comm") as f:
+                comm = f.read().strip()
+        except OSError:
+            comm = os.path.basename(exe) or "?"
+        app_id = self._exe_groups.get(comm.lower())
+        if app_id:
+            return app_id
+        # Collapse per-CPU kernel threads (kworker/u8:2 -> kworker)
+        return comm.split("/", 1)[0]
+
+    def sample(self, now: float = None) -> Dict[str, int]:
+        """Read all processes once. Returns bytes written per group since
+        the previous sample (empty on the first call, which only primes)."""
+        now = now if now is not None else time.monotonic()
+        priming = self._last is None
+        seen = {}
+        deltas: Dict[str, int] = {}
+        counts: Dict[str, int] = {}
+
+        try:
+            entries = os.listdir(self.proc)
+        except OSError:
+            entries = []
+
+        readings: Dict[int, Tuple[int, int]] = {}
+        for name in entries:
+            if not name.isdigit():
+                continue
+            pid = int(name)
+            counters = self._read_counters(pid)
+            if counters is not None:
+                readings[pid] = counters
+
+        # A pid leaves /proc only once it has been reaped, after the kernel
+        # added its counters to the parent's: what was already counted for
+        # it comes off the parent's delta instead of being counted twice
+        reaped: Dict[int, int] = {}
+        for pid, (_, written, cancelled, ppid) in self._pids.items():
+            if ppid and pid not in readings:
+                reaped[ppid] = reaped.get(ppid, 0) + written - cancelled
+
+        for pid, (written, cancelled) in readings.items():
+            previous = self._pids.get(pid)
+            if previous is not None and written >= previous[1]:
+                group, ppid = previous[0], previous[3]
+                delta = (written - previous[1]) - (cancelled - previous[2])
+                # Clamped: an auto-reaped child (SIGCHLD ignored) is not
+                # added to its parent at all
+                delta = max(0, delta - reaped.get(pid, 0))
+            else:
+                # New process (or a reused pid whose counters restarted)
+                group, ppid = "", None
+                delta = 0 if priming else written - cancelled
+            if ppid is None and (written or cancelled):
+                ppid = self._read_ppid(pid)
+
+            if delta > 0:
+                # Resolved only for writers, and again on each write, since a
+                # fresh pid may still be between fork and exec
+                group = self._resolve_group(pid)
+                deltas[group] = deltas.get(group, 0) + delta
+            seen[pid] = (group, written, cancelled, ppid)
+            if group:
+                counts[group] = counts.get(group, 0) + 1
+
+        # Exited processes drop out here; writes they made after the last
+        # sample show up in the parent's delta once it reaps them
+        self._pids = seen
+        self._counts = counts
+
+        if priming:
+            self._started = now
+        else:
+            for group, delta in deltas.items():
+                self._totals[group] = self._totals.get(group, 0) + delta
+            self._interval = now - self._last
+        self._last = now
+        self._last_deltas = deltas
+        return deltas
+
+    def leaderboard(self, limit: int = 10, recent: bool = False) -> List[WriterInfo]:
+        """Groups ranked by write rate since start (or over the last interval)"""
+        if recent:
+            source, elapsed = self._last_deltas, self._interval
+        else:
+            source = self._totals
+            elapsed = (self._last - self._started) if self._started is not None else 0.0
+
+        writers = []
+        for group, total in source.items():
+            app_def = AppDetector.APPS.get(group)
+            writers.append(WriterInfo(
+                key=group,
+                display_name=app_def["display_name"] if app_def else group,
+                app_id=group if app_def else None,
+                bytes_written=self._totals.get(group, 0),
+                bytes_per_second=total / elapsed if elapsed > 0 else 0.0,
+                processes=self._counts.get(group, 0)
+            ))
+        writers.sort(key=lambda w: w.bytes_per_second, reverse=True)
+        return writers[:limit]
+
+    def process_count(self) -> int:
+        return len(self._pids)
+
+
+def main():
+    """Print a write-rate leaderboard every interval"""
+    parser = argparse.ArgumentParser(description="Rank processes by disk writes")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between samples")
+    parser.add_argument("--count", type=int, default=0, help="number of reports (0 = forever)")
+    parser.add_argument("--top", type=int, default=15, help="rows per report")
+    args = parser.parse_args()
+
+    sampler = ProcessIOSampler()
+    sampler.sample()
+    reports = 0
+    try:
+        while args.count == 0 or reports < args.count:
+            time.sleep(args.interval)
+            started = time.perf_counter()
+            sampler.sample()
+            cost_ms = (time.perf_counter() - started) * 1000
+            reports += 1
+
+            print(f"\n{sampler.process_count()} processes, sampled in {cost_ms:.1f} ms")
+            print(f"{'writer':<28}{'procs':>6}{'now MB/h':>11}{'avg MB/h':>11}{'total MB':>10}  status")
+            recent = {w.key: w for w in sampler.leaderboard(limit=sys.maxsize, recent=True)}
+            for writer in sampler.leaderboard(args.top):
+                now_rate = recent[writer.key].mb_per_hour if writer.key in recent else 0.0
+                status = "known app" if writer.app_id else ""
+                print(f"{writer.display_name[:27]:<28}{writer.processes:>6}{now_rate:>11.1f}"
+                      f"{writer.mb_per_hour:>11.1f}{writer.bytes_written / (1024 * 1024):>10.1f}  {status}")
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+RAM accounting module for SSDsaver.
+Works out how much RAM SSDsaver's tmpfs and zram mounts actually consume,
+as opposed to the sizes configured for them, from /proc/meminfo, statvfs
+and zram's mm_stat.
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import Dict, List
+
+from mount_table import MountEntry, MountTable
+
+MB = 1024 * 1024
+
+
+@dataclass
+class RamAccount:
+    """RAM consumed by SSDsaver's mounts, in bytes"""
+    mounts: int = 0           # filesystems, counting a bind-mounted pool once
+    tmpfs_used: int = 0       # data in our tmpfs mounts (resident or swapped)
+    tmpfs_swapped: int = 0    # estimated part of tmpfs_used that is in swap
+    zram_data: int = 0        # uncompressed data in our zram devices
+    zram_used: int = 0        # RAM used by those devices (compressed + overhead)
+    shmem: int = 0            # system-wide Shmem
+    swap_cached: int = 0      # system-wide SwapCached
+    mem_available: int = 0    # system-wide MemAvailable
+
+    @property
+    def resident(self) -> int:
+        """RAM actually used right now"""
+        return self.tmpfs_used - self.tmpfs_swapped + self.zram_used
+
+    @property
+    def resident_mb(self) -> int:
+        return self.resident // MB
+
+
+class RamAccounting:
+    """Measures the real RAM cost of log2ram-managed mounts.
+
+    tmpfs pages are counted in Shmem while resident and drop out of it
+    once swapped, whereas statvfs keeps counting them. So the difference
+    between all tmpfs usage and Shmem is (at least) what is swapped out;
+    it is attributed to our mounts in proportion to their usage. Other
+    shared memory (memfd, SysV shm) also counts in Shmem and hides swap,
+    so the estimate is a lower bound.
+
+    Each filesystem is counted once, so log2ram's pool (one tmpfs or zram
+    device bind-mounted onto every folder) is not multiplied by the
+    number of folders.
+
+    Everything read here is in-memory kernel state; measure() takes well
+    under a millisecond.
+    """
+
+    MEMINFO = "/proc/meminfo"
+    TMPFS_SOURCE = "log2ram"  # source name log2ram gives its tmpfs mounts
+
+    def __init__(self, mount_table: MountTable = None):
+        self.mount_table = mount_table or MountTable()
+
+    @classmethod
+    def read_meminfo(cls) -> Dict[str, int]:
+        """/proc/meminfo in bytes"""
+        result = {}
+        try:
+            with open(cls.MEMINFO) as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    fields = value.split()
+                    if fields:
+                        result[key] = int(fields[0]) * (1024 if len(fields) > 1 else 1)
+        except (OSError, ValueError):
+            pass
+        return result
+
+    @staticmethod
+    def read_zram_stat(device: str) -> Dict[str, int]:
+        """orig_data_size, compr_data_size and mem_used_total of /dev/zramN"""
+        name = os.path.basename(device)
+        try:
+            with open(f"/sys/block/{name}/mm_stat") as f:
+                fields = [int(v) for v in f.read().split()[:3]]
+        except (OSError, ValueError):
+            return {}
+        if len(fields) < 3:
+            return {}
+        return dict(zip(("orig_data_size", "compr_data_size", "mem_used_total"), fields))
+
+    def measure(self, paths: List[str] = None) -> RamAccount:
+        """Account SSDsaver mounts: tmpfs mounts named "log2ram", plus
+        tmpfs/zram mounts at any of `paths` (e.g. PATH_DISK entries)"""
+        self.mount_table.refresh()
+        wanted = {os.path.realpath(p) for p in paths or []}
+        meminfo = self.read_meminfo()
+        account = RamAccount(
+            shmem=meminfo.get("Shmem", 0),
+            swap_cached=meminfo.get("SwapCached", 0),
+            mem_available=meminfo.get("MemAvailable", 0)
+        )
+
+        # One entry per filesystem, however often it is (bind-)mounted
+        filesystems: Dict[str, MountEntry] = {}
+        ours = set()
+        for entry in self.mount_table.get_ram_mounts():
+            filesystems.setdefault(entry.device, entry)
+            if entry.source == self.TMPFS_SOURCE or entry.mount_point in wanted:
+                ours.add(entry.device)
+
+        all_tmpfs_used = 0
+        for device, entry in filesystems.items():
+            usage = self.mount_table.statvfs_usage(entry.mount_point)
+            used = usage.bytes if usage else 0
+            if entry.fs_type == "tmpfs":
+                all_tmpfs_used += used
+
+            if device not in ours:
+                continue
+            account.mounts += 1
+            if entry.is_zram:
+                stat = self.read_zram_stat(entry.source)
+                account.zram_data += stat.get("orig_data_size", 0)
+                account.zram_used += stat.get("mem_used_total", 0)
+            elif entry.fs_type == "tmpfs":
+                account.tmpfs_used += used
+
+        swapped = max(0, all_tmpfs_used - account.shmem)
+        if swapped and all_tmpfs_used:
+            account.tmpfs_swapped = min(account.tmpfs_used,
+                                        swapped * account.tmpfs_used // all_tmpfs_used)
+        return account
+
+    def close(self):
+        self.mount_table.close()
+
+
+def main():
+    """Print the RAM consumed by SSDsaver's mounts"""
+    accounting = RamAccounting()
+    account = accounting.measure(sys.argv[1:])
+    accounting.close()
+    print(f"Mounts:             {account.mounts}")
+    print(f"tmpfs data:         {account.tmpfs_used / MB:.1f} MB "
+          f"(~{account.tmpfs_swapped / MB:.1f} MB swapped)")
+    print(f"zram:               {account.zram_used / MB:.1f} MB for "
+          f"{account.zram_data / MB:.1f} MB of data")
+    print(f"RAM actually used:  {account.resident / MB:.1f} MB")
+    print(f"System Shmem:       {account.shmem / MB:.1f} MB, "
+          f"SwapCached {account.swap_cached / MB:.1f} MB, "
+          f"MemAvailable {account.mem_available / MB:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
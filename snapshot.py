@@ -0,0 +1,301 @@
+"""
+Snapshot module for SSDsaver.
+Persists a RAM folder as one compressed archive instead of a mirror of its
+files, and restores it into RAM in a single streaming read.
+"""
+
+import argparse
+import os
+import stat
+import sys
+import tarfile
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+SNAPSHOT_NAME = ".ssdsaver.snapshot.tar.gz"
+COMPRESS_LEVEL = 1        # gzip -1: most of the size reduction, little CPU
+XATTR_PREFIX = "SCHILY.xattr."
+
+
+@dataclass
+class SnapshotStats:
+    """What writing or restoring a snapshot did"""
+    mode: str = "snapshot"
+    files: int = 0
+    bytes_in: int = 0          # file data archived or restored
+    bytes_written: int = 0     # archive size written to (or read from) disk
+    removed: int = 0           # mirror entries replaced by the archive
+    errors: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        if self.mode == "skipped":
+            return (f"skipped: archiving ~{self.bytes_in / (1024 * 1024):.1f} MB "
+                    f"would not finish before the deadline")
+        archive = "read" if self.mode == "hydrate" else "written"
+        return (f"{self.mode}: {self.files} files, {self.bytes_in / (1024 * 1024):.1f} MB of data, "
+                f"{self.bytes_written / (1024 * 1024):.1f} MB archive {archive}, "
+                f"{self.removed} mirror entries removed, {self.errors} errors, {self.seconds:.2f} s")
+
+
+class Snapshot:
+    """One archive per folder at <hdd>/.ssdsaver.snapshot.tar.gz.
+
+    The archive is written sequentially to a temporary file, fsynced and
+    renamed over the previous one, so a crash leaves either the old or the
+    new snapshot. Once it is in place, any mirrored files left in the hdd.
+    directory from a previous format are removed.
+
+    The hdd. directory belongs to the folder's owner, but log2ram restores
+    as root, so only archives owned by root and not writable by others are
+    trusted, and members are never written outside the target or through
+    links (links are created last).
+    """
+
+    def __init__(self, hdd_dir: str):
+        self.hdd_dir = hdd_dir.rstrip("/") or "/"
+        self.path = os.path.join(self.hdd_dir, SNAPSHOT_NAME)
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    # --- Writing ----------------------------------------------------------
+
+    def write(self, src: str, filter=None, throttle=None) -> SnapshotStats:
+        """Archive src (skipping paths `filter` excludes) and replace the
+        snapshot atomically, pacing the archive's writes with `throttle`"""
+        started = time.monotonic()
+        stats = SnapshotStats()
+        tmp = self.path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                out = throttle.wrap(raw) if throttle is not None else raw
+                with tarfile.open(fileobj=out, mode="w:gz", compresslevel=COMPRESS_LEVEL,
+                                  format=tarfile.PAX_FORMAT) as tar:
+                    self._add_tree(tar, src.rstrip("/") or "/", "", filter, stats)
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._fsync_dir(self.hdd_dir)
+        stats.bytes_written = os.path.getsize(self.path)
+        stats.removed = self._remove_mirror()
+        stats.seconds = time.monotonic() - started
+        return stats
+
+    def _add_tree(self, tar: tarfile.TarFile, root: str, rel: str, filter, stats: SnapshotStats):
+        directory = os.path.join(root, rel) if rel else root
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            stats.errors += 1
+            print(f"snapshot: {rel or '.'}: {e}", file=sys.stderr)
+            return
+
+        for entry in entries:
+            child = f"{rel}/{entry.name}" if rel else entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            pattern = filter.exclusion(child, is_dir) if filter is not None else None
+            if pattern is not None:
+                filter.count_saved(pattern, self.tree_size(entry.path) if is_dir
+                                   else entry.stat(follow_symlinks=False).st_size)
+                continue
+            try:
+                info = tar.gettarinfo(entry.path, arcname=child)
+                if info is None:
+                    continue  # sockets
+                info.uname = info.gname = ""  # restored by number
+                for name in os.listxattr(entry.path, follow_symlinks=False):
+                    value = os.getxattr(entry.path, name, follow_symlinks=False)
+                    info.pax_headers[XATTR_PREFIX + name] = value.decode("utf-8", "surrogateescape")
+                if info.isreg():
+                    with open(entry.path, "rb") as f:
+                        tar.addfile(info, f)
+                    stats.bytes_in += info.size
+                else:
+                    tar.addfile(info)
+                stats.files += 1
+            except OSError as e:
+                stats.errors += 1
+                print(f"snapshot: {child}: {e}", file=sys.stderr)
+                continue
+            if is_dir:
+                self._add_tree(tar, root, child, filter, stats)
+
+    @classmethod
+    def tree_size(cls, path: str) -> int:
+        """Size of the regular files below path"""
+        total = 0
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        total += cls.tree_size(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+        return total
+
+    def _remove_mirror(self) -> int:
+        """Delete files mirrored by rsync/sync_engine before the switch"""
+        import shutil
+
+        removed = 0
+        with os.scandir(self.hdd_dir) as it:
+            for entry in it:
+                if entry.name == SNAPSHOT_NAME:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.unlink(entry.path)
+                    removed += 1
+                except OSError as e:
+                    print(f"snapshot: cannot remove {entry.path}: {e}", file=sys.stderr)
+        return removed
+
+    @staticmethod
+    def _fsync_dir(path: str):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # --- Restoring --------------------------------------------------------
+
+    @staticmethod
+    def _trusted(st: os.stat_result) -> bool:
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        if os.geteuid() != 0:
+            return st.st_uid == os.geteuid()
+        return st.st_uid == 0 and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+    @staticmethod
+    def _safe_name(name: str) -> Optional[str]:
+        name = os.path.normpath(name)
+        if os.path.isabs(name) or name == ".." or name.startswith("../"):
+            return None
+        return name
+
+    def restore(self, dst: str, filter=None) -> SnapshotStats:
+        """Extract the snapshot into dst in one sequential pass (skipping
+        paths `filter` excludes)"""
+        started = time.monotonic()
+        stats = SnapshotStats(mode="hydrate")
+        dst = dst.rstrip("/") or "/"
+        extract_args = {"filter": "fully_trusted"} if hasattr(tarfile, "fully_trusted_filter") else {}
+        is_root = os.geteuid() == 0
+
+        fd = os.open(self.path, os.O_RDONLY | os.O_NOFOLLOW | os.O_CLOEXEC)
+        with os.fdopen(fd, "rb") as raw:
+            if not self._trusted(os.fstat(raw.fileno())):
+                raise PermissionError(f"{self.path} is not owned by root (or is writable by others)")
+            stats.bytes_written = os.fstat(raw.fileno()).st_size
+
+            links: List[tarfile.TarInfo] = []
+            directories: List[Tuple[str, tarfile.TarInfo]] = []
+            with tarfile.open(fileobj=raw, mode="r|gz") as tar:
+                for member in tar:
+                    name = self._safe_name(member.name)
+                    if name is None or name == "." or member.isdev():
+                        continue
+                    if filter is not None and filter.excluded(name, member.isdir()):
+                        continue
+                    member.name = name
+                    if member.issym() or member.islnk():
+                        # Created last, so nothing is extracted through them
+                        links.append(member)
+                        continue
+                    path = os.path.join(dst, name)
+                    try:
+                        if member.isdir():
+                            os.makedirs(path, exist_ok=True)
+                            directories.append((path, member))
+                        else:
+                            tar.extract(member, dst, set_attrs=True, numeric_owner=True, **extract_args)
+                            self._restore_xattrs(path, member)
+                            stats.bytes_in += member.size
+                        stats.files += 1
+                    except OSError as e:
+                        stats.errors += 1
+                        print(f"snapshot: {name}: {e}", file=sys.stderr)
+
+            for member in links:
+                path = os.path.join(dst, member.name)
+                try:
+                    if member.islnk():
+                        target = self._safe_name(member.linkname)
+                        if target is None:
+                            continue
+                        os.link(os.path.join(dst, target), path)
+                    else:
+                        os.symlink(member.linkname, path)
+                        if is_root:
+                            os.chown(path, member.uid, member.gid, follow_symlinks=False)
+                        os.utime(path, (member.mtime, member.mtime), follow_symlinks=False)
+                    stats.files += 1
+                except OSError as e:
+                    stats.errors += 1
+                    print(f"snapshot: {member.name}: {e}", file=sys.stderr)
+
+            # Deepest first, after their contents, so mtimes stick
+            for path, member in reversed(directories):
+                try:
+                    if is_root:
+                        os.chown(path, member.uid, member.gid)
+                    os.chmod(path, member.mode)
+                    self._restore_xattrs(path, member)
+                    os.utime(path, (member.mtime, member.mtime))
+                except OSError as e:
+                    stats.errors += 1
+                    print(f"snapshot: {member.name}: {e}", file=sys.stderr)
+
+        stats.seconds = time.monotonic() - started
+        return stats
+
+    @staticmethod
+    def _restore_xattrs(path: str, member: tarfile.TarInfo):
+        for key, value in member.pax_headers.items():
+            if key.startswith(XATTR_PREFIX):
+                try:
+                    os.setxattr(path, key[len(XATTR_PREFIX):], value.encode("utf-8", "surrogateescape"),
+                                follow_symlinks=False)
+                except OSError:
+                    pass  # e.g. security.* without privileges, or no xattr support
+
+
+def main():
+    """Write or restore a snapshot by hand (log2ram goes through
+    `sync_engine.py snapshot` and `sync_engine.py hydrate`)"""
+    parser = argparse.ArgumentParser(description="Single-file snapshots of RAM folders")
+    sub = parser.add_subparsers(dest="command", required=True)
+    write_parser = sub.add_parser("write", help="archive SRC into HDD/" + SNAPSHOT_NAME)
+    write_parser.add_argument("src")
+    write_parser.add_argument("hdd")
+    restore_parser = sub.add_parser("restore", help="extract HDD/" + SNAPSHOT_NAME + " into DST")
+    restore_parser.add_argument("hdd")
+    restore_parser.add_argument("dst")
+    args = parser.parse_args()
+
+    if args.command == "write":
+        stats = Snapshot(args.hdd).write(args.src)
+    else:
+        stats = Snapshot(args.hdd).restore(args.dst)
+    print(stats.summary())
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
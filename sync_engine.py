@@ -0,0 +1,1704 @@
+"""
+Sync engine module for SSDsaver.
+Writes RAM folders back to disk, copying only what changed. A small
+daemon records the files modified under each log2ram mount, so `write`
+does work proportional to the changes instead of walking both trees.
+"""
+
+import argparse
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import re
+import select
+import shutil
+import signal
+import sqlite3
+import stat
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+import fastcopy
+import fsnotify
+from config_manager import ConfigManager
+from mount_table import MountTable
+from snapshot import Snapshot, SnapshotStats
+from throttle import Throttle
+
+RUN_DIR = "/run/ssdsaver"
+POOL_DIR = RUN_DIR + "/pool"  # log2ram's shared RAM pool (POOL=true)
+FULL_MARKER = "*"  # dirty-log entry meaning "compare everything"
+WRITE_RATE_PATH = RUN_DIR + "/write-rate"  # measured write-back throughput
+DEFAULT_WRITE_RATE = 20 * 1024 * 1024      # bytes/s assumed until one is measured
+EX_DEADLINE = 75  # exit status: not (completely) synced before --deadline
+DURABILITY_MODES = ("none", "syncfs", "fsync")
+
+
+def hdd_path(ram_path: str) -> str:
+    """log2ram keeps the disk copy of /a/b bind-mounted at /a/hdd.b"""
+    ram_path = ram_path.rstrip("/")
+    return os.path.join(os.path.dirname(ram_path), "hdd." + os.path.basename(ram_path))
+
+
+def pool_path(ram_path: str) -> str:
+    """Directory in the pool that log2ram bind-mounts onto ram_path"""
+    name = ram_path.strip("/").replace("%", "%25").replace("/", "%2F")
+    return os.path.join(POOL_DIR, name)
+
+
+def read_path_modes() -> Dict[str, str]:
+    """RAM folder -> "safe", "lossy", "overlay" or "archive", from PATH_DISK and the matching
+    PATH_MODE entries in /etc/log2ram.conf (written by SSDsaver from
+    /etc/ssdsaver/folders.conf). Missing modes mean safe."""
+    config = ConfigManager().read_config()
+    paths = (config.get("PATH_DISK") or "/var/log").split(";")
+    modes = (config.get("PATH_MODE") or "").split(";")
+    result = {}
+    for i, path in enumerate(paths):
+        if path.strip():
+            mode = modes[i] if i < len(modes) else ""
+            result[path.rstrip("/")] = mode if mode in ("lossy", "overlay", "archive") else "safe"
+    return result
+
+
+def filter_stats_path(ram_path: str) -> str:
+    return os.path.join(RUN_DIR, quote(ram_path.rstrip("/") or "/", safe="") + ".filtered")
+
+
+def save_filter_stats(ram_path: str, filter: "Filter"):
+    """Record what each exclude rule saved in this sync, for the UI"""
+    if not filter.saved:
+        return
+    path = filter_stats_path(ram_path)
+    try:
+        os.makedirs(RUN_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"time": time.time(), "saved": filter.saved}, f)
+        os.chmod(path + ".tmp", 0o644)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"sync_engine: cannot save {path}: {e}", file=sys.stderr)
+
+
+def read_filter_stats(ram_path: str) -> Dict[str, int]:
+    """Exclude pattern -> bytes it saved in the folder's last sync"""
+    try:
+        with open(filter_stats_path(ram_path)) as f:
+            return {k: int(v) for k, v in json.load(f)["saved"].items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+
+def read_path_disk(tracked_only: bool = False) -> List[str]:
+    """RAM folders from PATH_DISK. Only safe and archive folders use dirty
+    logs: lossy ones are never written back and overlay ones merge their
+    upper layer."""
+    return [path for path, mode in read_path_modes().items()
+            if not tracked_only or mode in ("safe", "archive")]
+
+
+class DirtyLog:
+    """Relative paths changed under one RAM folder since the last sync.
+
+    Files in RUN_DIR, named after the quoted RAM path:
+      .dirty    NUL-separated entries appended by the watch daemon
+      .syncing  entries claimed by a running (or failed) sync
+      .watch    pid of the daemon while it tracks this folder
+
+    The daemon appends under flock and first checks that its descriptor
+    still refers to the file at .dirty; a sync claims the entries by
+    renaming .dirty under the same lock, so the daemon notices the new
+    inode and starts a fresh file. Entries are only trusted while .watch
+    names a live daemon; otherwise callers fall back to a full compare.
+    """
+
+    def __init__(self, ram_path: str, run_dir: str = RUN_DIR):
+        base = os.path.join(run_dir, quote(ram_path.rstrip("/") or "/", safe=""))
+        self.ram_path = ram_path
+        self.path = base + ".dirty"
+        self.syncing_path = base + ".syncing"
+        self.watch_path = base + ".watch"
+        self.lock_path = base + ".lock"
+        self._fd = None
+        self._recorded: Set[str] = set()
+
+    # --- Daemon side ------------------------------------------------------
+
+    def append(self, entries: Iterable[str]):
+        """Record entries, skipping ones already in the current file"""
+        entries = list(dict.fromkeys(entries))
+        if not entries:
+            return
+
+        for _ in range(2):
+            if self._fd is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o600)
+                self._recorded.clear()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                try:
+                    current = os.stat(self.path).st_ino == os.fstat(self._fd).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    # Only entries in this file may be skipped: ones recorded
+                    # in a file a sync has since claimed must be added again
+                    entries = [e for e in entries if e not in self._recorded]
+                    data = b"".join(os.fsencode(e) + b"\0" for e in entries)
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(self._fd, view):]
+                    self._recorded.update(entries)
+                    return
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            # A sync claimed the file: start a new one
+            os.close(self._fd)
+            self._fd = None
+
+    def mark_full(self):
+        self._recorded.discard(FULL_MARKER)
+        self.append([FULL_MARKER])
+
+    def set_watching(self, pid: int):
+        with open(self.watch_path, "w") as f:
+            f.write(str(pid))
+
+    def clear_watching(self):
+        try:
+            os.unlink(self.watch_path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    # --- Sync side --------------------------------------------------------
+
+    def is_tracked(self) -> bool:
+        """True while a live daemon is recording changes for this folder"""
+        try:
+            with open(self.watch_path) as f:
+                pid = int(f.read().strip())
+            os.kill(pid, 0)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def take(self) -> Optional[Set[str]]:
+        """Claim the recorded entries. Returns None if a full compare is
+        needed (not tracked, or the daemon lost events)."""
+        tracked = self.is_tracked()
+        try:
+            fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            fd = None
+
+        if fd is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.path.exists(self.syncing_path):
+                    # A previous sync failed: keep its entries too
+                    with open(fd, "rb", closefd=False) as f, open(self.syncing_path, "ab") as out:
+                        shutil.copyfileobj(f, out)
+                    os.unlink(self.path)
+                else:
+                    os.rename(self.path, self.syncing_path)
+            finally:
+                os.close(fd)
+
+        if not tracked:
+            return None
+        try:
+            with open(self.syncing_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return set()
+        entries = {os.fsdecode(e) for e in data.split(b"\0") if e}
+        if FULL_MARKER in entries:
+            return None
+        return entries
+
+    def done(self):
+        """The claimed entries were synced successfully"""
+        try:
+            os.unlink(self.syncing_path)
+        except FileNotFoundError:
+            pass
+
+
+class TailIndex:
+    """What the disk copy of each large file under one RAM folder held
+    after its last sync, so a file that has only grown since (a log) is
+    brought up to date by copying just its new bytes.
+
+    Kept in RUN_DIR as <quoted RAM path>.tails, a JSON object mapping each
+    relative path to [inode, size, mtime_ns, fingerprint]: the inode of
+    the RAM file and the size and mtime the disk copy was left with, and
+    a hash of the disk copy's first and last SAMPLE bytes. A file counts
+    as appended when its disk copy still has that size and mtime, the RAM
+    file is the same inode and larger, and its bytes at those two places
+    hash the same. A rotated (replaced) or truncated file, or one
+    rewritten at its start or where it used to end, fails one of these and
+    is compared block by block as before; rewrites elsewhere in a growing
+    file are not looked for. The index is lost at reboot; the first sync
+    after it rebuilds it.
+    """
+
+    MIN_SIZE = 256 * 1024   # smaller files are cheap to compare in full
+    SAMPLE = 64 * 1024
+
+    def __init__(self, ram_path: str, run_dir: str = RUN_DIR):
+        self.path = os.path.join(run_dir, quote(ram_path.rstrip("/") or "/", safe="") + ".tails")
+        self._changed = False
+        try:
+            with open(self.path) as f:
+                self._entries: Dict[str, list] = json.load(f)
+            if not isinstance(self._entries, dict):
+                raise ValueError(self.path)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    @classmethod
+    def fingerprint(cls, fd: int, size: int) -> str:
+        """Hash of the first and the last SAMPLE bytes of fd's first size bytes"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(os.pread(fd, min(cls.SAMPLE, size), 0))
+        digest.update(os.pread(fd, min(cls.SAMPLE, size), max(0, size - cls.SAMPLE)))
+        return digest.hexdigest()
+
+    def known_size(self, rel: str, st: os.stat_result, dst_st: os.stat_result) -> Optional[int]:
+        """Size of the disk copy if rel may only have grown since it was
+        written (the fingerprint still has to be checked), else None"""
+        entry = self._entries.get(rel)
+        if (not isinstance(entry, list) or len(entry) != 4 or entry[0] != st.st_ino
+                or entry[1] != dst_st.st_size or entry[2] != dst_st.st_mtime_ns
+                or st.st_size <= entry[1]):
+            return None
+        return entry[1]
+
+    def matches(self, rel: str, fd: int, size: int) -> bool:
+        """Whether fd's first size bytes look like the disk copy's"""
+        return self.fingerprint(fd, size) == self._entries[rel][3]
+
+    def record(self, rel: str, st: os.stat_result, dst: str):
+        """Remember the disk copy just written from the RAM file st"""
+        if st.st_size < self.MIN_SIZE:
+            self.forget(rel)
+            return
+        fd = os.open(dst, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            size = os.fstat(fd).st_size
+            self._entries[rel] = [st.st_ino, size, st.st_mtime_ns, self.fingerprint(fd, size)]
+        finally:
+            os.close(fd)
+        self._changed = True
+
+    def forget(self, rel: str):
+        """Drop rel and everything below it"""
+        prefix = rel + "/"
+        gone = [r for r in self._entries if r == rel or not rel or r.startswith(prefix)]
+        for r in gone:
+            del self._entries[r]
+        self._changed = self._changed or bool(gone)
+
+    def save(self):
+        if not self._changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self._entries, f)
+            os.replace(self.path + ".tmp", self.path)
+            self._changed = False
+        except OSError as e:
+            print(f"sync_engine: cannot save {self.path}: {e}", file=sys.stderr)
+
+
+class Filter:
+    """rsync-style include/exclude rules; the first matching rule wins.
+
+    Patterns containing "/" match the path relative to the folder (a
+    leading "/" anchors them), others match the last component; "*"
+    stops at "/", "**" does not, and a trailing "/" matches directories
+    only. An excluded directory excludes everything below it.
+
+    Patterns are compiled once; `saved` collects, per exclude pattern, the
+    bytes a sync did not write because of it.
+    """
+
+    def __init__(self, rules: List[Tuple[bool, str]] = None):
+        self.rules = [(include, *self._compile(pattern), pattern) for include, pattern in rules or []]
+        self.saved: Dict[str, int] = {pattern: 0 for include, pattern in rules or [] if not include}
+
+    @staticmethod
+    def _compile(pattern: str):
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = pattern.startswith("/")
+        pattern = pattern.lstrip("/")
+        full_path = anchored or "/" in pattern
+
+        regex = ""
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith("**", i):
+                regex += ".*"
+                i += 2
+            elif pattern[i] == "*":
+                regex += "[^/]*"
+                i += 1
+            elif pattern[i] == "?":
+                regex += "[^/]"
+                i += 1
+            else:
+                regex += re.escape(pattern[i])
+                i += 1
+        if full_path and not anchored:
+            regex = "(?:.*/)?" + regex
+        return re.compile(regex + r"\Z"), full_path, dir_only
+
+    def _match(self, rel: str, is_dir: bool) -> Optional[Tuple[bool, str]]:
+        for include, regex, full_path, dir_only, pattern in self.rules:
+            if dir_only and not is_dir:
+                continue
+            subject = rel if full_path else rel.rsplit("/", 1)[-1]
+            if regex.match(subject):
+                return include, pattern
+        return None
+
+    def exclusion(self, rel: str, is_dir: bool = False) -> Optional[str]:
+        """Pattern of the rule that excludes rel (or one of its parents)"""
+        if not self.rules or not rel:
+            return None
+        parts = rel.split("/")
+        for depth in range(1, len(parts) + 1):
+            last = depth == len(parts)
+            match = self._match("/".join(parts[:depth]), is_dir if last else True)
+            if match is not None and not match[0]:
+                return match[1]
+        return None
+
+    def excluded(self, rel: str, is_dir: bool = False) -> bool:
+        return self.exclusion(rel, is_dir) is not None
+
+    def count_saved(self, pattern: str, nbytes: int):
+        self.saved[pattern] = self.saved.get(pattern, 0) + nbytes
+
+
+@dataclass
+class SyncStats:
+    """What a sync did"""
+    mode: str = "full"
+    entries: int = 0        # paths examined
+    copied: int = 0         # files (re)written
+    appended: int = 0       # of them, brought up to date by copying only their new tail
+    deleted: int = 0
+    bytes_written: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    pending: int = 0           # estimated bytes to write (with a deadline)
+    incomplete: bool = False   # stopped (or skipped) because of the deadline
+    deferred: int = 0          # SQLite databases too busy to copy consistently
+    durability: str = "none"
+    flushes: int = 0           # fsync/syncfs calls
+    flush_seconds: float = 0.0 # spent in them (included in seconds)
+
+    def summary(self) -> str:
+        if self.mode == "skipped":
+            return (f"skipped: ~{self.pending / (1024 * 1024):.1f} MB to write "
+                    f"would not finish before the deadline")
+        appended = f"{self.appended} appended, " if self.appended else ""
+        result = (f"{self.mode}: {self.entries} checked, {self.copied} copied "
+                  f"({appended}{self.bytes_written / (1024 * 1024):.1f} MB written), "
+                  f"{self.deleted} deleted, {self.errors} errors, {self.seconds:.2f} s")
+        if self.durability != "none":
+            result += f", {self.durability} {self.flush_seconds:.2f} s ({self.flushes} calls)"
+        if self.deferred:
+            result += f", {self.deferred} busy databases left for the next sync"
+        if self.incomplete:
+            result += ", stopped at the deadline"
+        return result
+
+
+class SyncEngine:
+    """Copies a RAM folder onto its disk copy, like
+    `rsync -aAX --inplace --no-whole-file --delete`.
+
+    New files are copied inside the kernel (see fastcopy); changed files
+    are rewritten in place and only blocks that differ are written. Holes
+    stay holes. With a TailIndex, files that have only grown since their
+    last sync get just the new bytes appended instead of being compared.
+    Ownership, mode, timestamps and extended attributes (including POSIX
+    ACLs) are preserved.
+
+    SQLite databases (a browser's history, cookies, indexes...) are live
+    while their folder is written back, and a database copied at another
+    moment than its -wal or -journal is corrupt. Each one is therefore
+    copied as one consistent unit (see _sync_sqlite) and its -shm, which
+    SQLite rebuilds, is never written.
+
+    With a deadline (time.time() seconds) no new file is started once it
+    has passed, so the sync stops cleanly between files. A throttle paces
+    everything written.
+
+    `durability` decides what survives a power loss:
+      none    leave it to the kernel's writeback (files may be torn)
+      syncfs  one syncfs() of the disk copy at the end
+      fsync   each changed file is written to a temporary file, fsynced
+              and renamed over the old one, so it is either old or new.
+              fsyncs are batched: renames and directory fsyncs follow
+              once per FSYNC_BATCH_FILES files or FSYNC_BATCH_BYTES.
+              The temporary file starts as a reflink of the old copy where
+              the filesystem allows, so only changed blocks are written.
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+    FSYNC_BATCH_FILES = 128
+    FSYNC_BATCH_BYTES = 64 * 1024 * 1024
+    TMP_SUFFIX = ".ssdsaver-tmp"
+    SKIP_XATTRS: Tuple[str, ...] = ()  # xattr name prefixes never copied
+    SQLITE_HEADER = b"SQLite format 3\0"
+    SQLITE_JOURNALS = ("-wal", "-journal")
+    SQLITE_SHM = "-shm"
+    SQLITE_TIMEOUT = 0.5        # seconds to wait for a writer before copying without SQLite
+    SQLITE_ATTEMPTS = 3         # copies of a busy database tried per sync
+    SQLITE_LOCKS = True         # the applications' locks are visible on src
+
+    def __init__(self, src: str, dst: str, filter: Filter = None, verbose: bool = False,
+                 deadline: Optional[float] = None, throttle: Optional[Throttle] = None,
+                 durability: str = "none", tails: Optional[TailIndex] = None):
+        self.src = src.rstrip("/") or "/"
+        self.dst = dst.rstrip("/") or "/"
+        self.filter = filter or Filter()
+        self.verbose = verbose
+        self.deadline = deadline
+        self.stats = SyncStats()
+        self.throttle = throttle
+        self.copier = fastcopy.FastCopy()
+        self.copier.throttle = throttle
+        self.durability = durability
+        self.stats.durability = durability
+        self.tails = tails if durability != "fsync" else None
+        self._staged: List[Tuple[str, str, str]] = []   # (rel, temporary file, destination)
+        self._staged_tmp: Set[str] = set()
+        self._staged_removed: Dict[str, str] = {}   # disk path removed at the flush -> its rel
+        self._staged_bytes = 0
+        self.sqlite = True      # copy SQLite databases consistently (off for hydration)
+        self._sqlite_seen: Set[str] = set()
+        self._is_root = os.geteuid() == 0
+
+    def sync(self, dirty: Optional[Set[str]] = None) -> SyncStats:
+        """Full compare when dirty is None, else only the given relative paths"""
+        started = time.monotonic()
+        if dirty is None:
+            self.stats.mode = "full"
+            self._sync_tree("")
+        else:
+            self.stats.mode = "incremental"
+            self._sync_dirty(dirty)
+        self._make_durable()
+        if self.tails is not None:
+            self.tails.save()
+        self.stats.seconds = time.monotonic() - started
+        if self.copier.stats.files:
+            self._log(f"new files: {self.copier.stats.summary()}")
+        return self.stats
+
+    def estimate(self, dirty: Optional[Set[str]] = None) -> int:
+        """Bytes a sync(dirty) would copy: the size of every file that
+        differs from the disk copy (a file rewritten in place may write less)"""
+        if dirty is None:
+            dirty = {""}
+        total = 0
+        for rel in dirty:
+            try:
+                total += self._pending_bytes(rel, os.lstat(self._paths(rel)[0]))
+            except OSError:
+                continue
+        return total
+
+    def _past_deadline(self) -> bool:
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.stats.incomplete = True
+        return self.stats.incomplete
+
+    def _log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def _error(self, rel: str, error: OSError):
+        self.stats.errors += 1
+        print(f"sync_engine: {rel or '.'}: {error}", file=sys.stderr)
+
+    def _excluded(self, rel: str, st: os.stat_result) -> bool:
+        """Whether a filter rule skips rel; what the sync would otherwise
+        have copied counts towards that rule's saving"""
+        pattern = self.filter.exclusion(rel, stat.S_ISDIR(st.st_mode))
+        if pattern is None:
+            return False
+        self.filter.count_saved(pattern, self._pending_bytes(rel, st))
+        return True
+
+    def _pending_bytes(self, rel: str, st: os.stat_result) -> int:
+        """Size of the files under rel that differ from the disk copy"""
+        src, dst = self._paths(rel)
+        if stat.S_ISREG(st.st_mode):
+            try:
+                dst_st = os.lstat(dst)
+            except OSError:
+                return st.st_size
+            if dst_st.st_size == st.st_size and dst_st.st_mtime_ns == st.st_mtime_ns:
+                return 0
+            known = self.tails.known_size(rel, st, dst_st) if self.tails is not None else None
+            return st.st_size - (known or 0)
+        if not stat.S_ISDIR(st.st_mode):
+            return 0
+        total = 0
+        try:
+            with os.scandir(src) as it:
+                for entry in it:
+                    try:
+                        total += self._pending_bytes(f"{rel}/{entry.name}", entry.stat(follow_symlinks=False))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return total
+
+    def _paths(self, rel: str) -> Tuple[str, str]:
+        if not rel:
+            return self.src, self.dst
+        return os.path.join(self.src, rel), os.path.join(self.dst, rel)
+
+    def _sync_dirty(self, dirty: Set[str]):
+        done_trees: List[str] = []
+        parents = set()
+        for rel in sorted(dirty):
+            if self._past_deadline():
+                return
+            if any(rel.startswith(t + "/") for t in done_trees):
+                continue
+            parents.add(os.path.dirname(rel))
+            src, _ = self._paths(rel)
+            try:
+                st = os.lstat(src)
+            except FileNotFoundError:
+                self._delete(rel)
+                continue
+            except OSError as e:
+                self._error(rel, e)
+                continue
+            if self._excluded(rel, st):
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                # New or moved-in directory: its contents produced no events
+                self._sync_tree(rel)
+                done_trees.append(rel)
+                continue
+            try:
+                self._ensure_parents(rel)
+            except OSError as e:
+                self._error(rel, e)
+                continue
+            self._sync_entry(rel, st)
+
+        # Directory timestamps changed with their entries
+        for rel in sorted(parents, key=len, reverse=True):
+            src, dst = self._paths(rel)
+            try:
+                st = os.lstat(src)
+                if stat.S_ISDIR(st.st_mode) and os.path.isdir(dst):
+                    self._copy_metadata(src, dst, st)
+            except OSError:
+                continue
+
+    def _ensure_parents(self, rel: str):
+        parts = rel.split("/")[:-1]
+        for depth in range(1, len(parts) + 1):
+            sub = "/".join(parts[:depth])
+            src, dst = self._paths(sub)
+            if not os.path.isdir(dst):
+                st = os.lstat(src)
+                if os.path.lexists(dst):
+                    os.unlink(dst)
+                os.mkdir(dst, stat.S_IMODE(st.st_mode))
+                self._copy_metadata(src, dst, st)
+
+    def _sync_tree(self, rel: str):
+        """Compare a whole subtree (quick check on size and mtime)"""
+        src, dst = self._paths(rel)
+        try:
+            st = os.lstat(src)
+        except OSError as e:
+            self._error(rel, e)
+            return
+        if rel and self._excluded(rel, st):
+            return
+        if not stat.S_ISDIR(st.st_mode):
+            self._sync_entry(rel, st)
+            return
+
+        self.stats.entries += 1
+        try:
+            if os.path.lexists(dst) and not os.path.isdir(dst):
+                self._remove(dst)
+            if not os.path.lexists(dst):
+                if rel:
+                    self._ensure_parents(rel)
+                os.mkdir(dst, stat.S_IMODE(st.st_mode))
+            present = set()
+            with os.scandir(src) as it:
+                entries = list(it)
+        except OSError as e:
+            self._error(rel, e)
+            return
+
+        for entry in entries:
+            if self._past_deadline():
+                return
+            child = f"{rel}/{entry.name}" if rel else entry.name
+            if self._drop_leftover(child):
+                continue  # not present: a leftover on the other side goes too
+            present.add(entry.name)
+            try:
+                child_st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(child_st.st_mode):
+                self._sync_tree(child)
+            else:
+                self._sync_entry(child, child_st)
+
+        # --delete: drop what no longer exists in RAM (excluded files are kept)
+        try:
+            with os.scandir(dst) as it:
+                extra = [e for e in it if e.name not in present and e.path not in self._staged_tmp]
+        except OSError as e:
+            self._error(rel, e)
+            extra = []
+        for entry in extra:
+            child = f"{rel}/{entry.name}" if rel else entry.name
+            if not self.filter.excluded(child, entry.is_dir(follow_symlinks=False)):
+                self._delete(child)
+
+        try:
+            self._copy_metadata(src, dst, st)
+        except OSError as e:
+            self._error(rel, e)
+
+    def _sync_entry(self, rel: str, st: os.stat_result):
+        """Bring one non-directory entry up to date"""
+        if self._drop_leftover(rel) or self._excluded(rel, st):
+            return
+        self.stats.entries += 1
+        src, dst = self._paths(rel)
+        try:
+            try:
+                dst_st = os.lstat(dst)
+            except FileNotFoundError:
+                dst_st = None
+            if dst_st is not None and stat.S_IFMT(dst_st.st_mode) != stat.S_IFMT(st.st_mode):
+                self._remove(dst)
+                dst_st = None
+
+            if stat.S_ISREG(st.st_mode):
+                database = self._sqlite_database(rel, st, dst_st)
+                if database is not None:
+                    self._sync_sqlite(database)
+                    return
+                if (dst_st is None or dst_st.st_size != st.st_size
+                        or dst_st.st_mtime_ns != st.st_mtime_ns):
+                    if self.durability == "fsync":
+                        self._stage_file(rel, st, dst_st is not None)
+                        return
+                    appended = self._append_tail(rel, st, dst_st)
+                    if appended is None:
+                        self.stats.bytes_written += self._copy_file(src, dst, dst_st is not None)
+                        self._log(f"copied {rel}")
+                    else:
+                        self.stats.bytes_written += appended
+                        self.stats.appended += 1
+                        self._log(f"appended to {rel}")
+                    self.stats.copied += 1
+                    if self.tails is not None:
+                        self.tails.record(rel, st, dst)
+                elif not self._metadata_differs(st, dst_st):
+                    return
+            elif stat.S_ISLNK(st.st_mode):
+                target = os.readlink(src)
+                if dst_st is not None and os.readlink(dst) == target:
+                    if not self._metadata_differs(st, dst_st):
+                        return
+                else:
+                    if dst_st is not None:
+                        os.unlink(dst)
+                    os.symlink(target, dst)
+                    self.stats.copied += 1
+            elif stat.S_ISFIFO(st.st_mode):
+                if dst_st is None:
+                    os.mkfifo(dst, stat.S_IMODE(st.st_mode))
+            elif stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+                if dst_st is None and self._is_root:
+                    os.mknod(dst, st.st_mode, st.st_rdev)
+            else:
+                return  # sockets are not copied
+            self._copy_metadata(src, dst, st)
+        except OSError as e:
+            self._error(rel, e)
+
+    @staticmethod
+    def _metadata_differs(st: os.stat_result, dst_st: os.stat_result) -> bool:
+        return (st.st_mode != dst_st.st_mode or st.st_uid != dst_st.st_uid
+                or st.st_gid != dst_st.st_gid or st.st_mtime_ns != dst_st.st_mtime_ns)
+
+    def _copy_file(self, src: str, dst: str, exists: bool) -> int:
+        """Copy src onto dst: a new or empty dst is filled by the kernel,
+        an existing one is rewritten in place, writing only blocks that
+        differ. Returns the number of bytes written."""
+        written = 0
+        with open(src, "rb") as fin:
+            flags = os.O_RDWR | os.O_CREAT | os.O_CLOEXEC
+            fd = os.open(dst, flags, 0o600)
+            try:
+                fd_in = fin.fileno()
+                size = os.fstat(fd_in).st_size
+                dst_size = os.fstat(fd).st_size if exists else 0
+                if dst_size == 0:
+                    return self.copier.copy(fd_in, fd, size)
+                if dst_size > size:
+                    os.ftruncate(fd, size)
+                offset = 0
+                for start, length in fastcopy.data_segments(fd_in, size):
+                    written += self._clear_range(fd, offset, start - offset)
+                    written += self._write_changed(fd_in, fd, start, length)
+                    offset = start + length
+                written += self._clear_range(fd, offset, size - offset)
+                os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+        return written
+
+    def _append_tail(self, rel: str, st: os.stat_result, dst_st: Optional[os.stat_result]) -> Optional[int]:
+        """Copy only what was appended to rel since the disk copy was
+        written. Returns the bytes written, or None if rel did not just
+        grow (or isn't in the tail index) and needs a full compare."""
+        if self.tails is None or dst_st is None:
+            return None
+        known = self.tails.known_size(rel, st, dst_st)
+        if known is None:
+            return None
+        src, dst = self._paths(rel)
+        with open(src, "rb") as fin:
+            fd_in = fin.fileno()
+            size = os.fstat(fd_in).st_size
+            if size <= known or not self.tails.matches(rel, fd_in, known):
+                return None
+            fd = os.open(dst, os.O_WRONLY | os.O_CLOEXEC)
+            try:
+                return self.copier.copy(fd_in, fd, size, known)
+            finally:
+                os.close(fd)
+
+    def _drop_leftover(self, rel: str) -> bool:
+        """Whether rel is a temporary file of an fsync write-back that was
+        interrupted. It is removed: from the disk copy when hydrating, and
+        from RAM if an earlier hydration copied it there."""
+        name = os.path.basename(rel)
+        if not (name.startswith(".") and name.endswith(self.TMP_SUFFIX)):
+            return False
+        try:
+            os.unlink(self._paths(rel)[0])
+            self._log(f"removed leftover {rel}")
+        except OSError:
+            pass
+        return True
+
+    def _tmp_path(self, dst: str) -> str:
+        """Hidden temporary file next to dst (a leftover one is removed)"""
+        tmp = os.path.join(os.path.dirname(dst), "." + os.path.basename(dst) + self.TMP_SUFFIX)
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        return tmp
+
+    def _is_sqlite(self, rel: str) -> bool:
+        try:
+            with open(self._paths(rel)[0], "rb") as f:
+                return f.read(len(self.SQLITE_HEADER)) == self.SQLITE_HEADER
+        except OSError:
+            return False
+
+    def _sqlite_database(self, rel: str, st: os.stat_result,
+                         dst_st: Optional[os.stat_result]) -> Optional[str]:
+        """The SQLite database rel is, or is the -wal, -journal or -shm
+        of; None for other files. A file that looks unchanged is not
+        opened to find out."""
+        if not self.sqlite:
+            return None
+        for suffix in self.SQLITE_JOURNALS + (self.SQLITE_SHM,):
+            if rel.endswith(suffix):
+                database = rel[:-len(suffix)]
+                if database in self._sqlite_seen or self._is_sqlite(database):
+                    return database
+                return None
+        if dst_st is not None and dst_st.st_size == st.st_size and dst_st.st_mtime_ns == st.st_mtime_ns:
+            return None
+        return rel if st.st_size >= 512 and self._is_sqlite(rel) else None
+
+    def _sqlite_state(self, src: str) -> Tuple[Optional[Tuple[int, int, int]], ...]:
+        """(inode, size, mtime) of a database and each of its journals"""
+        state = []
+        for suffix in ("",) + self.SQLITE_JOURNALS:
+            try:
+                st = os.lstat(src + suffix)
+                state.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                state.append(None)
+        return tuple(state)
+
+    def _sync_sqlite(self, rel: str):
+        """Bring a SQLite database up to date as it was at one moment.
+
+        Where the applications' locks are visible (SQLITE_LOCKS), the
+        database is opened read-only and SQLite's online backup copies
+        what a read transaction sees into one self-contained file. A WAL
+        database without a -shm is not opened: its writer uses exclusive
+        locking, or nobody has it open, and opening it as root could
+        create files its owner can't use. Then, or when the database stays
+        locked, it is copied together with its journal and the copies are
+        kept only if neither changed meanwhile; after SQLITE_ATTEMPTS
+        tries the previous disk copy is kept for the next sync.
+
+        The disk copy's mtime is the newest of the database and its
+        journals, which is how the next sync knows nothing changed.
+        """
+        if rel in self._sqlite_seen:
+            return
+        self._sqlite_seen.add(rel)
+        if self.filter.excluded(rel):
+            return
+        src, dst = self._paths(rel)
+        try:
+            st = os.lstat(src)
+            if not stat.S_ISREG(st.st_mode):
+                return
+            state = self._sqlite_state(src)
+            newest = max(entry[2] for entry in state if entry is not None)
+            try:
+                dst_st = os.lstat(dst)
+            except FileNotFoundError:
+                dst_st = None
+            if (dst_st is not None and stat.S_ISREG(dst_st.st_mode) and dst_st.st_mtime_ns == newest
+                    and dst_st.st_mode == st.st_mode and dst_st.st_uid == st.st_uid
+                    and dst_st.st_gid == st.st_gid):
+                return
+            with open(src, "rb") as f:
+                wal_mode = f.read(20)[18:19] == b"\2"
+            files, how = None, "online backup"
+            if self.SQLITE_LOCKS and (not wal_mode or os.path.exists(src + self.SQLITE_SHM)):
+                files = self._sqlite_backup(rel)
+            if files is None:
+                how = "copied with its journal"
+            for attempt in range(self.SQLITE_ATTEMPTS):
+                if files is not None:
+                    break
+                if attempt:
+                    time.sleep(0.1 * attempt)
+                    state = self._sqlite_state(src)
+                    newest = max(entry[2] for entry in state if entry is not None)
+                files = self._sqlite_copy(rel, state)
+            if files is None:
+                self.stats.deferred += 1
+                self._log(f"{rel}: database kept changing, the previous copy is kept")
+                return
+            self._sqlite_install(rel, st, files, newest)
+            self._log(f"copied {rel} ({how})")
+        except OSError as e:
+            self._error(rel, e)
+
+    def _sqlite_backup(self, rel: str) -> Optional[List[Tuple[str, str]]]:
+        """Online backup of rel into a temporary file; [(it, destination)],
+        or None if the database could not be read"""
+        src, dst = self._paths(rel)
+        tmp = self._tmp_path(dst)
+        try:
+            source = sqlite3.connect(f"file:{quote(src)}?mode=ro", uri=True,
+                                     timeout=self.SQLITE_TIMEOUT, isolation_level=None)
+        except sqlite3.Error as e:
+            self._log(f"{rel}: {e}")
+            return None
+        try:
+            # Take the read lock first: backup() retries a locked database forever
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            target = sqlite3.connect(tmp, isolation_level=None)
+            try:
+                target.execute("PRAGMA journal_mode=OFF")
+                source.backup(target)
+            finally:
+                target.close()
+        except sqlite3.Error as e:
+            self._log(f"{rel}: {e}")
+            self._discard([(tmp, dst)])
+            return None
+        finally:
+            source.close()
+        if self.throttle is not None:
+            self.throttle.wait(os.path.getsize(tmp))
+        return [(tmp, dst)]
+
+    def _sqlite_copy(self, rel: str, state: tuple) -> Optional[List[Tuple[str, str]]]:
+        """Copy rel and its journals to temporary files; None (and nothing
+        kept) if any of them changed from state while copying"""
+        src, dst = self._paths(rel)
+        files: List[Tuple[str, str]] = []
+        try:
+            for i, suffix in enumerate(("",) + self.SQLITE_JOURNALS):
+                if state[i] is not None:
+                    files.append((self._tmp_path(dst + suffix), dst + suffix))
+                    self._copy_file(src + suffix, files[-1][0], False)
+            if self._sqlite_state(src) == state:
+                return files
+        except FileNotFoundError:
+            pass  # a journal went away meanwhile
+        except OSError:
+            self._discard(files)
+            raise
+        self._discard(files)
+        return None
+
+    def _sqlite_install(self, rel: str, st: os.stat_result, files: List[Tuple[str, str]], newest: int):
+        """Put a database's temporary copies in place. The old journals
+        go first: an old journal next to a new database corrupts it."""
+        src, dst = self._paths(rel)
+        try:
+            for tmp, target in files:
+                source = src + target[len(dst):]
+                self._copy_metadata(source, tmp, st if source == src else os.lstat(source))
+            os.utime(files[0][0], ns=(st.st_atime_ns, newest))
+            for suffix in self.SQLITE_JOURNALS + (self.SQLITE_SHM,):
+                if not os.path.lexists(dst + suffix):
+                    continue
+                if self.durability == "fsync":
+                    self._staged_removed[dst + suffix] = rel  # only once the new copy is on disk
+                else:
+                    os.unlink(dst + suffix)
+        except OSError:
+            self._discard(files)
+            raise
+        for tmp, target in files:
+            size = os.path.getsize(tmp)
+            self.stats.bytes_written += size
+            if self.durability == "fsync":
+                self._staged.append((rel, tmp, target))
+                self._staged_tmp.add(tmp)
+                self._staged_bytes += size
+            else:
+                os.replace(tmp, target)
+        self.stats.copied += 1
+        if (len(self._staged) >= self.FSYNC_BATCH_FILES
+                or self._staged_bytes >= self.FSYNC_BATCH_BYTES):
+            self._flush_staged()
+
+    @staticmethod
+    def _discard(files: List[Tuple[str, str]]):
+        for tmp, _ in files:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+
+    def _stage_file(self, rel: str, st: os.stat_result, exists: bool):
+        """Write rel to a temporary file next to its destination, complete
+        with metadata; it replaces the destination at the next flush"""
+        src, dst = self._paths(rel)
+        tmp = self._tmp_path(dst)
+        cloned = exists and fastcopy.clone_file(dst, tmp)
+        try:
+            self.stats.bytes_written += self._copy_file(src, tmp, cloned)
+            self._copy_metadata(src, tmp, st)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.stats.copied += 1
+        self._log(f"copied {rel}")
+        self._staged.append((rel, tmp, dst))
+        self._staged_tmp.add(tmp)
+        self._staged_bytes += st.st_size
+        if (len(self._staged) >= self.FSYNC_BATCH_FILES
+                or self._staged_bytes >= self.FSYNC_BATCH_BYTES):
+            self._flush_staged()
+
+    def _flush_staged(self):
+        """fsync the staged files, remove the journals they make stale,
+        rename them into place and fsync their directories (restoring the
+        mtimes the renames changed)"""
+        started = time.monotonic()
+        failed = set()
+        for rel, tmp, dst in self._staged:
+            try:
+                fd = os.open(tmp, os.O_RDONLY | os.O_CLOEXEC)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                self.stats.flushes += 1
+            except OSError as e:
+                failed.add(rel)
+                self._error(rel, e)
+        # An old -wal or -journal must be gone before the new database
+        # appears, or SQLite would apply it to the new database
+        removed = []
+        for path, rel in self._staged_removed.items():
+            if rel in failed:
+                continue
+            try:
+                os.unlink(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                failed.add(rel)
+                self._error(rel, e)
+        for directory in sorted({os.path.dirname(path) for path in removed}):
+            self._fsync_dir(directory)
+        renamed = []
+        for rel, tmp, dst in self._staged:
+            if rel in failed:
+                self._discard([(tmp, dst)])
+                continue
+            try:
+                os.replace(tmp, dst)
+                renamed.append(dst)
+            except OSError as e:
+                self._error(rel, e)
+        for directory in sorted({os.path.dirname(dst) for dst in renamed}):
+            try:
+                src_st = os.stat(self.src + directory[len(self.dst):])
+                os.utime(directory, ns=(src_st.st_atime_ns, src_st.st_mtime_ns))
+            except OSError:
+                pass  # gone from RAM meanwhile
+            self._fsync_dir(directory)
+        self._staged = []
+        self._staged_tmp.clear()
+        self._staged_removed.clear()
+        self._staged_bytes = 0
+        self.stats.flush_seconds += time.monotonic() - started
+
+    def _fsync_dir(self, directory: str):
+        try:
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.stats.flushes += 1
+        except OSError as e:
+            self._error(os.path.relpath(directory, self.dst), e)
+
+    def _make_durable(self):
+        """Apply the durability mode once the sync has written everything"""
+        if self.durability == "fsync":
+            self._flush_staged()
+        elif self.durability == "syncfs" and (self.stats.copied or self.stats.deleted):
+            started = time.monotonic()
+            try:
+                fastcopy.syncfs(self.dst)
+                self.stats.flushes += 1
+            except OSError as e:
+                self._error("", e)
+            self.stats.flush_seconds += time.monotonic() - started
+
+    def _write_changed(self, fd_in: int, fd: int, offset: int, length: int) -> int:
+        """Write the blocks of a range of fd_in that differ in fd"""
+        written = 0
+        end = offset + length
+        while offset < end:
+            block = os.pread(fd_in, min(self.BLOCK_SIZE, end - offset), offset)
+            if not block:
+                break
+            if os.pread(fd, len(block), offset) != block:
+                view = memoryview(block)
+                pos = offset
+                while view:
+                    n = os.pwrite(fd, view, pos)
+                    view = view[n:]
+                    pos += n
+                written += len(block)
+                if self.throttle is not None:
+                    self.throttle.wait(len(block), fd)
+            offset += len(block)
+        return written
+
+    def _clear_range(self, fd: int, offset: int, length: int) -> int:
+        """Make a range that is a hole in the source read as zeros in fd:
+        punched out where it holds data, or overwritten with zeros where
+        the filesystem can't punch holes"""
+        if length <= 0 or not fastcopy.has_data(fd, offset, length):
+            return 0
+        if fastcopy.punch_hole(fd, offset, length):
+            return 0
+        written = 0
+        end = offset + length
+        while offset < end:
+            current = os.pread(fd, min(self.BLOCK_SIZE, end - offset), offset)
+            if not current:
+                break
+            if current.count(0) != len(current):
+                os.pwrite(fd, bytes(len(current)), offset)
+                written += len(current)
+                if self.throttle is not None:
+                    self.throttle.wait(len(current), fd)
+            offset += len(current)
+        return written
+
+    def _copy_metadata(self, src: str, dst: str, st: os.stat_result):
+        is_link = stat.S_ISLNK(st.st_mode)
+        if self._is_root:
+            os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=False)
+        if not is_link:
+            os.chmod(dst, stat.S_IMODE(st.st_mode))
+        self._copy_xattrs(src, dst, is_link)
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+
+    @classmethod
+    def _copy_xattrs(cls, src: str, dst: str, is_link: bool):
+        try:
+            names = [n for n in os.listxattr(src, follow_symlinks=False)
+                     if not n.startswith(cls.SKIP_XATTRS)]
+        except OSError:
+            return
+        try:
+            existing = {n for n in os.listxattr(dst, follow_symlinks=False)
+                        if not n.startswith(cls.SKIP_XATTRS)}
+        except OSError:
+            existing = set()
+        for name in names:
+            try:
+                value = os.getxattr(src, name, follow_symlinks=False)
+                if name not in existing or os.getxattr(dst, name, follow_symlinks=False) != value:
+                    os.setxattr(dst, name, value, follow_symlinks=False)
+            except OSError as e:
+                if e.errno not in (errno.ENOTSUP, errno.EPERM) and not is_link:
+                    raise
+        for name in existing - set(names):
+            try:
+                os.removexattr(dst, name, follow_symlinks=False)
+            except OSError:
+                pass
+
+    def _delete(self, rel: str):
+        _, dst = self._paths(rel)
+        if self.filter.excluded(rel, os.path.isdir(dst)) or dst in self._staged_removed:
+            return  # a stale SQLite journal goes at the next flush
+        try:
+            if self.tails is not None:
+                self.tails.forget(rel)
+            if os.path.lexists(dst):
+                self._remove(dst)
+                self.stats.deleted += 1
+                self._log(f"deleted {rel}")
+        except OSError as e:
+            self._error(rel, e)
+
+    @staticmethod
+    def _remove(path: str):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+
+
+class OverlayMerge(SyncEngine):
+    """Applies an overlayfs upper layer to its lower directory, which is
+    what "overlay" folders write back instead of a whole tree.
+
+    The upper layer holds only what changed since the mount, so only it
+    is walked. Directories are merged (lower-only entries stay),
+    whiteouts (0:0 character devices) delete from the lower directory,
+    and opaque directories replace the lower directory's contents.
+    overlayfs' own xattrs are not copied. The overlay is mounted with
+    redirect_dir and metacopy off, so every changed file is complete in
+    the upper layer and renamed directories show up as opaque copies.
+    """
+
+    OPAQUE_XATTRS = ("trusted.overlay.opaque", "user.overlay.opaque")
+    SKIP_XATTRS = ("trusted.overlay.", "user.overlay.")
+    SQLITE_LOCKS = False  # applications lock the overlay's files, not the upper layer's
+
+    def merge(self) -> SyncStats:
+        started = time.monotonic()
+        self.stats.mode = "overlay"
+        self._merge_dir("")
+        self._make_durable()
+        if self.tails is not None:
+            self.tails.save()
+        self.stats.seconds = time.monotonic() - started
+        return self.stats
+
+    @staticmethod
+    def _is_whiteout(st: os.stat_result) -> bool:
+        return stat.S_ISCHR(st.st_mode) and st.st_rdev == 0
+
+    @classmethod
+    def _is_opaque(cls, path: str) -> bool:
+        for name in cls.OPAQUE_XATTRS:
+            try:
+                if os.getxattr(path, name, follow_symlinks=False) == b"y":
+                    return True
+            except OSError:
+                continue
+        return False
+
+    def _merge_dir(self, rel: str):
+        src, dst = self._paths(rel)
+        try:
+            st = os.lstat(src)
+        except OSError as e:
+            self._error(rel, e)
+            return
+        if rel and self._excluded(rel, st):
+            return
+        if rel and self._is_opaque(src):
+            # Replaces whatever the lower layer had here
+            self._sync_tree(rel)
+            return
+
+        self.stats.entries += 1
+        try:
+            if os.path.lexists(dst) and not os.path.isdir(dst):
+                self._remove(dst)
+            if not os.path.lexists(dst):
+                self._ensure_parents(rel)
+                os.mkdir(dst, stat.S_IMODE(st.st_mode))
+            with os.scandir(src) as it:
+                entries = list(it)
+        except OSError as e:
+            self._error(rel, e)
+            return
+
+        for entry in entries:
+            if self._past_deadline():
+                return
+            child = f"{rel}/{entry.name}" if rel else entry.name
+            try:
+                child_st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(child_st.st_mode):
+                self._merge_dir(child)
+            else:
+                self._sync_entry(child, child_st)
+
+        try:
+            self._copy_metadata(src, dst, st)
+        except OSError as e:
+            self._error(rel, e)
+
+    def _sync_entry(self, rel: str, st: os.stat_result):
+        if self._is_whiteout(st):
+            self._delete(rel)
+        else:
+            super()._sync_entry(rel, st)
+
+
+class DirtyTracker:
+    """The `watch` daemon: records changed paths under every RAM folder.
+
+    Folders are (re)watched whenever their tmpfs/zram mount appears or is
+    replaced, which is detected from mountinfo. Each new watch and every
+    event-queue overflow records FULL_MARKER, since changes may have been
+    missed.
+
+    In pool mode the folders are bind mounts of one filesystem. fanotify
+    then resolves every event through the pool mount (watched first), and
+    pool paths are mapped back to their folder.
+    """
+
+    def __init__(self, paths: List[str]):
+        self.logs = {p: DirtyLog(p) for p in paths}
+        self.mount_table = MountTable()
+        self._mount_ids: Dict[str, int] = {}
+        self._pool_roots = {pool_path(p): p for p in paths}
+        self._pool_mount_id: Optional[int] = None
+        self._fanotify = None
+        self._inotify = None
+        self._stop = False
+        if fsnotify.FanotifyBackend.is_supported():
+            try:
+                self._fanotify = fsnotify.FanotifyBackend()
+            except OSError as e:
+                print(f"fanotify unavailable, using inotify: {e}")
+
+    def stop(self, *args):
+        self._stop = True
+
+    def _watch(self, root: str) -> bool:
+        if self._fanotify is not None:
+            try:
+                self._fanotify.add_tree(root)
+                return True
+            except OSError:
+                pass
+        try:
+            if self._inotify is None:
+                self._inotify = fsnotify.InotifyBackend()
+            self._inotify.add_tree(root)
+            return True
+        except OSError as e:
+            print(f"Cannot watch {root}: {e}")
+            return False
+
+    def _refresh_pool(self):
+        if self._fanotify is None:
+            return
+        entry = self.mount_table.get_mount(POOL_DIR)
+        mount_id = entry.mount_id if entry is not None and entry.is_ram else None
+        if mount_id is not None and mount_id != self._pool_mount_id:
+            try:
+                self._fanotify.add_tree(POOL_DIR)
+            except OSError as e:
+                print(f"Cannot watch {POOL_DIR}: {e}")
+        self._pool_mount_id = mount_id
+
+    def refresh_mounts(self):
+        # Before the folders, so the pool mount is the one used to resolve events
+        self._refresh_pool()
+        for root, log in self.logs.items():
+            entry = self.mount_table.get_mount(root)
+            mount_id = entry.mount_id if entry is not None and entry.is_ram else None
+            if mount_id == self._mount_ids.get(root):
+                continue
+            if mount_id is None:
+                self._mount_ids.pop(root, None)
+                log.clear_watching()
+                continue
+            if self._watch(root):
+                self._mount_ids[root] = mount_id
+                log.mark_full()
+                log.set_watching(os.getpid())
+                print(f"Tracking changes under {root}")
+
+    def _unpool(self, path: str) -> str:
+        """Map a path inside the pool to the folder it is mounted on"""
+        if not path.startswith(POOL_DIR + "/"):
+            return path
+        top, sep, rest = path[len(POOL_DIR) + 1:].partition("/")
+        root = self._pool_roots.get(os.path.join(POOL_DIR, top))
+        return root + sep + rest if root else path
+
+    def _root_of(self, path: str) -> Optional[str]:
+        best = None
+        for root in self._mount_ids:
+            if (path == root or path.startswith(root + "/")) and (best is None or len(root) > len(best)):
+                best = root
+        return best
+
+    def process_events(self):
+        pending: Dict[str, List[str]] = {}
+        for backend in (self._fanotify, self._inotify):
+            if backend is None:
+                continue
+            for kind, path in backend.read_events():
+                if kind == fsnotify.EVENT_OVERFLOW:
+                    for root in self._mount_ids:
+                        self.logs[root].mark_full()
+                    continue
+                path = self._unpool(path)
+                root = self._root_of(path)
+                if root is None or path == root:
+                    continue
+                pending.setdefault(root, []).append(path[len(root) + 1:])
+        for root, entries in pending.items():
+            self.logs[root].append(entries)
+
+    def run(self):
+        os.makedirs(RUN_DIR, exist_ok=True)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        try:
+            while not self._stop:
+                self.refresh_mounts()
+                fds = [b.fileno() for b in (self._fanotify, self._inotify) if b is not None]
+                try:
+                    select.select(fds, [], [], 1.0)
+                except InterruptedError:
+                    continue
+                self.process_events()
+        finally:
+            for log in self.logs.values():
+                log.clear_watching()
+                log.close()
+            for backend in (self._fanotify, self._inotify):
+                if backend is not None:
+                    backend.close()
+            self.mount_table.close()
+
+
+def read_write_rate() -> float:
+    """Write-back throughput in bytes/s, as measured by earlier syncs"""
+    try:
+        with open(WRITE_RATE_PATH) as f:
+            return max(float(f.read()), 1024 * 1024)
+    except (OSError, ValueError):
+        return DEFAULT_WRITE_RATE
+
+
+def record_write_rate(stats: SyncStats):
+    """Fold a sync's throughput into the measured rate (large syncs only;
+    small ones are dominated by per-file overhead)"""
+    if stats.bytes_written < 4 * 1024 * 1024 or stats.seconds <= 0:
+        return
+    rate = stats.bytes_written / stats.seconds
+    if os.path.exists(WRITE_RATE_PATH):
+        rate = 0.7 * read_write_rate() + 0.3 * rate
+    try:
+        with open(WRITE_RATE_PATH + ".tmp", "w") as f:
+            f.write(f"{rate:.0f}")
+        os.replace(WRITE_RATE_PATH + ".tmp", WRITE_RATE_PATH)
+    except OSError:
+        pass
+
+
+def fits_deadline(pending: int, deadline: Optional[float]) -> bool:
+    """Whether writing `pending` bytes at the measured rate ends before deadline"""
+    return deadline is None or time.time() + pending / read_write_rate() < deadline
+
+
+def write(ram: str, hdd: str, filter: Filter, full: bool = False, verbose: bool = False,
+          deadline: Optional[float] = None, throttle: Optional[Throttle] = None,
+          durability: str = "none") -> SyncStats:
+    """Sync one RAM folder to disk, incrementally when possible. With a
+    deadline the folder is skipped if its estimated changes cannot be
+    written in time, and the sync stops between files when time is up;
+    either way the claimed dirty entries are kept for the next sync.
+    A throttled sync does not count towards the measured write rate."""
+    log = DirtyLog(ram)
+    os.makedirs(RUN_DIR, exist_ok=True)
+    with open(log.lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one sync per folder at a time
+        dirty = log.take()
+        if full:
+            dirty = None
+        engine = SyncEngine(ram, hdd, filter, verbose, deadline, throttle, durability, TailIndex(ram))
+        if deadline is not None:
+            engine.stats.pending = engine.estimate(dirty)
+            if not fits_deadline(engine.stats.pending, deadline):
+                engine.stats.mode = "skipped"
+                engine.stats.incomplete = True
+                return engine.stats
+        stats = engine.sync(dirty)
+        if throttle is None or not throttle.stats.slept:
+            record_write_rate(stats)
+        if stats.errors == 0 and not stats.incomplete and not stats.deferred:
+            log.done()
+    return stats
+
+
+def write_snapshot(ram: str, hdd: str, filter: Filter, full: bool = False,
+                   deadline: Optional[float] = None, throttle: Optional[Throttle] = None) -> SnapshotStats:
+    """Archive one RAM folder, unless the dirty log shows it unchanged
+    since the last snapshot. With a deadline the archive is only written
+    if all of it can be before then."""
+    log = DirtyLog(ram)
+    snapshot = Snapshot(hdd)
+    os.makedirs(RUN_DIR, exist_ok=True)
+    with open(log.lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dirty = log.take()
+        if not full and dirty is not None and not dirty and snapshot.exists():
+            log.done()
+            return SnapshotStats(mode="unchanged")
+        if deadline is not None:
+            pending = Snapshot.tree_size(ram)
+            if not fits_deadline(pending, deadline):
+                return SnapshotStats(mode="skipped", bytes_in=pending)
+        stats = snapshot.write(ram, filter, throttle)
+        if stats.errors == 0:
+            log.done()
+    return stats
+
+
+def hydrate(ram: str, hdd: str, filter: Filter):
+    """Fill a RAM folder from its disk copy: from the archive if there is
+    one, else by copying the files (in the kernel, keeping holes)"""
+    snapshot = Snapshot(hdd)
+    if snapshot.exists():
+        return snapshot.restore(ram, filter)
+    engine = SyncEngine(hdd, ram, filter)
+    engine.sqlite = False  # nothing writes to the disk copy
+    stats = engine.sync(None)
+    stats.mode = "hydrate"
+    return stats
+
+
+def overlay_upper(ram: str) -> Optional[str]:
+    """upperdir of the overlay mounted at ram, from mountinfo"""
+    mount_table = MountTable()
+    try:
+        entry = mount_table.get_mount(ram)
+    finally:
+        mount_table.close()
+    if entry is None or entry.fs_type != "overlay":
+        return None
+    for option in re.split(r"(?<!\\),", entry.super_options):
+        if option.startswith("upperdir="):
+            return option.split("=", 1)[1].replace("\\,", ",")
+    return None
+
+
+def merge_overlay(ram: str, upper: str, lower: str, filter: Filter,
+                  verbose: bool = False, deadline: Optional[float] = None,
+                  throttle: Optional[Throttle] = None, durability: str = "none") -> SyncStats:
+    """Write an overlay folder's upper layer back to its lower directory
+    (skipped or stopped early with a deadline, as in write())"""
+    os.makedirs(RUN_DIR, exist_ok=True)
+    with open(DirtyLog(ram).lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        engine = OverlayMerge(upper, lower, filter, verbose, deadline, throttle, durability,
+                              TailIndex(ram))
+        if deadline is not None:
+            engine.stats.pending = engine.estimate()
+            if not fits_deadline(engine.stats.pending, deadline):
+                engine.stats.mode = "skipped"
+                engine.stats.incomplete = True
+                return engine.stats
+        stats = engine.merge()
+        if throttle is None or not throttle.stats.slept:
+            record_write_rate(stats)
+        return stats
+
+
+def _parse_filter(argv: List[str]) -> Tuple[Filter, List[str]]:
+    """Extract --include/--exclude options in order"""
+    rules, rest = [], []
+    for arg in argv:
+        if arg.startswith("--include="):
+            rules.append((True, arg.split("=", 1)[1]))
+        elif arg.startswith("--exclude="):
+            rules.append((False, arg.split("=", 1)[1]))
+        else:
+            rest.append(arg)
+    return Filter(rules), rest
+
+
+def main():
+    """sync_engine.py {watch | write [--include=P] [--exclude=P] RAM HDD |
+    overlay-merge RAM [HDD] | snapshot RAM [HDD] | hydrate RAM [HDD] | status}"""
+    filter, argv = _parse_filter(sys.argv[1:])
+    parser = argparse.ArgumentParser(description="Incremental RAM-to-disk sync for log2ram")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("watch", help="record changed files under every PATH_DISK folder")
+    write_parser = sub.add_parser("write", help="copy a RAM folder's changes to disk")
+    write_parser.add_argument("ram")
+    write_parser.add_argument("hdd", nargs="?")
+    write_parser.add_argument("--full", action="store_true", help="compare everything")
+    write_parser.add_argument("-v", "--verbose", action="store_true")
+    write_parser.add_argument("--deadline", type=int, help="milliseconds since the epoch")
+    merge_parser = sub.add_parser("overlay-merge", help="copy an overlay folder's upper layer to disk")
+    merge_parser.add_argument("ram")
+    merge_parser.add_argument("hdd", nargs="?")
+    merge_parser.add_argument("-v", "--verbose", action="store_true")
+    merge_parser.add_argument("--deadline", type=int, help="milliseconds since the epoch")
+    snapshot_parser = sub.add_parser("snapshot", help="write a RAM folder as one compressed archive")
+    snapshot_parser.add_argument("ram")
+    snapshot_parser.add_argument("hdd", nargs="?")
+    snapshot_parser.add_argument("--full", action="store_true", help="write even if unchanged")
+    snapshot_parser.add_argument("--deadline", type=int, help="milliseconds since the epoch")
+    for throttled in (write_parser, merge_parser, snapshot_parser):
+        throttled.add_argument("--rate", type=int, default=0, help="write at most this many bytes/s")
+        throttled.add_argument("--latency", default="0",
+                               help="slow down while the disk's latency is above this many ms (or auto)")
+    for durable in (write_parser, merge_parser):
+        durable.add_argument("--durability", choices=DURABILITY_MODES, default="none",
+                             help="flush nothing, the filesystem once, or every file (atomically)")
+    hydrate_parser = sub.add_parser("hydrate", help="fill a RAM folder from its archive or disk copy")
+    hydrate_parser.add_argument("ram")
+    hydrate_parser.add_argument("hdd", nargs="?")
+    sub.add_parser("status", help="show which folders are tracked")
+    args = parser.parse_args(argv)
+
+    if args.command == "watch":
+        DirtyTracker(read_path_disk(tracked_only=True)).run()
+        return 0
+
+    if args.command == "status":
+        for ram, mode in read_path_modes().items():
+            if mode == "lossy":
+                state = "lossy (never written to disk)"
+            elif mode == "overlay":
+                state = "overlay (upper layer merged on write)"
+            elif mode == "archive":
+                tracked = "tracked" if DirtyLog(ram).is_tracked() else "not tracked"
+                state = f"archive ({tracked})"
+            elif DirtyLog(ram).is_tracked():
+                state = "tracked"
+            else:
+                state = "not tracked (full compare)"
+            print(f"{ram}: {state}")
+        return 0
+
+    hdd = args.hdd or hdd_path(args.ram)
+    deadline = getattr(args, "deadline", None)
+    deadline = deadline / 1000 if deadline is not None else None
+    if not os.path.isdir(hdd):
+        print(f"ERROR: {hdd}/ doesn't exist! Can't sync.", file=sys.stderr)
+        return 1
+    rate, latency = getattr(args, "rate", 0), getattr(args, "latency", "0")
+    throttle = Throttle.for_path(hdd, rate, latency) if rate > 0 or latency != "0" else None
+    if args.command in ("snapshot", "hydrate"):
+        try:
+            if args.command == "snapshot":
+                stats = write_snapshot(args.ram, hdd, filter, args.full, deadline, throttle)
+            else:
+                stats = hydrate(args.ram, hdd, filter)
+        except OSError as e:
+            print(f"ERROR: {args.command} {args.ram}: {e}", file=sys.stderr)
+            return 1
+        if args.command == "snapshot":
+            save_filter_stats(args.ram, filter)
+        print(f"sync_engine {args.ram}: {stats.summary()}")
+        if throttle is not None:
+            print(f"sync_engine {args.ram}: {throttle.stats.summary()}")
+        if stats.mode == "skipped":
+            return EX_DEADLINE
+        return 1 if stats.errors else 0
+
+    if args.command == "overlay-merge":
+        upper = overlay_upper(args.ram)
+        if upper is None:
+            print(f"ERROR: {args.ram} is not an overlay mount", file=sys.stderr)
+            return 1
+        stats = merge_overlay(args.ram, upper, hdd, filter, args.verbose, deadline, throttle,
+                              args.durability)
+        save_filter_stats(args.ram, filter)
+        print(f"sync_engine {args.ram}: {stats.summary()}")
+        if throttle is not None:
+            print(f"sync_engine {args.ram}: {throttle.stats.summary()}")
+        if stats.incomplete:
+            return EX_DEADLINE
+        return 1 if stats.errors else 0
+
+    stats = write(args.ram, hdd, filter, args.full, args.verbose, deadline, throttle, args.durability)
+    save_filter_stats(args.ram, filter)
+    print(f"sync_engine {args.ram}: {stats.summary()}")
+    if throttle is not None:
+        print(f"sync_engine {args.ram}: {throttle.stats.summary()}")
+    if stats.incomplete:
+        return EX_DEADLINE
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Task runner module for SSDsaver.
+Runs blocking work (subprocesses, tree walks, pkexec prompts) on a thread
+pool and hands the results back to the GTK main loop with GLib.idle_add.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from gi.repository import GLib
+
+
+class Task:
+    """Handle for a submitted task"""
+
+    def __init__(self, key: Optional[str]):
+        self.key = key
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Discard the result. Long-running functions may also poll `cancelled`."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+
+class TaskRunner:
+    """Thread pool whose callbacks always run on the main loop.
+
+    Tasks submitted with a `key` are tracked while in flight:
+    - coalesce=True: a new submission is dropped while one is running
+      (e.g. only one usage scan at a time)
+    - coalesce=False: the running task is cancelled and replaced, so only
+      the latest result is delivered
+    """
+
+    MAX_WORKERS = 4
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or self.MAX_WORKERS,
+            thread_name_prefix="ssdsaver-task"
+        )
+        self._in_flight: Dict[str, Task] = {}
+
+    def submit(self, fn: Callable, *args, on_done: Callable = None,
+               on_error: Callable = None, key: str = None,
+               coalesce: bool = False, pass_task: bool = False) -> Optional[Task]:
+        """Run fn(*args) on a worker. Must be called from the main loop.
+
+        Returns the Task, or None if it was coalesced into a running one.
+        With pass_task=True the function also receives `task=` so it can
+        stop early once cancelled.
+        """
+        if key is not None and key in self._in_flight:
+            if coalesce:
+                return None
+            self._in_flight[key].cancel()
+
+        task = Task(key)
+        if key is not None:
+            self._in_flight[key] = task
+
+        def run():
+            result, error = None, None
+            try:
+                if pass_task:
+                    result = fn(*args, task=task)
+                else:
+                    result = fn(*args)
+            except Exception as e:
+                error = e
+            GLib.idle_add(self._deliver, task, result, error, on_done, on_error)
+
+        self._executor.submit(run)
+        return task
+
+    def is_running(self, key: str) -> bool:
+        return key in self._in_flight
+
+    def cancel(self, key: str):
+        task = self._in_flight.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    def shutdown(self):
+        """Cancel everything in flight and stop accepting work"""
+        for task in self._in_flight.values():
+            task.cancel()
+        self._in_flight.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _deliver(self, task, result, error, on_done, on_error):
+        if task.key is not None and self._in_flight.get(task.key) is task:
+            del self._in_flight[task.key]
+        if task.cancelled:
+            return False
+
+        if error is not None:
+            if on_error:
+                on_error(error)
+            else:
+                print(f"Background task failed: {error}")
+        elif on_done:
+            on_done(result)
+        return False
+
+
+class MainLoopMonitor:
+    """Measures how long the main loop is blocked.
+
+    A helper thread queues a high-priority idle callback every PROBE_MS and
+    records how long the main loop took to dispatch it. That delay is the
+    time the loop spent busy in some other callback, so `max_ms` bounds the
+    longest single main-loop iteration observed.
+    """
+
+    PROBE_MS = 20
+    BUDGET_MS = 16.0
+
+    def __init__(self):
+        self.samples = 0
+        self.max_ms = 0.0
+        self.over_budget = 0
+        self._stop = threading.Event()
+        self._pending = threading.Event()
+        self._thread = threading.Thread(target=self._probe, name="ssdsaver-loop-monitor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def report(self) -> str:
+        return (f"main loop: {self.samples} probes, worst {self.max_ms:.1f} ms, "
+                f"{self.over_budget} over {self.BUDGET_MS:.0f} ms")
+
+    def _probe(self):
+        while not self._stop.wait(self.PROBE_MS / 1000):
+            if self._pending.is_set():
+                continue  # previous probe still waiting: loop is blocked
+            self._pending.set()
+            GLib.idle_add(self._on_probe, time.monotonic(), priority=GLib.PRIORITY_HIGH)
+
+    def _on_probe(self, queued_at):
+        delay_ms = (time.monotonic() - queued_at) * 1000
+        self.samples += 1
+        self.max_ms = max(self.max_ms, delay_ms)
+        if delay_ms > self.BUDGET_MS:
+            self.over_budget += 1
+            print(f"Main loop blocked for {delay_ms:.1f} ms")
+        self._pending.clear()
+        return False
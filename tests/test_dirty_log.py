@@ -0,0 +1,41 @@
+"""Tests for sync_engine.DirtyLog"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sync_engine import DirtyLog
+
+
+class DirtyLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+        self.log = DirtyLog("/var/log", run_dir=self.run_dir)
+        self.log.set_watching(os.getpid())
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.run_dir)
+
+    def test_skips_entries_already_in_file(self):
+        self.log.append(["syslog", "syslog"])
+        self.log.append(["syslog", "auth.log"])
+        with open(self.log.path, "rb") as f:
+            self.assertEqual(f.read(), b"syslog\0auth.log\0")
+
+    def test_path_changed_again_after_sync_is_recorded(self):
+        self.log.append(["syslog"])
+        self.assertEqual(self.log.take(), {"syslog"})
+        self.log.done()
+
+        self.log.append(["syslog"])
+        self.assertEqual(self.log.take(), {"syslog"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Tests for process_io.ProcessIOSampler"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process_io import ProcessIOSampler
+
+
+class ProcessIOSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proc = tempfile.mkdtemp()
+        self.sampler = ProcessIOSampler(proc=self.proc)
+
+    def tearDown(self):
+        shutil.rmtree(self.proc)
+
+    def set_process(self, pid, comm, ppid, written, cancelled=0):
+        path = os.path.join(self.proc, str(pid))
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "comm"), "w") as f:
+            f.write(comm + "\n")
+        with open(os.path.join(path, "status"), "w") as f:
+            f.write(f"Name:\t{comm}\nPPid:\t{ppid}\n")
+        with open(os.path.join(path, "io"), "w") as f:
+            f.write(f"rchar: 0\nwchar: 0\nsyscr: 0\nsyscw: 0\nread_bytes: 0\n"
+                    f"write_bytes: {written}\ncancelled_write_bytes: {cancelled}\n")
+
+    def test_reaped_child_is_not_counted_twice(self):
+        self.set_process(100, "make", 1, 1000)
+        self.set_process(200, "cc1", 100, 0)
+        self.sampler.sample(now=0)
+
+        self.set_process(200, "cc1", 100, 500)
+        self.assertEqual(self.sampler.sample(now=1), {"cc1": 500})
+
+        # make reaps cc1: the kernel adds cc1's counters to make's
+        shutil.rmtree(os.path.join(self.proc, "200"))
+        self.set_process(100, "make", 1, 1000 + 500 + 100)
+        self.assertEqual(self.sampler.sample(now=2), {"make": 100})
+        self.assertEqual(self.sampler._totals, {"cc1": 500, "make": 100})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+"""
+Throttle module for SSDsaver.
+Paces write-back to the disk with a token bucket whose rate follows the
+disk's measured request latency (additive increase, multiplicative
+decrease), so a large flush does not stall foreground I/O.
+"""
+
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from disk_stats import DiskStats
+
+MB = 1024 * 1024
+MIN_RATE = 1 * MB            # bytes/s; write-back always makes progress
+SAMPLE_INTERVAL = 0.5        # seconds between latency samples
+FLUSH_BYTES = 8 * MB         # written to one file before it is flushed (paced writes reach the disk)
+LATENCY_SSD = 20.0           # default latency targets (ms) for WRITEBACK_LATENCY=auto
+LATENCY_HDD = 100.0
+
+
+@dataclass
+class ThrottleStats:
+    """What throttling did to a write-back"""
+    slept: float = 0.0        # seconds spent waiting for tokens
+    backoffs: int = 0         # times the rate was halved for latency
+    lowest_rate: float = 0.0  # bytes/s, 0 if never limited
+    worst_latency: float = 0.0  # ms
+
+    def summary(self) -> str:
+        if not self.slept and not self.backoffs:
+            return "not throttled"
+        return (f"throttled {self.slept:.1f} s, {self.backoffs} backoffs, lowest "
+                f"{self.lowest_rate / MB:.1f} MB/s, worst latency {self.worst_latency:.0f} ms")
+
+
+class Throttle:
+    """Token bucket for the bytes a write-back writes.
+
+    `rate` caps it (bytes/s, 0 for no cap). With a latency target the
+    disk's average request latency (all readers and writers, from
+    /sys/block/<disk>/stat) is sampled every SAMPLE_INTERVAL: above the
+    target the rate is halved, below it the rate grows by a sixteenth of
+    the cap, or of itself without one, until it is back at the cap.
+    Uncapped and with a quiet disk, nothing is slowed down.
+
+    Written data is flushed with fdatasync every FLUSH_BYTES of a file,
+    so the disk sees the paced rate rather than the kernel's periodic
+    writeback bursts.
+    """
+
+    def __init__(self, rate: int = 0, latency_target: float = 0.0, disk: Optional[str] = None):
+        self.cap = float(rate) if rate > 0 else None
+        self.rate = self.cap                     # None: unlimited for now
+        self.latency_target = latency_target if disk else 0.0
+        self.disk = disk
+        self.stats = ThrottleStats()
+        now = time.monotonic()
+        self._tokens = 0.0
+        self._refilled = now
+        self._sampled = now
+        self._sample_bytes = 0
+        self._ios = self._read_ios()
+        self._unflushed: Tuple[int, int] = (-1, 0)   # (fd, bytes)
+
+    @classmethod
+    def for_path(cls, path: str, rate: int = 0, latency: str = "auto") -> "Throttle":
+        """Throttle for writes below path. latency is a target in ms,
+        "auto" (by the disk's type) or "0" (off)."""
+        disk = cls.disk_of(path)
+        if latency == "auto":
+            target = LATENCY_HDD if disk and DiskStats.is_rotational(disk) else LATENCY_SSD
+        else:
+            try:
+                target = float(latency)
+            except ValueError:
+                target = 0.0
+        return cls(rate, target, disk)
+
+    @staticmethod
+    def disk_of(path: str) -> Optional[str]:
+        """Physical disk holding path"""
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            return None
+        sys_path = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        if not os.path.exists(sys_path):
+            return None  # tmpfs, network filesystems...
+        return DiskStats.find_disk(os.path.basename(os.path.realpath(sys_path)))
+
+    @property
+    def active(self) -> bool:
+        return self.cap is not None or self.latency_target > 0
+
+    @property
+    def chunk(self) -> int:
+        """Largest write to make between waits"""
+        return max(256 * 1024, int(self.rate / 8)) if self.rate else 16 * MB
+
+    def _read_ios(self) -> Optional[Tuple[int, int]]:
+        """(requests completed, ms spent on them) since boot"""
+        if not self.latency_target:
+            return None
+        try:
+            with open(f"/sys/block/{self.disk}/stat") as f:
+                fields = [int(v) for v in f.read().split()]
+        except (OSError, ValueError):
+            self.latency_target = 0.0
+            return None
+        return fields[0] + fields[4], fields[3] + fields[7]
+
+    def _adjust(self, now: float):
+        """Sample the disk's latency and move the rate"""
+        elapsed = now - self._sampled
+        written, self._sample_bytes = self._sample_bytes, 0
+        self._sampled = now
+        ios = self._read_ios()
+        if ios is None or self._ios is None:
+            return
+        requests, ticks = ios[0] - self._ios[0], ios[1] - self._ios[1]
+        self._ios = ios
+        if requests <= 0:
+            return
+        latency = ticks / requests
+        self.stats.worst_latency = max(self.stats.worst_latency, latency)
+        if latency > self.latency_target:
+            current = self.rate or max(written / elapsed, MIN_RATE * 2)
+            self.rate = max(MIN_RATE, current / 2)
+            self.stats.backoffs += 1
+            self.stats.lowest_rate = min(self.stats.lowest_rate or self.rate, self.rate)
+        elif self.rate is not None:
+            step = (self.cap or self.rate) / 16
+            self.rate += max(step, MIN_RATE)
+            if self.cap is None and written < self.rate * elapsed / 2:
+                self.rate = None   # the disk keeps up and we don't even use the rate
+            elif self.cap is not None:
+                self.rate = min(self.rate, self.cap)
+
+    def wait(self, nbytes: int, fd: Optional[int] = None):
+        """Account nbytes just written to fd; sleeps as long as the rate
+        requires and flushes fd every FLUSH_BYTES"""
+        if not self.active:
+            return
+        now = time.monotonic()
+        self._sample_bytes += nbytes
+        if self.latency_target and now - self._sampled >= SAMPLE_INTERVAL:
+            self._adjust(now)
+        if fd is not None:
+            last_fd, unflushed = self._unflushed
+            unflushed = unflushed + nbytes if fd == last_fd else nbytes
+            if unflushed >= FLUSH_BYTES and self.rate is not None:
+                os.fdatasync(fd)
+                unflushed = 0
+            self._unflushed = (fd, unflushed)
+        if self.rate is None:
+            self._tokens = 0.0
+            self._refilled = now
+            return
+        burst = max(self.rate / 4, MB)
+        self._tokens = min(burst, self._tokens + (now - self._refilled) * self.rate) - nbytes
+        self._refilled = now
+        if self._tokens < 0:
+            delay = -self._tokens / self.rate
+            self.stats.lowest_rate = min(self.stats.lowest_rate or self.rate, self.rate)
+            self.stats.slept += delay
+            time.sleep(delay)
+
+    def wrap(self, fileobj):
+        """File object whose writes go through this throttle"""
+        return ThrottledFile(fileobj, self)
+
+
+class ThrottledFile:
+    """Minimal writable file wrapper (for tarfile) that paces its writes"""
+
+    def __init__(self, fileobj, throttle: Throttle):
+        self._file = fileobj
+        self._throttle = throttle
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        step = self._throttle.chunk
+        for start in range(0, len(view), step):
+            part = view[start:start + step]
+            self._file.write(part)
+            self._throttle.wait(len(part), self._file.fileno())
+        return len(view)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def main():
+    """throttle.py PATH: show the disk holding PATH and its current latency"""
+    if len(sys.argv) != 2:
+        print("Usage: throttle.py PATH", file=sys.stderr)
+        return 2
+    throttle = Throttle.for_path(sys.argv[1])
+    if not throttle.disk:
+        print(f"{sys.argv[1]}: not on a block device, write-back to it is not throttled by latency")
+        return 0
+    before = throttle._read_ios()
+    time.sleep(1)
+    after = throttle._read_ios()
+    requests = after[0] - before[0] if before and after else 0
+    latency = (after[1] - before[1]) / requests if requests else 0.0
+    print(f"{sys.argv[1]}: disk {throttle.disk}, latency target {throttle.latency_target:.0f} ms, "
+          f"{requests} requests in the last second, {latency:.1f} ms average")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
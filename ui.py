@@ -3,10 +3,21 @@ gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 from gi.repository import Gtk, Adw, GLib, Gio
 
+import os
+import threading
+import time
+
 from config_manager import ConfigManager
 from service_manager import ServiceManager
 from app_detector import AppDetector
 from folder_manager import FolderManager
+from usage_watcher import UsageWatcher
+from task_runner import TaskRunner, MainLoopMonitor
+from usage_history import UsageHistory
+from disk_stats import DiskStats
+from process_io import ProcessIOSampler
+from write_discovery import WriteDiscovery
+from ram_accounting import RamAccounting
 
 class MainWindow(Adw.ApplicationWindow):
     def __init__(self, *args, **kwargs):
@@ -19,6 +30,13 @@ class MainWindow(Adw.ApplicationWindow):
         self.app_detector = AppDetector()
         self.folder_manager = FolderManager()
         
+        # All blocking I/O runs here; results come back on the main loop
+        self.task_runner = TaskRunner()
+        self.loop_monitor = None
+        if os.environ.get("SSDSAVER_LOOP_MONITOR"):
+            self.loop_monitor = MainLoopMonitor()
+            self.loop_monitor.start()
+        
         # Track original config values for change detection
         self.original_config = {}
         
@@ -26,12 +44,23 @@ class MainWindow(Adw.ApplicationWindow):
         self.detected_apps = []
         
         # Usage Monitoring
-        self.peak_usage = {}  # app_name -> float (MB)
-        self.usage_mode = "current"  # "current" or "peak"
+        self.usage_history = UsageHistory()  # persisted per-app samples
+        self.current_usage = {}  # app_name -> PathUsage
+        self.usage_mode = "current"  # "current" or a UsageHistory window ("hour", "day", "week")
         self.usage_rows = {}  # app_name -> (ActionRow, Label, ProgressBar)
+        self.ram_accounting = RamAccounting(self.folder_manager.mount_table)
+        
+        # Event-driven usage counters (polling is only used as a fallback)
+        self.usage_watcher = UsageWatcher()
+        self.usage_watch_fds = set()
+        self.connect("close-request", self._on_close_request)
         
         # Start usage monitoring timer (2 seconds)
         GLib.timeout_add(2000, self._update_usage_stats)
+        
+        # Per-process write leaderboard (sampled on a worker every 10 seconds)
+        self.process_io = ProcessIOSampler()
+        GLib.timeout_add_seconds(10, self._update_writers)
 
         # Main Layout
         self.box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
@@ -169,6 +198,32 @@ class MainWindow(Adw.ApplicationWindow):
         input_row.add_suffix(self.budget_spinbutton)
         budget_group.add(input_row)
         
+        # One shared tmpfs/zram for all apps instead of one mount per folder
+        pool_row = Adw.ActionRow(
+            title="Shared RAM Pool",
+            subtitle="Apps share the whole budget instead of each having a fixed size"
+        )
+        self.pool_switch = Gtk.Switch()
+        self.pool_switch.set_valign(Gtk.Align.CENTER)
+        self.pool_switch.set_active(self.folder_manager.is_pool_mode())
+        self.pool_switch.connect("notify::active", lambda w, p: self.apply_budget_btn.set_sensitive(True))
+        pool_row.add_suffix(self.pool_switch)
+        budget_group.add(pool_row)
+        
+        # Cap for the daily/periodic write-back, so it doesn't compete with other programs
+        writeback_row = Adw.ActionRow(
+            title="Write-back Limit (MB/s)",
+            subtitle="Maximum speed when saving RAM folders to disk (0 = no limit)"
+        )
+        self.writeback_spinbutton = Gtk.SpinButton()
+        self.writeback_spinbutton.set_range(0, 1000)
+        self.writeback_spinbutton.set_increments(5, 50)
+        self.writeback_spinbutton.set_value(self.folder_manager.get_writeback_rate())
+        self.writeback_spinbutton.set_valign(Gtk.Align.CENTER)
+        self.writeback_spinbutton.connect("value-changed", lambda w: self.apply_budget_btn.set_sensitive(True))
+        writeback_row.add_suffix(self.writeback_spinbutton)
+        budget_group.add(writeback_row)
+        
         # --- Usage Section ---
         usage_group = Adw.PreferencesGroup(title="Current Usage")
         content_box.append(usage_group)
@@ -188,6 +243,13 @@ class MainWindow(Adw.ApplicationWindow):
         used_row.add_suffix(self.used_label)
         usage_group.add(used_row)
         
+        # RAM the mounts really consume (data actually stored, minus swap)
+        self.actual_row = Adw.ActionRow(title="RAM Actually Used", subtitle="Measuring...")
+        self.actual_label = Gtk.Label(label="-")
+        self.actual_label.add_css_class("title-2")
+        self.actual_row.add_suffix(self.actual_label)
+        usage_group.add(self.actual_row)
+        
         # Available
         available_row = Adw.ActionRow(title="Available")
         self.available_label = Gtk.Label(label=f"{current_budget - used_mb} MB")
@@ -221,13 +283,11 @@ class MainWindow(Adw.ApplicationWindow):
         box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         box.set_valign(Gtk.Align.CENTER)
         
-        self.mode_toggle = Gtk.ToggleButton(label="Current")
-        self.mode_toggle.set_active(True)
-        self.mode_toggle.connect("toggled", self.on_usage_mode_toggled)
-        box.append(self.mode_toggle)
-        
-        self.peak_label = Gtk.Label(label="Peak (Session)")
-        # box.append(self.peak_label) # Just using the toggle button text change for now
+        self.mode_combo = Gtk.DropDown.new_from_strings(
+            ["Current", "Peak (Hour)", "Peak (Day)", "Peak (Week)"]
+        )
+        self.mode_combo.connect("notify::selected", self.on_usage_mode_changed)
+        box.append(self.mode_combo)
         
         toggle_row.add_suffix(box)
         self.details_group.add(toggle_row)
@@ -235,6 +295,22 @@ class MainWindow(Adw.ApplicationWindow):
         # App usage list (populated dynamically)
         self._refresh_usage_list()
         
+        # --- SSD Writes Section ---
+        self.writes_group = Adw.PreferencesGroup(
+            title="SSD Writes",
+            description="Recorded hourly for the disk holding the root filesystem"
+        )
+        content_box.append(self.writes_group)
+        self.write_rows = []  # rows rebuilt on each refresh
+        
+        # --- Top Writers Section ---
+        self.writers_group = Adw.PreferencesGroup(
+            title="Top Writers",
+            description="Processes ranked by disk writes since SSDsaver was opened"
+        )
+        content_box.append(self.writers_group)
+        self.writer_rows = []
+        
         return scrolled
 
 
@@ -354,6 +430,31 @@ class MainWindow(Adw.ApplicationWindow):
         # This will be populated by detect_apps()
         self.app_rows = {}
         
+        # Write-hot folder discovery
+        self.discover_group = Adw.PreferencesGroup(
+            title="Discover Folders",
+            description="Watch your home folder, /var/cache and /var/lib for disk writes "
+                        "and suggest busy folders to move to RAM"
+        )
+        content_box.append(self.discover_group)
+        
+        discover_row = Adw.ActionRow(title="Watch For (minutes)")
+        self.discover_minutes = Gtk.SpinButton()
+        self.discover_minutes.set_range(1, 240)
+        self.discover_minutes.set_increments(1, 10)
+        self.discover_minutes.set_value(10)
+        self.discover_minutes.set_valign(Gtk.Align.CENTER)
+        discover_row.add_suffix(self.discover_minutes)
+        
+        self.discover_btn = Gtk.Button(label="Discover")
+        self.discover_btn.set_valign(Gtk.Align.CENTER)
+        self.discover_btn.connect("clicked", self.on_discover_clicked)
+        discover_row.add_suffix(self.discover_btn)
+        self.discover_group.add(discover_row)
+        
+        self.discover_rows = []  # suggestion rows from the last discovery
+        self.discover_stop = threading.Event()
+        
         # RAM Usage Summary
         self.ram_summary_group = Adw.PreferencesGroup(title="RAM Usage")
         content_box.append(self.ram_summary_group)
@@ -392,9 +493,18 @@ class MainWindow(Adw.ApplicationWindow):
         
         # Initial usage update
         self._update_usage_stats()
+        self._update_write_stats()
+        self._update_writers()
 
     def _update_status(self):
-        status = self.service_manager.get_status()
+        """Query the service state in the background"""
+        self.task_runner.submit(
+            self.service_manager.get_status,
+            on_done=self._show_status,
+            key="status"
+        )
+
+    def _show_status(self, status):
         self.status_label.set_label(status)
         
         # Update button visibility based on service state
@@ -410,9 +520,27 @@ class MainWindow(Adw.ApplicationWindow):
             self.status_label.add_css_class("error")
             self.status_label.remove_css_class("success")
     
-    def detect_apps(self):
-        """Detect installed applications"""
-        self.detected_apps = self.app_detector.detect_all_apps()
+    def detect_apps(self, on_done=None):
+        """Detect installed applications in the background"""
+        def show(apps):
+            self._show_detected_apps(apps)
+            if on_done:
+                on_done()
+        
+        def detect():
+            custom = self.app_detector.get_custom_apps(self.folder_manager.get_custom_targets())
+            return self.app_detector.detect_all_apps() + custom
+        
+        self.task_runner.submit(
+            detect,
+            on_done=show,
+            key="detect",
+            coalesce=True
+        )
+
+    def _show_detected_apps(self, apps):
+        """Rebuild the application rows from detection results"""
+        self.detected_apps = apps
         
         # Clear existing rows
         for row in list(self.app_rows.values()):
@@ -427,11 +555,18 @@ class MainWindow(Adw.ApplicationWindow):
         
         # Update RAM usage
         self._update_ram_usage()
+        self._refresh_rule_savings()
+        
+        # Watch paths now that fresh paths are known
+        self._sync_usage_watches(self.folder_manager.get_enabled_apps())
     
     def _create_app_row(self, app_info):
         """Create a row for an application"""
         row = Adw.ExpanderRow(title=app_info.display_name)
-        row.set_subtitle(f"Default: {app_info.default_size}")
+        if app_info.is_custom:
+            row.set_subtitle(f"Custom folder, suggested: {app_info.default_size}")
+        else:
+            row.set_subtitle(f"Default: {app_info.default_size}")
         row.set_icon_name(app_info.icon_name)
         
         # Enable switch
@@ -444,10 +579,13 @@ class MainWindow(Adw.ApplicationWindow):
         switch.connect("state-set", lambda w, s: self.on_app_toggled(app_info.name, s))
         row.add_action(switch)  # ExpanderRow uses add_action, not add_suffix
         
+        # Saved settings, if the app was configured before
+        saved = self.folder_manager.get_app_config(app_info.name) or {}
+        
         # Size configuration
         size_row = Adw.ActionRow(title="RAM Size")
         size_entry = Gtk.Entry()
-        size_entry.set_text(app_info.default_size)
+        size_entry.set_text(saved.get("size", app_info.default_size))
         size_entry.set_valign(Gtk.Align.CENTER)
         size_entry.set_width_chars(8)
         size_entry.connect("changed", lambda w: self.on_app_param_changed())
@@ -455,21 +593,65 @@ class MainWindow(Adw.ApplicationWindow):
         row.add_row(size_row)
         
         # Mode selection
-        mode_row = Adw.ActionRow(title="Mode", subtitle="Safe: syncs to disk | Lossy: RAM only")
-        mode_combo = Gtk.DropDown.new_from_strings(["Safe", "Lossy"])
+        mode_row = Adw.ActionRow(
+            title="Mode",
+            subtitle="Safe: copied to RAM, syncs to disk | Lossy: RAM only | "
+                     "Overlay: reads from disk, writes to RAM, syncs changes | "
+                     "Archive: like Safe, saved as one compressed file"
+        )
+        mode_combo = Gtk.DropDown.new_from_strings(["Safe", "Lossy", "Overlay", "Archive"])
+        saved_mode = saved.get("mode", "safe")
+        if saved_mode in self.folder_manager.MODES:
+            mode_combo.set_selected(self.folder_manager.MODES.index(saved_mode))
         mode_combo.set_valign(Gtk.Align.CENTER)
         mode_combo.connect("notify::selected", lambda w, p: self.on_app_param_changed())
         mode_row.add_suffix(mode_combo)
         row.add_row(mode_row)
         
+        # Ignore rules and what they saved
+        rules_row = Adw.ActionRow(title="Ignore Rules")
+        row.add_row(rules_row)
+        
         # Store widgets for later access
         row.app_name = app_info.name
         row.size_entry = size_entry
         row.mode_combo = mode_combo
         row.enable_switch = switch
+        row.rules_row = rules_row
         
         return row
     
+    def _refresh_rule_savings(self):
+        """Read what each app's exclude patterns saved in the last sync in
+        the background (sync_engine's small state files); the patterns and
+        paths are taken from the config here on the main loop"""
+        args = {name: self.folder_manager.get_rule_savings_args(name)
+                for name in self.app_rows}
+        self.task_runner.submit(
+            self._read_rule_savings, args,
+            on_done=self._show_rule_savings,
+            key="rule-savings",
+            coalesce=True
+        )
+    
+    @staticmethod
+    def _read_rule_savings(args):
+        return {name: FolderManager.read_rule_savings(patterns, paths)
+                for name, (patterns, paths) in args.items()}
+    
+    def _show_rule_savings(self, savings_by_app):
+        """Show each app's exclude patterns with the bytes each saved"""
+        for app_name, savings in savings_by_app.items():
+            row = self.app_rows.get(app_name)
+            if not row:
+                continue
+            if not savings:
+                row.rules_row.set_subtitle("None (set include/exclude in /etc/ssdsaver/folders.conf)")
+                continue
+            row.rules_row.set_subtitle(", ".join(
+                f"{pattern} ({nbytes / (1024 * 1024):.1f} MB)" for pattern, nbytes in savings.items()
+            ) + " saved in the last sync")
+    
     def on_app_toggled(self, app_name, state):
         """Handle app enable/disable toggle"""
         if state:  # Enabling the app
@@ -517,14 +699,6 @@ class MainWindow(Adw.ApplicationWindow):
                     dialog.present()
                     return True  # Block the toggle
 
-                # Check if existing cache is larger than allocated size
-                # Get fresh paths
-                app_info = next((a for a in self.detected_apps if a.name == app_name), None)
-                detected_paths = app_info.cache_paths if app_info else None
-                
-                current_app_usage = self.folder_manager.get_app_actual_usage(app_name, detected_paths)
-                size_mb = self.folder_manager._parse_size_to_mb(size_str)
-                
                 # Check if existing cache is larger than allocated size
                 # We now auto-clear on apply, so no dialog needed here.
                 # Just proceed.
@@ -543,8 +717,9 @@ class MainWindow(Adw.ApplicationWindow):
     
     def on_detect_apps_clicked(self, btn):
         """Refresh app detection"""
-        self.detect_apps()
-        self.toast_overlay.add_toast(Adw.Toast.new(f"Found {len(self.detected_apps)} applications"))
+        self.detect_apps(on_done=lambda: self.toast_overlay.add_toast(
+            Adw.Toast.new(f"Found {len(self.detected_apps)} applications")
+        ))
     
     def on_apply_apps_clicked(self, btn):
         """Apply application cache settings"""
@@ -553,29 +728,55 @@ class MainWindow(Adw.ApplicationWindow):
         
         # Build configuration
         app_configs = {}
+        caches_to_clear = {}
         
         for app_name, row in self.app_rows.items():
-            if row.enable_switch.get_active():
-                # Get app info
-                app_info = next((a for a in self.detected_apps if a.name == app_name), None)
-                if not app_info:
-                    continue
-                
-                # Auto-clear cache if newly enabled
-                if app_name not in currently_enabled:
-                    if self.folder_manager.clear_app_cache(app_name, app_info.cache_paths):
-                        self.toast_overlay.add_toast(Adw.Toast.new(f"Cleared existing cache for {app_name}"))
-                
-                size = row.size_entry.get_text()
-                mode = "safe" if row.mode_combo.get_selected() == 0 else "lossy"
-                
-                app_configs[app_name] = {
-                    "enabled": "true",
-                    "size": size,
-                    "mode": mode,
-                    # Always use fresh paths from detector, not stale config
-                    "paths": ";".join(app_info.cache_paths)
-                }
+            # Get app info
+            app_info = next((a for a in self.detected_apps if a.name == app_name), None)
+            if not app_info:
+                continue
+            
+            if not row.enable_switch.get_active():
+                if app_info.is_custom:
+                    # Keep disabled custom folders so they stay listed
+                    app_configs[app_name] = {
+                        "custom": "true",
+                        "display_name": app_info.display_name,
+                        "enabled": "false",
+                        "size": row.size_entry.get_text(),
+                        "paths": ";".join(app_info.cache_paths)
+                    }
+                continue
+            
+            # Auto-clear cache if newly enabled (never for custom folders,
+            # which may hold data rather than disposable cache)
+            if app_name not in currently_enabled and not app_info.is_custom:
+                caches_to_clear[app_name] = app_info.cache_paths
+            
+            size = row.size_entry.get_text()
+            mode = self.folder_manager.MODES[row.mode_combo.get_selected()]
+            
+            # Remember when the app moved to RAM for before/after write rates
+            old_config = self.folder_manager.get_app_config(app_name) or {}
+            enabled_at = old_config.get("enabled_at")
+            if app_name not in currently_enabled or not enabled_at:
+                enabled_at = str(int(time.time()))
+            
+            app_configs[app_name] = {
+                "enabled": "true",
+                "size": size,
+                "mode": mode,
+                # Always use fresh paths from detector, not stale config
+                "paths": ";".join(app_info.cache_paths),
+                "enabled_at": enabled_at
+            }
+            # Ignore rules, durability and checkpoints are edited in folders.conf
+            for key in ("include", "exclude", "durability", "checkpoint"):
+                if key in old_config:
+                    app_configs[app_name][key] = old_config[key]
+            if app_info.is_custom:
+                app_configs[app_name]["custom"] = "true"
+                app_configs[app_name]["display_name"] = app_info.display_name
         
         # Validate Total Budget
         budget_mb = self.folder_manager.get_global_budget()
@@ -602,16 +803,105 @@ class MainWindow(Adw.ApplicationWindow):
             dialog.present()
             return
 
-        # Preserve Global Budget
-        app_configs['GLOBAL'] = {'budget': f"{budget_mb}M"}
+        # Preserve Global Budget (and pool mode, write-back limit)
+        app_configs['GLOBAL'] = dict(self.folder_manager.get_app_config('GLOBAL') or {},
+                                     budget=f"{budget_mb}M")
+        
+        def clear_and_save():
+            cleared = [
+                app_name for app_name, paths in caches_to_clear.items()
+                if self.folder_manager.clear_app_cache(app_name, paths)
+            ]
+            return cleared, self.folder_manager.save_all_configs(app_configs)
+        
+        def on_saved(result):
+            cleared, saved = result
+            for app_name in cleared:
+                self.toast_overlay.add_toast(Adw.Toast.new(f"Cleared existing cache for {app_name}"))
+            if saved:
+                self.toast_overlay.add_toast(Adw.Toast.new("Configuration saved! Restart service to apply."))
+                self._update_settings_usage()  # Refresh Settings tab usage display
+                self._update_write_stats()
+            else:
+                self.toast_overlay.add_toast(Adw.Toast.new("Failed to save configuration"))
+                self.apply_apps_btn.set_sensitive(True)
         
-        # Save configuration
-        if self.folder_manager.save_all_configs(app_configs):
-            self.toast_overlay.add_toast(Adw.Toast.new("Configuration saved! Restart service to apply."))
-            self.apply_apps_btn.set_sensitive(False)
-            self._update_settings_usage()  # Refresh Settings tab usage display
-        else:
-            self.toast_overlay.add_toast(Adw.Toast.new("Failed to save configuration"))
+        # Save configuration (rmtree and the pkexec prompt run off the main loop)
+        self.apply_apps_btn.set_sensitive(False)
+        self.task_runner.submit(clear_and_save, on_done=on_saved)
+    
+    def on_discover_clicked(self, btn):
+        """Start write discovery, or stop a running one early"""
+        if self.task_runner.is_running("discover"):
+            self.discover_stop.set()
+            self.discover_btn.set_sensitive(False)
+            return
+        
+        # Skip folders that are already in RAM
+        exclude = ["/var/log"]
+        for app_name in self.folder_manager.get_enabled_apps():
+            exclude.extend(self.folder_manager._expand_usage_paths(self._get_app_paths(app_name)))
+        
+        duration = self.discover_minutes.get_value_as_int() * 60
+        self.discover_stop.clear()
+        
+        def discover(task):
+            discovery = WriteDiscovery()
+            try:
+                discovery.run(duration, should_stop=lambda: task.cancelled or self.discover_stop.is_set())
+                return discovery.results(8, exclude)
+            finally:
+                discovery.close()
+        
+        def on_error(error):
+            self.toast_overlay.add_toast(Adw.Toast.new(f"Discovery failed: {error}"))
+            self._reset_discover_button()
+        
+        self.task_runner.submit(discover, on_done=self._show_discovered, on_error=on_error,
+                                key="discover", coalesce=True, pass_task=True)
+        self.discover_btn.set_label("Stop")
+        self.toast_overlay.add_toast(Adw.Toast.new(
+            f"Watching for disk writes for {duration // 60} minutes..."
+        ))
+    
+    def _reset_discover_button(self):
+        self.discover_btn.set_label("Discover")
+        self.discover_btn.set_sensitive(True)
+    
+    def _show_discovered(self, results):
+        self._reset_discover_button()
+        for row in self.discover_rows:
+            self.discover_group.remove(row)
+        self.discover_rows = []
+        
+        if not results:
+            row = Adw.ActionRow(title="No busy folders found", subtitle="Try watching for longer")
+            self.discover_group.add(row)
+            self.discover_rows.append(row)
+            return
+        
+        for activity in results:
+            row = Adw.ActionRow(
+                title=activity.path,
+                subtitle=(f"{activity.bytes_per_hour / (1024 * 1024):.1f} MB/h written, "
+                          f"{activity.size_bytes / (1024 * 1024):.1f} MB in size, "
+                          f"suggested {activity.suggested_size}")
+            )
+            add_btn = Gtk.Button(label="Add")
+            add_btn.set_valign(Gtk.Align.CENTER)
+            add_btn.connect("clicked", self.on_add_discovered_clicked, row, activity)
+            row.add_suffix(add_btn)
+            self.discover_group.add(row)
+            self.discover_rows.append(row)
+    
+    def on_add_discovered_clicked(self, btn, row, activity):
+        """Add a discovered folder to the application list"""
+        self.folder_manager.add_custom_target(activity.path, activity.suggested_size)
+        self.discover_group.remove(row)
+        self.discover_rows.remove(row)
+        self.detect_apps()
+        self.apply_apps_btn.set_sensitive(True)
+        self.toast_overlay.add_toast(Adw.Toast.new("Folder added. Enable it and apply to move it to RAM."))
     
     def _update_ram_usage(self):
         """Update RAM usage display"""
@@ -645,6 +935,120 @@ class MainWindow(Adw.ApplicationWindow):
                 self.usage_progress.remove_css_class("error")
     
     
+    def _update_write_stats(self):
+        """Load SSD write accounting in the background"""
+        enabled_at = {}
+        for app_name in self.folder_manager.get_enabled_apps():
+            config = self.folder_manager.get_app_config(app_name) or {}
+            try:
+                enabled_at[app_name] = int(config.get("enabled_at", ""))
+            except ValueError:
+                continue  # enabled before write accounting existed
+        
+        self.task_runner.submit(
+            self._read_write_stats, enabled_at,
+            on_done=self._show_write_stats,
+            key="diskstats",
+            coalesce=True
+        )
+    
+    @staticmethod
+    def _read_write_stats(enabled_at):
+        """Read the diskstats store (runs on a worker)"""
+        stats = DiskStats()
+        try:
+            device = stats.get_device()
+            if not device:
+                return None
+            now = time.time()
+            today = stats.daily_totals(1, now)
+            partition = DiskStats.find_root_partition()
+            return {
+                "device": device,
+                "today": today[0][1] if today else 0,
+                "rate": stats.write_rate(now - 86400, now),
+                "lifetime": DiskStats.read_lifetime_written(partition, device) if partition else {},
+                "apps": {
+                    app_name: stats.compare_rates(since, now=now)
+                    for app_name, since in enabled_at.items()
+                }
+            }
+        finally:
+            stats.close()
+    
+    def _show_write_stats(self, result):
+        for row in self.write_rows:
+            self.writes_group.remove(row)
+        self.write_rows = []
+        
+        def add_row(title, value, subtitle=None):
+            row = Adw.ActionRow(title=title)
+            if subtitle:
+                row.set_subtitle(subtitle)
+            label = Gtk.Label(label=value)
+            label.add_css_class("dim-label")
+            row.add_suffix(label)
+            self.writes_group.add(row)
+            self.write_rows.append(row)
+        
+        if result is None:
+            add_row("No data yet", "", "Write statistics are collected hourly once the service is installed")
+            return
+        
+        add_row("Disk", result["device"])
+        add_row("Written Today", f"{result['today'] / (1024 * 1024):.0f} MB")
+        rate = result["rate"]
+        add_row("Write Rate (24h)", f"{rate.mb_per_hour:.1f} MB/h" if rate.hours else "-")
+        for source, value in result["lifetime"].items():
+            name = "NVMe" if source == "nvme" else "Filesystem"
+            add_row(f"Lifetime Written ({name})", f"{value / 1024 ** 4:.2f} TB")
+        
+        for app_name, (before, after) in sorted(result["apps"].items()):
+            if not before.hours or not after.hours:
+                value = "Collecting..."
+            else:
+                value = f"{before.mb_per_hour:.1f} → {after.mb_per_hour:.1f} MB/h"
+            add_row(app_name, value, "Disk write rate before → after moving to RAM")
+    
+    def _update_writers(self):
+        """Sample /proc/[pid]/io in the background"""
+        self.task_runner.submit(
+            self._sample_writers,
+            on_done=self._show_writers,
+            key="process-io",
+            coalesce=True
+        )
+        return True  # Continue timer
+    
+    def _sample_writers(self):
+        self.process_io.sample()
+        return self.process_io.leaderboard(8)
+    
+    def _show_writers(self, writers):
+        for row in self.writer_rows:
+            self.writers_group.remove(row)
+        self.writer_rows = []
+        
+        enabled_apps = set(self.folder_manager.get_enabled_apps())
+        if not writers:
+            row = Adw.ActionRow(title="Measuring...", subtitle="No disk writes seen yet")
+            self.writers_group.add(row)
+            self.writer_rows.append(row)
+        
+        for writer in writers:
+            if writer.app_id in enabled_apps:
+                subtitle = "Cache already in RAM"
+            elif writer.app_id:
+                subtitle = "Candidate: supported app not in RAM yet"
+            else:
+                subtitle = f"Not a supported app ({writer.processes} processes)"
+            row = Adw.ActionRow(title=writer.display_name, subtitle=subtitle)
+            label = Gtk.Label(label=f"{writer.mb_per_hour:.1f} MB/h")
+            label.add_css_class("dim-label")
+            row.add_suffix(label)
+            self.writers_group.add(row)
+            self.writer_rows.append(row)
+    
     def on_config_changed(self, widget, *args):
         """Called when any configuration value changes"""
         # Check if current values differ from original
@@ -671,34 +1075,44 @@ class MainWindow(Adw.ApplicationWindow):
             "ZL2R": "true" if self.switch_zl2r.get_active() else "false"
         }
         
-        success = self.config_manager.save_config(new_config)
-        if success:
-            self.original_config = new_config.copy()  # Update original values
-            self.save_btn.set_sensitive(False)  # Disable save button
-            self.toast_overlay.add_toast(Adw.Toast.new("Configuration saved!"))
-        else:
-            self.toast_overlay.add_toast(Adw.Toast.new("Failed to save configuration."))
+        def on_saved(success):
+            if success:
+                self.original_config = new_config.copy()  # Update original values
+                self.toast_overlay.add_toast(Adw.Toast.new("Configuration saved!"))
+            else:
+                self.save_btn.set_sensitive(True)
+                self.toast_overlay.add_toast(Adw.Toast.new("Failed to save configuration."))
+        
+        self.save_btn.set_sensitive(False)  # Disable save button
+        self.task_runner.submit(self.config_manager.save_config, new_config,
+                                on_done=on_saved)
+
+    def _run_service_action(self, action, success_msg, failure_msg):
+        """Run a service action (pkexec systemctl) in the background"""
+        def on_done(success):
+            self.controls_box.set_sensitive(True)
+            if success:
+                self.toast_overlay.add_toast(Adw.Toast.new(success_msg))
+                self._update_status()
+                # Stopping and restarting write back, refreshing the stats
+                self._refresh_rule_savings()
+            else:
+                self.toast_overlay.add_toast(Adw.Toast.new(failure_msg))
+        
+        self.controls_box.set_sensitive(False)
+        self.task_runner.submit(action, on_done=on_done, key="service")
 
     def on_start_clicked(self, btn):
-        if self.service_manager.start_service():
-            self.toast_overlay.add_toast(Adw.Toast.new("Service started"))
-            self._update_status()
-        else:
-            self.toast_overlay.add_toast(Adw.Toast.new("Failed to start service"))
+        self._run_service_action(self.service_manager.start_service,
+                                 "Service started", "Failed to start service")
 
     def on_stop_clicked(self, btn):
-        if self.service_manager.stop_service():
-            self.toast_overlay.add_toast(Adw.Toast.new("Service stopped"))
-            self._update_status()
-        else:
-            self.toast_overlay.add_toast(Adw.Toast.new("Failed to stop service"))
+        self._run_service_action(self.service_manager.stop_service,
+                                 "Service stopped", "Failed to stop service")
 
     def on_restart_clicked(self, btn):
-        if self.service_manager.restart_service():
-            self.toast_overlay.add_toast(Adw.Toast.new("Service restarted"))
-            self._update_status()
-        else:
-            self.toast_overlay.add_toast(Adw.Toast.new("Failed to restart service"))
+        self._run_service_action(self.service_manager.restart_service,
+                                 "Service restarted", "Failed to restart service")
     
     def on_budget_changed(self, slider):
         """Handle budget slider changes"""
@@ -768,16 +1182,23 @@ class MainWindow(Adw.ApplicationWindow):
         
         # Save budget
         self.folder_manager.set_global_budget(new_budget)
+        self.folder_manager.set_pool_mode(self.pool_switch.get_active())
+        self.folder_manager.set_writeback_rate(int(self.writeback_spinbutton.get_value()))
         
         # Save config and update log2ram
         app_configs = self.folder_manager._config_to_dict()
         # GLOBAL section is included in _config_to_dict, so we keep it to ensure it's saved
         
-        if self.folder_manager.save_all_configs(app_configs):
-            self.toast_overlay.add_toast(Adw.Toast.new(f"Budget set to {new_budget} MB. Restart service to apply."))
-            self.apply_budget_btn.set_sensitive(False)
-        else:
-            self.toast_overlay.add_toast(Adw.Toast.new("Failed to save configuration"))
+        def on_saved(success):
+            if success:
+                self.toast_overlay.add_toast(Adw.Toast.new(f"Budget set to {new_budget} MB. Restart service to apply."))
+            else:
+                self.apply_budget_btn.set_sensitive(True)
+                self.toast_overlay.add_toast(Adw.Toast.new("Failed to save configuration"))
+        
+        self.apply_budget_btn.set_sensitive(False)
+        self.task_runner.submit(self.folder_manager.save_all_configs, app_configs,
+                                on_done=on_saved)
     
     
     def show_about_dialog(self):
@@ -848,7 +1269,8 @@ class MainWindow(Adw.ApplicationWindow):
         # Add rows for new enabled apps
         for app_name in enabled_apps:
             if app_name not in self.usage_rows:
-                row = Adw.ActionRow(title=app_name)
+                config = self.folder_manager.get_app_config(app_name) or {}
+                row = Adw.ActionRow(title=config.get("display_name", app_name))
                 
                 box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
                 box.set_valign(Gtk.Align.CENTER)
@@ -873,6 +1295,62 @@ class MainWindow(Adw.ApplicationWindow):
                 self.details_group.add(row)
                 
                 self.usage_rows[app_name] = (row, val_label, prog)
+        
+        self._sync_usage_watches(enabled_apps)
+
+    def _get_app_paths(self, app_name):
+        """Get fresh cache paths from detected apps, falling back to config paths"""
+        app_info = next((a for a in self.detected_apps if a.name == app_name), None)
+        if app_info:
+            return app_info.cache_paths
+        config = self.folder_manager.get_app_config(app_name) or {}
+        return config["paths"].split(";") if "paths" in config else []
+
+    def _sync_usage_watches(self, enabled_apps):
+        """Watch cache paths of enabled apps and hook the watcher into the main loop"""
+        watched = self.usage_watcher.get_watched_apps()
+        for app_name in enabled_apps:
+            if app_name not in watched:
+                paths = self._get_app_paths(app_name)
+                paths = self.folder_manager._expand_usage_paths(paths)
+                self.usage_watcher.watch_app(app_name, paths)
+                self._seed_usage_watch(app_name, paths)
+        
+        for app_name in self.usage_watcher.get_watched_apps():
+            if app_name not in enabled_apps:
+                self.usage_watcher.unwatch_app(app_name)
+        
+        for fd in self.usage_watcher.filenos():
+            if fd not in self.usage_watch_fds:
+                GLib.io_add_watch(fd, GLib.PRIORITY_DEFAULT, GLib.IO_IN, self._on_usage_events)
+                self.usage_watch_fds.add(fd)
+
+    def _seed_usage_watch(self, app_name, paths):
+        """Take the initial snapshot of a watched app's files in the background"""
+        self.task_runner.submit(
+            UsageWatcher.snapshot, paths,
+            on_done=lambda files: self.usage_watcher.seed_app(app_name, files),
+            key=f"seed:{app_name}"
+        )
+
+    def _on_usage_events(self, fd, condition):
+        """Main loop callback: apply filesystem events to the usage counters"""
+        changed = self.usage_watcher.process_events()
+        for app_name in self.usage_watcher.take_reseed_requests():
+            self._seed_usage_watch(app_name, self.usage_watcher.get_roots(app_name))
+        
+        for app_name in changed:
+            self._record_usage(app_name, self.usage_watcher.get_usage(app_name))
+        return True  # Keep watching
+
+    def _on_close_request(self, window):
+        self.task_runner.shutdown()
+        self.usage_watcher.close()
+        self.usage_history.close()
+        if self.loop_monitor:
+            self.loop_monitor.stop()
+            print(self.loop_monitor.report())
+        return False
 
     def _update_usage_stats(self):
         """Timer callback to update usage statistics"""
@@ -887,54 +1365,104 @@ class MainWindow(Adw.ApplicationWindow):
         if len(enabled_apps) != len(self.usage_rows):
             self._refresh_usage_list()
             
+        # Apps whose paths are watched already have exact, event-driven counts;
+        # only the rest are measured, all of them in one parallel pass
+        app_paths = {}
+        ram_paths = ["/var/log"]
         for app_name in enabled_apps:
-            # Get fresh paths from detected apps if available
-            app_info = next((a for a in self.detected_apps if a.name == app_name), None)
-            detected_paths = app_info.cache_paths if app_info else None
-            
-            # Get current usage
-            current = self.folder_manager.get_app_actual_usage(app_name, detected_paths)
-            
-            # Update peak
-            peak = self.peak_usage.get(app_name, 0.0)
-            if current > peak:
-                self.peak_usage[app_name] = current
-                peak = current
-            
-            # Get allocated size for percentage
-            config = self.folder_manager.get_app_config(app_name)
-            allocated_str = config.get("size", "0M")
-            allocated = self.folder_manager._parse_size_to_mb(allocated_str)
+            paths = self._get_app_paths(app_name)
+            ram_paths.extend(paths)
+            if self.usage_watcher.is_watching(app_name):
+                self._record_usage(app_name, self.usage_watcher.get_usage(app_name))
+            else:
+                app_paths[app_name] = paths
+        
+        self.task_runner.submit(
+            self._measure_ram, ram_paths,
+            on_done=self._show_ram_account,
+            key="ram-account",
+            coalesce=True
+        )
+        
+        if app_paths:
+            # Only one scan in flight; a slow scan simply skips timer ticks
+            self.task_runner.submit(
+                self.folder_manager.get_apps_usage, app_paths,
+                on_done=self._show_polled_usage,
+                key="usage",
+                coalesce=True
+            )
+        
+        return True  # Keep timer running
+
+    def _measure_ram(self, paths):
+        """Measure the RAM consumed by our mounts (runs on a worker; the
+        paths are collected on the main loop)"""
+        return self.ram_accounting.measure(FolderManager._expand_usage_paths(paths))
+    
+    def _show_ram_account(self, account):
+        self.actual_label.set_label(f"{account.resident_mb} MB")
+        details = [f"{account.mounts} mounts"]
+        if account.tmpfs_swapped:
+            details.append(f"~{account.tmpfs_swapped // (1024 * 1024)} MB swapped out")
+        if account.zram_data:
+            details.append(f"zram holds {account.zram_data // (1024 * 1024)} MB")
+        details.append(f"{account.mem_available // (1024 * 1024)} MB free system RAM")
+        self.actual_row.set_subtitle(", ".join(details))
+    
+    def _show_polled_usage(self, usage):
+        """Render results of a background usage scan"""
+        for app_name, app_usage in usage.items():
+            self._record_usage(app_name, app_usage)
+
+    def _record_usage(self, app_name, usage):
+        """Store a usage sample in the history and show it"""
+        self.current_usage[app_name] = usage
+        self.usage_history.record(app_name, usage)
+        self._render_usage_row(app_name)
+
+    def _render_usage_row(self, app_name):
+        """Show current or peak usage for one app against its allocation"""
+        if app_name not in self.current_usage:
+            return
+        
+        # Get allocated size for percentage
+        config = self.folder_manager.get_app_config(app_name)
+        if not config:
+            return
+        allocated_str = config.get("size", "0M")
+        allocated = self.folder_manager._parse_size_to_mb(allocated_str)
+        
+        # Update UI if row exists
+        if app_name in self.usage_rows:
+            _, label, prog = self.usage_rows[app_name]
             
-            # Update UI if row exists
-            if app_name in self.usage_rows:
-                _, label, prog = self.usage_rows[app_name]
-                
-                display_val = current if self.usage_mode == "current" else peak
+            if self.usage_mode == "current":
+                display_val = self.current_usage[app_name].mb
                 label.set_label(f"{display_val:.1f} MB / {allocated} MB")
+            else:
+                stats = self.usage_history.stats(app_name, self.usage_mode)
+                display_val = stats.max_mb
+                label.set_label(
+                    f"{display_val:.1f} MB peak, {stats.p95_mb:.1f} MB p95 / {allocated} MB"
+                )
+            
+            if allocated > 0:
+                fraction = min(1.0, display_val / allocated)
+                prog.set_fraction(fraction)
                 
-                if allocated > 0:
-                    fraction = min(1.0, display_val / allocated)
-                    prog.set_fraction(fraction)
-                    
-                    # Color coding
-                    if display_val > allocated:
-                        prog.add_css_class("error")
-                    elif fraction > 0.9:
-                        prog.add_css_class("warning")
-                    else:
-                        prog.remove_css_class("error")
-                        prog.remove_css_class("warning")
-        
-        return True  # Keep timer running
+                # Color coding
+                if display_val > allocated:
+                    prog.add_css_class("error")
+                elif fraction > 0.9:
+                    prog.add_css_class("warning")
+                else:
+                    prog.remove_css_class("error")
+                    prog.remove_css_class("warning")
 
-    def on_usage_mode_toggled(self, btn):
-        if btn.get_active():
-            self.usage_mode = "current"
-            btn.set_label("Current Usage")
-        else:
-            self.usage_mode = "peak"
-            btn.set_label("Session Peak")
+    def on_usage_mode_changed(self, combo, param):
+        self.usage_mode = ["current", "hour", "day", "week"][combo.get_selected()]
         
-        # Force immediate update
-        self._update_usage_stats()
+        # Re-render from the latest samples and stored history
+        for app_name in list(self.usage_rows.keys()):
+            self._render_usage_row(app_name)
@@ -0,0 +1,265 @@
+"""
+Usage history module for SSDsaver.
+Keeps a week of per-app usage samples in fixed-size ring buffers persisted
+to a small memory-mapped file, so peaks survive between sessions and can be
+used to size tmpfs mounts.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from usage_scanner import PathUsage
+
+
+@dataclass
+class UsageStats:
+    """Aggregates over a time window"""
+    samples: int = 0
+    min_bytes: int = 0
+    max_bytes: int = 0
+    p95_bytes: int = 0
+    max_files: int = 0
+
+    @property
+    def max_mb(self) -> float:
+        return self.max_bytes / (1024 * 1024)
+
+    @property
+    def p95_mb(self) -> float:
+        return self.p95_bytes / (1024 * 1024)
+
+    @property
+    def min_mb(self) -> float:
+        return self.min_bytes / (1024 * 1024)
+
+
+class _Ring:
+    """Ring buffer of (bucket, files, bytes) samples for one app.
+
+    Stored as an array of 64-bit words, two per sample:
+    [bucket << 32 | files, bytes]. The same layout is used on disk.
+    """
+
+    def __init__(self, capacity: int, data: bytes = None, head: int = 0, count: int = 0):
+        self.capacity = capacity
+        self.words = array("Q", bytes(capacity * 16) if data is None else data)
+        self.head = head      # index of the next sample to write
+        self.count = count
+        self.dirty = set()    # sample indexes changed since last flush
+
+    def last_index(self) -> Optional[int]:
+        if self.count == 0:
+            return None
+        return (self.head - 1) % self.capacity
+
+    def add(self, bucket: int, files: int, nbytes: int):
+        """Record a sample; samples within the same bucket keep the maximum"""
+        files = min(files, 0xffffffff)
+        last = self.last_index()
+        if last is not None and self.words[2 * last] >> 32 == bucket:
+            old_files = self.words[2 * last] & 0xffffffff
+            self.words[2 * last] = (bucket << 32) | max(old_files, files)
+            self.words[2 * last + 1] = max(self.words[2 * last + 1], nbytes)
+            self.dirty.add(last)
+            return
+
+        index = self.head
+        self.words[2 * index] = (bucket << 32) | files
+        self.words[2 * index + 1] = nbytes
+        self.dirty.add(index)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def since(self, first_bucket: int):
+        """Yield (files, bytes) for samples at or after first_bucket, newest first"""
+        for n in range(self.count):
+            index = (self.head - 1 - n) % self.capacity
+            word = self.words[2 * index]
+            if word >> 32 < first_bucket:
+                break
+            yield word & 0xffffffff, self.words[2 * index + 1]
+
+
+class UsageHistory:
+    """Per-app usage history backed by a fixed-size memory-mapped file.
+
+    Samples are aggregated into BUCKET_SECONDS buckets (keeping the maximum)
+    in memory and copied into the mapping at most every FLUSH_INTERVAL, so
+    the history itself causes only a few page writes per flush.
+    """
+
+    MAGIC = b"SSDHIST1"
+    BUCKET_SECONDS = 60
+    CAPACITY = 7 * 24 * 60  # one week of one-minute buckets
+    MAX_APPS = 16
+    NAME_BYTES = 48
+    FLUSH_INTERVAL = 15 * 60
+
+    WINDOWS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+    _HEADER = struct.Struct("=8sIIII")           # magic, version, slots, capacity, bucket seconds
+    _HEADER_SIZE = 64
+    _SLOT = struct.Struct(f"={NAME_BYTES}sII")  # name, head, count
+    _SLOT_SIZE = 64
+
+    def __init__(self, path: str = None, readonly: bool = False):
+        self.path = path or self.default_path()
+        self.readonly = readonly
+        self._rings: Dict[str, _Ring] = {}
+        self._slots: Dict[str, int] = {}
+        self._mmap = None
+        self._last_flush = time.monotonic()
+        self._open()
+
+    @staticmethod
+    def default_path() -> str:
+        data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+        return os.path.join(data_home, "ssdsaver", "usage-history.bin")
+
+    @classmethod
+    def file_size(cls) -> int:
+        return (cls._HEADER_SIZE + cls.MAX_APPS * cls._SLOT_SIZE
+                + cls.MAX_APPS * cls.CAPACITY * 16)
+
+    def _slot_offset(self, slot: int) -> int:
+        return self._HEADER_SIZE + slot * self._SLOT_SIZE
+
+    def _data_offset(self, slot: int) -> int:
+        return self._HEADER_SIZE + self.MAX_APPS * self._SLOT_SIZE + slot * self.CAPACITY * 16
+
+    def _open(self):
+        size = self.file_size()
+        try:
+            if self.readonly:
+                fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+            else:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        except OSError as e:
+            print(f"Usage history unavailable: {e}")
+            return
+
+        try:
+            if os.fstat(fd).st_size != size:
+                if self.readonly:
+                    return
+                # New or incompatible file: start over with an empty, sparse one
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                self._mmap = mmap.mmap(fd, size)
+                self._HEADER.pack_into(self._mmap, 0, self.MAGIC, 1, self.MAX_APPS,
+                                       self.CAPACITY, self.BUCKET_SECONDS)
+                self._mmap.flush()
+                return
+
+            access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+            self._mmap = mmap.mmap(fd, size, access=access)
+        finally:
+            os.close(fd)
+
+        magic, _version, slots, capacity, bucket = self._HEADER.unpack_from(self._mmap, 0)
+        if (magic, slots, capacity, bucket) != (self.MAGIC, self.MAX_APPS,
+                                                self.CAPACITY, self.BUCKET_SECONDS):
+            print(f"Ignoring incompatible usage history {self.path}")
+            self._mmap.close()
+            self._mmap = None
+            return
+
+        for slot in range(self.MAX_APPS):
+            raw_name, head, count = self._SLOT.unpack_from(self._mmap, self._slot_offset(slot))
+            name = raw_name.rstrip(b"\0").decode("utf-8", "replace")
+            if not name:
+                continue
+            start = self._data_offset(slot)
+            self._rings[name] = _Ring(self.CAPACITY, self._mmap[start:start + self.CAPACITY * 16],
+                                      head % self.CAPACITY, min(count, self.CAPACITY))
+            self._slots[name] = slot
+
+    def apps(self) -> List[str]:
+        return list(self._rings)
+
+    def record(self, app_name: str, usage: PathUsage, now: float = None):
+        """Add a sample for an app (kept in memory until the next flush)"""
+        ring = self._rings.get(app_name)
+        if ring is None:
+            if len(self._rings) >= self.MAX_APPS or self.readonly:
+                return
+            ring = self._rings[app_name] = _Ring(self.CAPACITY)
+
+        bucket = int((now if now is not None else time.time()) // self.BUCKET_SECONDS)
+        ring.add(bucket, usage.files, usage.bytes)
+
+        if time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def stats(self, app_name: str, window: str, now: float = None) -> UsageStats:
+        """min/max/p95 over the "hour", "day" or "week" window"""
+        ring = self._rings.get(app_name)
+        if ring is None:
+            return UsageStats()
+
+        now = now if now is not None else time.time()
+        first_bucket = int((now - self.WINDOWS[window]) // self.BUCKET_SECONDS) + 1
+        values = []
+        max_files = 0
+        for files, nbytes in ring.since(first_bucket):
+            values.append(nbytes)
+            max_files = max(max_files, files)
+        if not values:
+            return UsageStats()
+
+        values.sort()
+        p95 = values[max(0, -(-len(values) * 95 // 100) - 1)]
+        return UsageStats(len(values), values[0], values[-1], p95, max_files)
+
+    def flush(self):
+        """Copy changed samples into the mapping and write them out"""
+        self._last_flush = time.monotonic()
+        if self._mmap is None or self.readonly:
+            return
+
+        used = set(self._slots.values())
+        for name, ring in self._rings.items():
+            if not ring.dirty:
+                continue
+            slot = self._slots.get(name)
+            if slot is None:
+                slot = next(s for s in range(self.MAX_APPS) if s not in used)
+                used.add(slot)
+                self._slots[name] = slot
+
+            base = self._data_offset(slot)
+            for index in ring.dirty:
+                self._mmap[base + index * 16:base + index * 16 + 16] = \
+                    ring.words[2 * index:2 * index + 2].tobytes()
+            ring.dirty.clear()
+            self._SLOT.pack_into(self._mmap, self._slot_offset(slot),
+                                 name.encode()[:self.NAME_BYTES], ring.head, ring.count)
+        self._mmap.flush()
+
+    def close(self):
+        self.flush()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def main():
+    """Print hour/day/week aggregates for every recorded app"""
+    history = UsageHistory(sys.argv[1] if len(sys.argv) > 1 else None, readonly=True)
+    print(f"{'app':<16}{'window':<8}{'min MB':>10}{'p95 MB':>10}{'max MB':>10}{'max files':>11}")
+    for app_name in sorted(history.apps()):
+        for window in UsageHistory.WINDOWS:
+            st = history.stats(app_name, window)
+            print(f"{app_name:<16}{window:<8}{st.min_mb:>10.1f}{st.p95_mb:>10.1f}"
+                  f"{st.max_mb:>10.1f}{st.max_files:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Usage scanner module for SSDsaver.
+Measures disk usage of cache directories in-process with os.scandir,
+reusing per-directory totals between scans so that only directories whose
+contents changed are read again.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class PathUsage:
+    """Disk usage totals for a path"""
+    bytes: int = 0
+    files: int = 0
+
+    @property
+    def mb(self) -> float:
+        """Usage in MB (MiB, same unit as `du -sk` / 1024)"""
+        return self.bytes / (1024 * 1024)
+
+    def __add__(self, other: "PathUsage") -> "PathUsage":
+        return PathUsage(self.bytes + other.bytes, self.files + other.files)
+
+
+@dataclass
+class _DirRecord:
+    """Cached totals for the direct (non-directory) children of one directory"""
+    dev: int
+    ino: int
+    mtime_ns: int
+    own_bytes: int
+    own_files: int
+    subdirs: List[str] = field(default_factory=list)
+
+
+class UsageScanner:
+    """Incremental `du -sk` replacement.
+
+    A directory's mtime changes whenever an entry is created, removed or
+    renamed inside it, so a directory whose (dev, inode, mtime) is unchanged
+    since the previous scan keeps its cached file totals and only its
+    subdirectories are visited. Files that grow in place without any
+    directory change are picked up the next time their directory changes.
+    """
+
+    MAX_WORKERS = 4
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self._records: Dict[str, Dict[str, _DirRecord]] = {}  # root -> dir -> record
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def scan(self, path: str) -> PathUsage:
+        """Return the usage of a single path (file or directory tree)"""
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return PathUsage()
+
+        if not os.path.isdir(path) or os.path.islink(path):
+            return PathUsage(st.st_blocks * 512, 1)
+
+        with self._lock:
+            previous = self._records.get(path, {})
+
+        usage, records = self._walk(path, previous)
+
+        with self._lock:
+            self._records[path] = records
+        return usage
+
+    def scan_many(self, paths: List[str]) -> Dict[str, PathUsage]:
+        """Scan several paths concurrently, returning usage per path"""
+        unique = list(dict.fromkeys(paths))
+        if len(unique) <= 1:
+            return {p: self.scan(p) for p in unique}
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="ssdsaver-scan"
+            )
+        return dict(zip(unique, self._executor.map(self.scan, unique)))
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drop cached totals for one root path, or for all of them"""
+        with self._lock:
+            if path is None:
+                self._records.clear()
+            else:
+                self._records.pop(path, None)
+
+    @staticmethod
+    def _walk(root: str, previous: Dict[str, _DirRecord]):
+        """Walk a tree, reusing records of unchanged directories"""
+        records = {}
+        total_bytes = 0
+        total_files = 0
+        stack = [root]
+
+        while stack:
+            directory = stack.pop()
+            try:
+                st = os.lstat(directory)
+            except OSError:
+                continue
+
+            record = previous.get(directory)
+            if (record is None or record.ino != st.st_ino or record.dev != st.st_dev
+                    or record.mtime_ns != st.st_mtime_ns):
+                record = UsageScanner._read_dir(directory, st)
+                if record is None:
+                    continue
+
+            records[directory] = record
+            total_bytes += record.own_bytes
+            total_files += record.own_files
+            stack.extend(record.subdirs)
+
+        return PathUsage(total_bytes, total_files), records
+
+    @staticmethod
+    def _read_dir(directory: str, st: os.stat_result) -> Optional[_DirRecord]:
+        """Stat the direct children of a directory"""
+        own_bytes = st.st_blocks * 512
+        own_files = 0
+        subdirs = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        else:
+                            own_bytes += entry.stat(follow_symlinks=False).st_blocks * 512
+                            own_files += 1
+                    except OSError:
+                        # Entry vanished between readdir and stat
+                        continue
+        except OSError:
+            return None
+
+        return _DirRecord(st.st_dev, st.st_ino, st.st_mtime_ns, own_bytes, own_files, subdirs)
@@ -0,0 +1,246 @@
+"""
+Usage watcher module for SSDsaver.
+Keeps running byte and file counts for each enabled app's cache paths from
+filesystem events instead of re-measuring them on a timer, so peaks are
+exact and nothing runs while the caches are idle.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+import fsnotify
+from usage_scanner import PathUsage
+
+
+@dataclass
+class _AppState:
+    """Running totals for one app"""
+    roots: List[str]
+    files: Dict[str, int] = field(default_factory=dict)  # path -> allocated bytes
+    bytes: int = 0
+    peak_bytes: int = 0
+    peak_files: int = 0
+    seeding: bool = True
+    pending: List[str] = field(default_factory=list)  # paths changed while seeding
+
+
+class UsageWatcher:
+    """Event-driven per-app usage counters.
+
+    Uses fanotify filesystem marks when running as root (not limited by
+    fs.inotify.max_user_watches) and recursive inotify watches otherwise.
+    The owner integrates `filenos()` into its main loop and calls
+    `process_events()` when they become readable.
+
+    Initial counts come from `snapshot()`, which only reads the filesystem
+    and may run on a worker thread; `seed_app()` installs the result and
+    replays any events that arrived meanwhile.
+    """
+
+    def __init__(self):
+        self._apps: Dict[str, _AppState] = {}
+        self._fanotify = None
+        self._inotify = None
+        self._unwatched: Set[str] = set()
+        self._reseed: Set[str] = set()
+
+        if fsnotify.FanotifyBackend.is_supported():
+            try:
+                self._fanotify = fsnotify.FanotifyBackend()
+            except OSError as e:
+                print(f"fanotify unavailable, using inotify: {e}")
+
+    def filenos(self) -> List[int]:
+        """File descriptors to poll for readability"""
+        return [b.fileno() for b in (self._fanotify, self._inotify) if b is not None]
+
+    def close(self):
+        for backend in (self._fanotify, self._inotify):
+            if backend is not None:
+                backend.close()
+        self._fanotify = None
+        self._inotify = None
+        self._apps.clear()
+
+    def watch_app(self, app_name: str, paths: List[str]) -> bool:
+        """Start watching an app's (already expanded) cache paths.
+
+        The app reports no usage until `seed_app()` is called with a
+        snapshot of the same paths. Returns False if any path could not be
+        watched; such apps should keep being measured by polling.
+        """
+        self.unwatch_app(app_name)
+        state = _AppState(roots=[p.rstrip("/") or "/" for p in paths])
+        self._apps[app_name] = state
+
+        ok = True
+        for root in state.roots:
+            if not self._add_tree(root):
+                ok = False
+        if not ok:
+            self._unwatched.add(app_name)
+        return ok
+
+    def get_roots(self, app_name: str) -> List[str]:
+        state = self._apps.get(app_name)
+        return list(state.roots) if state else []
+
+    @staticmethod
+    def snapshot(paths: List[str]) -> Dict[str, int]:
+        """Read allocated bytes of every file under paths (thread-safe)"""
+        state = _AppState(roots=list(paths))
+        for root in state.roots:
+            UsageWatcher._scan_into(state, root)
+        return state.files
+
+    def seed_app(self, app_name: str, files: Dict[str, int]):
+        """Install a snapshot and replay events seen since watching started"""
+        state = self._apps.get(app_name)
+        if state is None:
+            return
+        state.files = dict(files)
+        state.bytes = sum(files.values())
+        state.seeding = False
+        pending, state.pending = state.pending, []
+        for path in dict.fromkeys(pending):
+            self._scan_into(state, path)
+        self._update_peak(state)
+
+    def take_reseed_requests(self) -> Set[str]:
+        """Apps that lost events (queue overflow) and need a new snapshot"""
+        requests, self._reseed = self._reseed, set()
+        return requests
+
+    def unwatch_app(self, app_name: str):
+        """Stop tracking an app (kernel watches are kept until close())"""
+        self._apps.pop(app_name, None)
+        self._unwatched.discard(app_name)
+
+    def get_watched_apps(self) -> List[str]:
+        return list(self._apps)
+
+    def is_watching(self, app_name: str) -> bool:
+        """True once the app is watched and seeded, i.e. its counts are exact"""
+        state = self._apps.get(app_name)
+        return state is not None and not state.seeding and app_name not in self._unwatched
+
+    def get_usage(self, app_name: str) -> Optional[PathUsage]:
+        state = self._apps.get(app_name)
+        if state is None or state.seeding:
+            return None
+        return PathUsage(state.bytes, len(state.files))
+
+    def get_peak(self, app_name: str) -> Optional[PathUsage]:
+        state = self._apps.get(app_name)
+        if state is None or state.seeding:
+            return None
+        return PathUsage(state.peak_bytes, state.peak_files)
+
+    def process_events(self) -> Set[str]:
+        """Apply pending events. Returns the names of apps whose usage changed."""
+        events = []
+        for backend in (self._fanotify, self._inotify):
+            if backend is not None:
+                events.extend(backend.read_events())
+
+        changed = set()
+        for kind, path in events:
+            if kind == fsnotify.EVENT_OVERFLOW:
+                self._request_reseed_all()
+                continue
+
+            for app_name, state in self._apps.items():
+                if not self._owns(state, path):
+                    continue
+                if state.seeding:
+                    state.pending.append(path)
+                    continue
+                if kind == fsnotify.EVENT_REMOVED:
+                    self._remove(state, path)
+                else:
+                    self._scan_into(state, path)
+                self._update_peak(state)
+                changed.add(app_name)
+        return changed
+
+    def _add_tree(self, root: str) -> bool:
+        if self._fanotify is not None:
+            try:
+                self._fanotify.add_tree(root)
+                return True
+            except OSError:
+                pass  # e.g. filesystem without file handle support
+
+        try:
+            if self._inotify is None:
+                self._inotify = fsnotify.InotifyBackend()
+            self._inotify.add_tree(root)
+            return True
+        except OSError as e:
+            print(f"Cannot watch {root}: {e}")
+            return False
+
+    @staticmethod
+    def _owns(state: _AppState, path: str) -> bool:
+        return any(path == r or path.startswith(r + "/") for r in state.roots)
+
+    @staticmethod
+    def _update_peak(state: _AppState):
+        if state.bytes > state.peak_bytes:
+            state.peak_bytes = state.bytes
+        if len(state.files) > state.peak_files:
+            state.peak_files = len(state.files)
+
+    @staticmethod
+    def _set_file(state: _AppState, path: str, size: int):
+        state.bytes += size - state.files.get(path, 0)
+        state.files[path] = size
+
+    @staticmethod
+    def _remove(state: _AppState, path: str):
+        size = state.files.pop(path, None)
+        if size is not None:
+            state.bytes -= size
+            return
+        # A directory went away: drop everything below it
+        prefix = path + "/"
+        for p in [p for p in state.files if p.startswith(prefix)]:
+            state.bytes -= state.files.pop(p)
+
+    @staticmethod
+    def _scan_into(state: _AppState, path: str):
+        """Refresh one file, or every file below a directory"""
+        try:
+            st = os.lstat(path)
+        except OSError:
+            UsageWatcher._remove(state, path)
+            return
+
+        if not os.path.isdir(path) or os.path.islink(path):
+            UsageWatcher._set_file(state, path, st.st_blocks * 512)
+            return
+
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            else:
+                                size = entry.stat(follow_symlinks=False).st_blocks * 512
+                                UsageWatcher._set_file(state, entry.path, size)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def _request_reseed_all(self):
+        """The kernel dropped events: every app needs a fresh snapshot"""
+        for app_name, state in self._apps.items():
+            state.seeding = True
+            state.pending = []
+            self._reseed.add(app_name)
@@ -0,0 +1,314 @@
+"""
+Write discovery module for SSDsaver.
+Watches the home directory, /var/cache and /var/lib for a while, estimates
+how much is written below each directory and suggests the hottest ones
+as new RAM targets with a tmpfs size.
+"""
+
+import argparse
+import math
+import os
+import select
+import stat
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fsnotify
+from mount_table import MountTable
+from usage_scanner import UsageScanner
+
+DEFAULT_ROOTS = ["~", "/var/cache", "/var/lib"]
+
+
+@dataclass
+class DirectoryActivity:
+    """Estimated writes below one directory during discovery"""
+    path: str
+    bytes_written: int = 0
+    files_changed: int = 0
+    size_bytes: int = 0
+    hours: float = 0.0
+
+    @property
+    def bytes_per_hour(self) -> float:
+        return self.bytes_written / self.hours if self.hours > 0 else 0.0
+
+    @property
+    def turnover(self) -> float:
+        """How many times per hour the directory's size is written.
+        High turnover means a lot of SSD wear saved per MB of RAM."""
+        return self.bytes_per_hour / max(self.size_bytes, 1024 * 1024)
+
+    @property
+    def suggested_size(self) -> str:
+        """tmpfs size: 1.5x the current size, rounded up to 16M"""
+        size_mb = max(self.size_bytes * WriteDiscovery.SIZE_FACTOR / (1024 * 1024),
+                      WriteDiscovery.SIZE_STEP_MB)
+        step = WriteDiscovery.SIZE_STEP_MB
+        return f"{int(math.ceil(size_mb / step) * step)}M"
+
+
+class WriteDiscovery:
+    """Finds write-hot directories.
+
+    With root, a fanotify filesystem mark reports every changed file and
+    the file is measured right away (so short-lived cache files count
+    too). Otherwise the trees are walked every interval and files whose
+    mtime moved are counted.
+
+    Writes are estimated from file sizes: a file that grew counts its
+    growth, any other changed file counts its full size (i.e. it is
+    assumed to have been rewritten). Only per-directory totals, capped at
+    MAX_DEPTH below each root, and the last size of changed files are
+    kept. Walks stay on the root's filesystem, so existing tmpfs/zram
+    mounts are skipped, as are log2ram's hdd.* bind mounts.
+    """
+
+    MAX_DEPTH = 4
+    MIN_RATE = 1024 * 1024           # bytes per hour worth suggesting
+    MAX_SIZE = 1024 * 1024 * 1024    # larger directories are not RAM targets
+    MAX_TRACKED_FILES = 200000
+    SIZE_FACTOR = 1.5
+    SIZE_STEP_MB = 16
+
+    def __init__(self, roots: List[str] = None, use_fanotify: Optional[bool] = None):
+        mount_table = MountTable()
+        try:
+            self.roots = []
+            for root in roots or DEFAULT_ROOTS:
+                root = os.path.realpath(os.path.expanduser(root))
+                if os.path.isdir(root) and not mount_table.is_ram_mount(root):
+                    self.roots.append(root)
+        finally:
+            mount_table.close()
+        # Longest first so nested roots (e.g. a home under /var/lib) win
+        self.roots.sort(key=len, reverse=True)
+        self._devs = {root: os.stat(root).st_dev for root in self.roots}
+
+        self._dirs: Dict[str, List[int]] = {}        # directory -> [bytes, files]
+        self._files: Dict[Tuple[int, int], int] = {}  # (dev, ino) -> last seen size
+        self._started: Optional[float] = None
+        self._last_scan_ns = 0
+        self.lost_events = False
+
+        self._fanotify = None
+        if use_fanotify is None:
+            use_fanotify = fsnotify.FanotifyBackend.is_supported()
+        if use_fanotify:
+            try:
+                backend = fsnotify.FanotifyBackend()
+                for root in self.roots:
+                    backend.add_tree(root)
+                self._fanotify = backend
+            except OSError as e:
+                print(f"fanotify unavailable, sampling mtimes instead: {e}")
+
+    @property
+    def mode(self) -> str:
+        return "fanotify" if self._fanotify is not None else "mtime"
+
+    def close(self):
+        if self._fanotify is not None:
+            self._fanotify.close()
+            self._fanotify = None
+
+    def start(self, now: float = None):
+        self._started = now if now is not None else time.time()
+        self._last_scan_ns = time.time_ns()
+
+    def _root_of(self, path: str) -> Optional[str]:
+        for root in self.roots:
+            if path == root or path.startswith(root + "/"):
+                return root
+        return None
+
+    @staticmethod
+    def _excluded(relative: str) -> bool:
+        return any(part.startswith("hdd.") for part in relative.split("/"))
+
+    def _bucket(self, path: str) -> Optional[str]:
+        """Directory that a changed file is accounted to"""
+        root = self._root_of(path)
+        if root is None:
+            return None
+        relative = os.path.dirname(path)[len(root):].strip("/")
+        if self._excluded(relative):
+            return None
+        parts = relative.split("/")[:self.MAX_DEPTH] if relative else []
+        return os.path.join(root, *parts)
+
+    def _account(self, path: str, st: os.stat_result):
+        bucket = self._bucket(path)
+        if bucket is None:
+            return
+
+        key = (st.st_dev, st.st_ino)
+        previous = self._files.get(key)
+        if previous is not None and st.st_size > previous:
+            written = st.st_size - previous
+        else:
+            written = st.st_size
+        if len(self._files) >= self.MAX_TRACKED_FILES:
+            self._files.clear()
+        self._files[key] = st.st_size
+
+        totals = self._dirs.setdefault(bucket, [0, 0])
+        totals[0] += written
+        totals[1] += 1
+
+    def process_events(self):
+        """Measure files reported by fanotify (no-op in mtime mode)"""
+        if self._fanotify is None:
+            return
+        for kind, path in self._fanotify.read_events():
+            if kind == fsnotify.EVENT_OVERFLOW:
+                self.lost_events = True
+                continue
+            if kind != fsnotify.EVENT_CHANGED:
+                continue
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                self._account(path, st)
+
+    def tick(self):
+        """Walk the roots for files modified since the previous walk
+        (no-op in fanotify mode)"""
+        if self._fanotify is not None:
+            return
+        since_ns = self._last_scan_ns
+        self._last_scan_ns = time.time_ns()
+
+        for root in self.roots:
+            dev = self._devs[root]
+            stack = [root]
+            while stack:
+                directory = stack.pop()
+                try:
+                    with os.scandir(directory) as it:
+                        for entry in it:
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            if st.st_dev != dev:
+                                continue  # another filesystem, e.g. a tmpfs
+                            if entry.is_dir(follow_symlinks=False):
+                                if not entry.name.startswith("hdd."):
+                                    stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False) and st.st_mtime_ns > since_ns:
+                                self._account(entry.path, st)
+                except OSError:
+                    continue
+
+    def run(self, duration: float, interval: float = 60.0,
+            should_stop: Callable[[], bool] = None):
+        """Watch for `duration` seconds (blocking), or until should_stop()
+        returns True."""
+        self.start()
+        deadline = time.monotonic() + duration
+        next_tick = time.monotonic() + interval
+        while True:
+            now = time.monotonic()
+            if now >= deadline or (should_stop is not None and should_stop()):
+                break
+            timeout = max(0.0, min(deadline, next_tick) - now)
+            if self._fanotify is not None:
+                # Drain continuously so the kernel queue does not overflow
+                select.select([self._fanotify.fileno()], [], [], min(timeout, 1.0))
+                self.process_events()
+            else:
+                time.sleep(min(timeout, 1.0))
+            if time.monotonic() >= next_tick:
+                self.tick()
+                next_tick += interval
+        self.tick()
+        self.process_events()
+
+    def results(self, limit: int = 10, exclude: List[str] = None,
+                now: float = None) -> List[DirectoryActivity]:
+        """Directories ranked by turnover (writes per hour vs. size).
+
+        Writes are rolled up into every ancestor below the root; the best
+        non-overlapping directories are returned. Paths in `exclude`
+        (already in RAM) and anything above or below them are skipped.
+        """
+        if self._started is None:
+            return []
+        hours = max(((now if now is not None else time.time()) - self._started) / 3600, 1 / 60)
+
+        subtree: Dict[str, List[int]] = {}
+        for bucket, (nbytes, files) in self._dirs.items():
+            root = self._root_of(bucket)
+            path = bucket
+            while root is not None and path != root:
+                totals = subtree.setdefault(path, [0, 0])
+                totals[0] += nbytes
+                totals[1] += files
+                path = os.path.dirname(path)
+
+        exclude = [os.path.realpath(os.path.expanduser(p)).rstrip("/") for p in exclude or []]
+
+        def overlaps(a: str, b: str) -> bool:
+            return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+        candidates = [
+            DirectoryActivity(path, nbytes, files, 0, hours)
+            for path, (nbytes, files) in subtree.items()
+            if nbytes / hours >= self.MIN_RATE and not any(overlaps(path, e) for e in exclude)
+        ]
+        # Only measure the busiest directories
+        candidates.sort(key=lambda a: a.bytes_written, reverse=True)
+        candidates = candidates[:50]
+        sizes = UsageScanner().scan_many([a.path for a in candidates])
+        for activity in candidates:
+            usage = sizes.get(activity.path)
+            activity.size_bytes = usage.bytes if usage else 0
+        candidates = [a for a in candidates if a.size_bytes <= self.MAX_SIZE]
+        candidates.sort(key=lambda a: (a.turnover, a.bytes_per_hour), reverse=True)
+
+        chosen: List[DirectoryActivity] = []
+        for activity in candidates:
+            if not any(overlaps(activity.path, c.path) for c in chosen):
+                chosen.append(activity)
+                if len(chosen) >= limit:
+                    break
+        return chosen
+
+
+def main():
+    """Watch for a while and print suggested RAM targets"""
+    parser = argparse.ArgumentParser(description="Find write-hot directories")
+    parser.add_argument("--duration", type=float, default=600, help="seconds to watch")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between mtime walks")
+    parser.add_argument("--top", type=int, default=10, help="number of suggestions")
+    parser.add_argument("roots", nargs="*", help=f"directories to watch (default: {' '.join(DEFAULT_ROOTS)})")
+    args = parser.parse_args()
+
+    discovery = WriteDiscovery(args.roots or None)
+    print(f"Watching {', '.join(discovery.roots)} for {args.duration:.0f} s ({discovery.mode})...")
+    try:
+        discovery.run(args.duration, args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        discovery.close()
+
+    results = discovery.results(args.top)
+    if discovery.lost_events:
+        print("Warning: some events were lost; rates are underestimated")
+    print(f"{'directory':<60}{'MB/h':>9}{'size MB':>9}{'x/h':>7}{'files':>7}  suggested")
+    for a in results:
+        print(f"{a.path[-59:]:<60}{a.bytes_per_hour / 1024 ** 2:>9.1f}{a.size_bytes / 1024 ** 2:>9.1f}"
+              f"{a.turnover:>7.1f}{a.files_changed:>7}  {a.suggested_size}")
+    if not results:
+        print("No write-hot directories found")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())